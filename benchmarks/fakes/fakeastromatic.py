@@ -0,0 +1,720 @@
+"""
+Stand-ins for the AstrOmatic tools, used by the benchmarks to measure the
+overhead of the wrappers without the tools themselves.
+
+Each of the ``sex``, ``scamp`` and ``swarp`` scripts next to this file calls
+`main` with its tool name.  They print realistic ``-dd`` (and for ``sex``,
+``-dp``) dumps, understand ``-c <file>`` and ``-KEYWORD value`` overrides,
+and write synthetic outputs of a size controlled by these environment
+variables:
+
+``FAKEASTROMATIC_DELAY``
+    Seconds to sleep in each (non-dump) run.  Default 0.
+``FAKEASTROMATIC_NOBJ``
+    Number of rows in catalogs.  Default 100.
+``FAKEASTROMATIC_NPIX``
+    Side length in pixels of images (check images, coadds).  Default 64.
+``FAKEASTROMATIC_CHATTER``
+    Number of progress lines printed on stderr.  Default 10.
+
+Works with Python 2.7 and 3.x, and needs nothing but the standard library.
+"""
+from __future__ import division, print_function
+
+import os
+import sys
+import time
+import struct
+
+SEX_DUMP = """# Default configuration file for SExtractor 2.19.5
+# EB 2014-03-19
+#
+
+#-------------------------------- Catalog ------------------------------------
+
+CATALOG_NAME     test.cat       # name of the output catalog
+CATALOG_TYPE     ASCII_HEAD     # NONE,ASCII,ASCII_HEAD, ASCII_SKYCAT,
+                                # ASCII_VOTABLE, FITS_1.0 or FITS_LDAC
+PARAMETERS_NAME  default.param  # name of the file containing catalog contents
+
+#------------------------------- Extraction ----------------------------------
+
+DETECT_TYPE      CCD            # CCD (linear) or PHOTO (with gamma correction)
+DETECT_MINAREA   5              # min. # of pixels above threshold
+DETECT_MAXAREA   0              # max. # of pixels above threshold (0=unlimited)
+THRESH_TYPE      RELATIVE       # threshold type: RELATIVE (in sigmas)
+                                # or ABSOLUTE (in ADUs)
+DETECT_THRESH    1.5            # <sigmas> or <threshold>,<ZP> in mag.arcsec-2
+ANALYSIS_THRESH  1.5            # <sigmas> or <threshold>,<ZP> in mag.arcsec-2
+
+FILTER           Y              # apply filter for detection (Y or N)?
+FILTER_NAME      default.conv   # name of the file containing the filter
+FILTER_THRESH                   # Threshold[s] for retina filtering
+
+DEBLEND_NTHRESH  32             # Number of deblending sub-thresholds
+DEBLEND_MINCONT  0.005          # Minimum contrast parameter for deblending
+
+CLEAN            Y              # Clean spurious detections? (Y or N)?
+CLEAN_PARAM      1.0            # Cleaning efficiency
+
+MASK_TYPE        CORRECT        # type of detection MASKing: can be one of
+                                # NONE, BLANK or CORRECT
+
+#-------------------------------- WEIGHTing ----------------------------------
+
+WEIGHT_TYPE      NONE           # type of WEIGHTing: NONE, BACKGROUND,
+                                # MAP_RMS, MAP_VAR or MAP_WEIGHT
+RESCALE_WEIGHTS  Y              # Rescale input weights/variances (Y/N)?
+WEIGHT_IMAGE     weight.fits    # weight-map filename
+WEIGHT_GAIN      Y              # modulate gain (E/ADU) with weights? (Y/N)
+WEIGHT_THRESH                   # weight threshold[s] for bad pixels
+
+#-------------------------------- FLAGging -----------------------------------
+
+FLAG_IMAGE       flag.fits      # filename for an input FLAG-image
+FLAG_TYPE        OR             # flag pixel combination: OR, AND, MIN, MAX
+                                # or MOST
+
+#------------------------------ Photometry -----------------------------------
+
+PHOT_APERTURES   5              # MAG_APER aperture diameter(s) in pixels
+PHOT_AUTOPARAMS  2.5, 3.5       # MAG_AUTO parameters: <Kron_fact>,<min_radius>
+PHOT_PETROPARAMS 2.0, 3.5       # MAG_PETRO parameters: <Petrosian_fact>,
+                                # <min_radius>
+PHOT_AUTOAPERS   0.0,0.0        # <estimation>,<measurement> minimum apertures
+                                # for MAG_AUTO and MAG_PETRO
+PHOT_FLUXFRAC    0.5            # flux fraction[s] used for FLUX_RADIUS
+
+SATUR_LEVEL      50000.0        # level (in ADUs) at which arises saturation
+SATUR_KEY        SATURATE       # keyword for saturation level (in ADUs)
+
+MAG_ZEROPOINT    0.0            # magnitude zero-point
+MAG_GAMMA        4.0            # gamma of emulsion (for photographic scans)
+GAIN             0.0            # detector gain in e-/ADU
+GAIN_KEY         GAIN           # keyword for detector gain in e-/ADU
+PIXEL_SCALE      1.0            # size of pixel in arcsec (0=use FITS WCS info)
+
+#------------------------- Star/Galaxy Separation ----------------------------
+
+SEEING_FWHM      1.2            # stellar FWHM in arcsec
+STARNNW_NAME     default.nnw    # Neural-Network_Weight table filename
+
+#------------------------------ Background -----------------------------------
+
+BACK_TYPE        AUTO           # AUTO or MANUAL
+BACK_VALUE       0.0            # Default background value in MANUAL mode
+BACK_SIZE        64             # Background mesh: <size> or <width>,<height>
+BACK_FILTERSIZE  3              # Background filter: <size> or <width>,<height>
+BACK_FILTTHRESH  0.0            # Threshold above which the background-
+                                # map filter operates
+
+#------------------------------ Check Image ----------------------------------
+
+CHECKIMAGE_TYPE  NONE           # can be NONE, BACKGROUND, BACKGROUND_RMS,
+                                # MINIBACKGROUND, MINIBACK_RMS, -BACKGROUND,
+                                # FILTERED, OBJECTS, -OBJECTS, SEGMENTATION,
+                                # or APERTURES
+CHECKIMAGE_NAME  check.fits     # Filename for the check-image
+
+#--------------------- Memory (change with caution!) -------------------------
+
+MEMORY_OBJSTACK  3000           # number of objects in stack
+MEMORY_PIXSTACK  300000         # number of pixels in stack
+MEMORY_BUFSIZE   1024           # number of lines in buffer
+
+#------------------------------- ASSOCiation ---------------------------------
+
+ASSOC_NAME       sky.list       # name of the ASCII file to ASSOCiate
+ASSOC_DATA       2,3,4          # columns of the data to replicate (0=all)
+ASSOC_PARAMS     2,3,4          # columns of xpos,ypos[,mag]
+ASSOCCOORD_TYPE  PIXEL          # ASSOC coordinates: PIXEL or WORLD
+ASSOC_RADIUS     2.0            # cross-matching radius (pixels)
+ASSOC_TYPE       NEAREST        # ASSOCiation method: FIRST, NEAREST, MEAN,
+                                # MAG_MEAN, SUM, MAG_SUM, MIN or MAX
+ASSOCSELEC_TYPE  MATCHED        # ASSOC selection type: ALL, MATCHED or -MATCHED
+
+#----------------------------- Miscellaneous ---------------------------------
+
+VERBOSE_TYPE     NORMAL         # can be QUIET, NORMAL or FULL
+HEADER_SUFFIX    .head          # Filename extension for additional headers
+WRITE_XML        N              # Write XML file (Y/N)?
+XML_NAME         sex.xml        # Filename for XML output
+XSL_URL          file:///usr/share/sextractor/sextractor.xsl
+                                # Filename for XSL style-sheet
+NTHREADS         1              # 1 single thread
+
+FITS_UNSIGNED    N              # Treat FITS integer values as unsigned (Y/N)?
+INTERP_MAXXLAG   16             # Max. lag along X for 0-weight interpolation
+INTERP_MAXYLAG   16             # Max. lag along Y for 0-weight interpolation
+INTERP_TYPE      ALL            # Interpolation type: NONE, VAR_ONLY or ALL
+
+#--------------------------- Experimental Stuff -----------------------------
+
+PSF_NAME         default.psf    # File containing the PSF model
+PSF_NMAX         1              # Max.number of PSFs fitted simultaneously
+PATTERN_TYPE     RINGS-HARMONIC # can RINGS-QUADPOLE, RINGS-OCTOPOLE,
+                                # RINGS-HARMONICS or GAUSS-LAGUERRE
+SOM_NAME         default.som    # File containing Self-Organizing Map weights
+"""
+
+SEX_PARAMS = [
+    ('NUMBER', 'Running object number', ''),
+    ('EXT_NUMBER', 'FITS extension number', ''),
+    ('FLUX_ISO', 'Isophotal flux', 'count'),
+    ('FLUXERR_ISO', 'RMS error for isophotal flux', 'count'),
+    ('MAG_ISO', 'Isophotal magnitude', 'mag'),
+    ('MAGERR_ISO', 'RMS error for isophotal magnitude', 'mag'),
+    ('FLUX_ISOCOR', 'Corrected isophotal flux', 'count'),
+    ('FLUXERR_ISOCOR', 'RMS error for corrected isophotal flux', 'count'),
+    ('FLUX_APER', 'Flux vector within fixed circular aperture(s)', 'count'),
+    ('FLUXERR_APER', 'RMS error vector for aperture flux(es)', 'count'),
+    ('MAG_APER', 'Fixed aperture magnitude vector', 'mag'),
+    ('MAGERR_APER', 'RMS error vector for fixed aperture mag.', 'mag'),
+    ('FLUX_AUTO', 'Flux within a Kron-like elliptical aperture', 'count'),
+    ('FLUXERR_AUTO', 'RMS error for AUTO flux', 'count'),
+    ('MAG_AUTO', 'Kron-like elliptical aperture magnitude', 'mag'),
+    ('MAGERR_AUTO', 'RMS error for AUTO magnitude', 'mag'),
+    ('FLUX_PETRO', 'Flux within a Petrosian-like elliptical aperture', 'count'),
+    ('FLUXERR_PETRO', 'RMS error for PETROsian flux', 'count'),
+    ('MAG_PETRO', 'Petrosian-like elliptical aperture magnitude', 'mag'),
+    ('MAGERR_PETRO', 'RMS error for PETROsian magnitude', 'mag'),
+    ('FLUX_BEST', 'Best of FLUX_AUTO and FLUX_ISOCOR', 'count'),
+    ('FLUXERR_BEST', 'RMS error for BEST flux', 'count'),
+    ('MAG_BEST', 'Best of MAG_AUTO and MAG_ISOCOR', 'mag'),
+    ('MAGERR_BEST', 'RMS error for MAG_BEST', 'mag'),
+    ('KRON_RADIUS', 'Kron apertures in units of A or B', ''),
+    ('PETRO_RADIUS', 'Petrosian apertures in units of A or B', ''),
+    ('BACKGROUND', 'Background at centroid position', 'count'),
+    ('THRESHOLD', 'Detection threshold above background', 'count'),
+    ('FLUX_MAX', 'Peak flux above background', 'count'),
+    ('ISOAREA_IMAGE', 'Isophotal area above Analysis threshold', 'pixel**2'),
+    ('XMIN_IMAGE', 'Minimum x-coordinate among detected pixels', 'pixel'),
+    ('YMIN_IMAGE', 'Minimum y-coordinate among detected pixels', 'pixel'),
+    ('XMAX_IMAGE', 'Maximum x-coordinate among detected pixels', 'pixel'),
+    ('YMAX_IMAGE', 'Maximum y-coordinate among detected pixels', 'pixel'),
+    ('XPEAK_IMAGE', 'x-coordinate of the brightest pixel', 'pixel'),
+    ('YPEAK_IMAGE', 'y-coordinate of the brightest pixel', 'pixel'),
+    ('X_IMAGE', 'Object position along x', 'pixel'),
+    ('Y_IMAGE', 'Object position along y', 'pixel'),
+    ('X_WORLD', 'Barycenter position along world x axis', 'deg'),
+    ('Y_WORLD', 'Barycenter position along world y axis', 'deg'),
+    ('ALPHA_J2000', 'Right ascension of barycenter (J2000)', 'deg'),
+    ('DELTA_J2000', 'Declination of barycenter (J2000)', 'deg'),
+    ('X2_IMAGE', 'Variance along x', 'pixel**2'),
+    ('Y2_IMAGE', 'Variance along y', 'pixel**2'),
+    ('XY_IMAGE', 'Covariance between x and y', 'pixel**2'),
+    ('ERRX2_IMAGE', 'Variance of position along x', 'pixel**2'),
+    ('ERRY2_IMAGE', 'Variance of position along y', 'pixel**2'),
+    ('ERRXY_IMAGE', 'Covariance of position between x and y', 'pixel**2'),
+    ('CXX_IMAGE', 'Cxx object ellipse parameter', 'pixel**(-2)'),
+    ('CYY_IMAGE', 'Cyy object ellipse parameter', 'pixel**(-2)'),
+    ('CXY_IMAGE', 'Cxy object ellipse parameter', 'pixel**(-2)'),
+    ('A_IMAGE', 'Profile RMS along major axis', 'pixel'),
+    ('B_IMAGE', 'Profile RMS along minor axis', 'pixel'),
+    ('THETA_IMAGE', 'Position angle (CCW/x)', 'deg'),
+    ('ERRA_IMAGE', 'RMS position error along major axis', 'pixel'),
+    ('ERRB_IMAGE', 'RMS position error along minor axis', 'pixel'),
+    ('ERRTHETA_IMAGE', 'Error ellipse position angle (CCW/x)', 'deg'),
+    ('XWIN_IMAGE', 'Windowed position estimate along x', 'pixel'),
+    ('YWIN_IMAGE', 'Windowed position estimate along y', 'pixel'),
+    ('ERRAWIN_IMAGE', 'RMS windowed pos error along major axis', 'pixel'),
+    ('ERRBWIN_IMAGE', 'RMS windowed pos error along minor axis', 'pixel'),
+    ('ERRTHETAWIN_IMAGE', 'Windowed error ellipse pos angle (CCW/x)', 'deg'),
+    ('FWHM_IMAGE', 'FWHM assuming a gaussian core', 'pixel'),
+    ('FLUX_RADIUS', 'Fraction-of-light radii', 'pixel'),
+    ('ELONGATION', 'A_IMAGE/B_IMAGE', ''),
+    ('ELLIPTICITY', '1 - B_IMAGE/A_IMAGE', ''),
+    ('FLAGS', 'Extraction flags', ''),
+    ('FLAGS_WEIGHT', 'Weighted extraction flags', ''),
+    ('IMAFLAGS_ISO', 'FLAG-image flags OR\'ed over the iso. profile', ''),
+    ('CLASS_STAR', 'S/G classifier output', ''),
+]
+
+SCAMP_DUMP = """# Default configuration file for SCAMP 2.0.4
+# EB 2014-03-20
+#
+
+#----------------------------- Field grouping ---------------------------------
+
+FGROUP_RADIUS          1.0             # Max dist (deg) between field groups
+
+#---------------------------- Reference catalogs ------------------------------
+
+REF_SERVER         cocat1.u-strasbg.fr # Internet addresses of catalog servers
+REF_PORT               80              # Ports to connect to catalog servers
+CDSCLIENT_EXEC         aclient         # CDSclient executable
+ASTREF_CATALOG         2MASS           # NONE, FILE, USNO-A1,USNO-A2,USNO-B1,
+                                       # GSC-1.3,GSC-2.2,GSC-2.3,
+                                       # TYCHO-2, UCAC-1,UCAC-2,UCAC-3,UCAC-4,
+                                       # NOMAD-1, PPMX, CMC-14, 2MASS, DENIS-3,
+                                       # SDSS-R3,SDSS-R5,SDSS-R6,SDSS-R7,
+                                       # SDSS-R8, SDSS-R9
+ASTREF_BAND            DEFAULT         # Photom. band for astr.ref.magnitudes
+                                       # or DEFAULT, BLUEST, or REDDEST
+ASTREFCAT_NAME         astrefcat.cat   # Local astrometric reference catalogs
+ASTREFCENT_KEYS        X_WORLD,Y_WORLD # Local ref.cat. centroid parameters
+ASTREFERR_KEYS         ERRA_WORLD, ERRB_WORLD, ERRTHETA_WORLD
+                                       # Local ref.cat. err. ellipse params
+ASTREFMAG_KEY          MAG             # Local ref.cat. magnitude parameter
+ASTREFMAGERR_KEY       MAGERR          # Local ref.cat. mag. error parameter
+ASTREFOBSDATE_KEY      OBSDATE         # Local ref.cat. obs. date parameter
+ASTREFMAG_LIMITS       -99.0,99.0      # Select magnitude range in ASTREF_BAND
+SAVE_REFCATALOG        N               # Save ref catalogs in FITS-LDAC format?
+REFOUT_CATPATH         .               # Save path for reference catalogs
+
+#--------------------------- Merged output catalogs ---------------------------
+
+MERGEDOUTCAT_TYPE      NONE            # NONE, ASCII_HEAD, ASCII, FITS_LDAC
+MERGEDOUTCAT_NAME      merged.cat      # Merged output catalog filename
+
+#--------------------------- Full output catalogs ---------------------------
+
+FULLOUTCAT_TYPE        NONE            # NONE, ASCII_HEAD, ASCII, FITS_LDAC
+FULLOUTCAT_NAME        full.cat        # Full output catalog filename
+
+#----------------------------- Pattern matching -------------------------------
+
+MATCH                  Y               # Do pattern-matching (Y/N) ?
+MATCH_NMAX             0               # Max.number of detections for MATCHing
+                                       # (0=auto)
+PIXSCALE_MAXERR        1.2             # Max scale-factor uncertainty
+POSANGLE_MAXERR        5.0             # Max position-angle uncertainty (deg)
+POSITION_MAXERR        1.0             # Max positional uncertainty (arcmin)
+MATCH_RESOL            0               # Matching resolution (arcsec); 0=auto
+MATCH_FLIPPED          N               # Allow matching with flipped axes?
+MOSAIC_TYPE            UNCHANGED       # UNCHANGED, SAME_CRVAL, SHARE_PROJAXIS,
+                                       # FIX_FOCALPLANE or LOOSE
+FIXFOCALPLANE_NMIN     1               # Min number of dets for FIX_FOCALPLANE
+
+#---------------------------- Cross-identification ----------------------------
+
+CROSSID_RADIUS         2.0             # Cross-id initial radius (arcsec)
+
+#---------------------------- Astrometric solution ----------------------------
+
+SOLVE_ASTROM           Y               # Compute astrometric solution (Y/N) ?
+PROJECTION_TYPE        SAME            # SAME, TPV or TAN
+ASTRINSTRU_KEY         FILTER,QRUNID   # FITS keyword(s) defining the astrom
+STABILITY_TYPE         INSTRUMENT      # EXPOSURE, PRE-DISTORTED or INSTRUMENT
+CENTROID_KEYS          XWIN_IMAGE,YWIN_IMAGE # Cat. parameters for centroiding
+CENTROIDERR_KEYS       ERRAWIN_IMAGE,ERRBWIN_IMAGE,ERRTHETAWIN_IMAGE
+                                       # Cat. params for centroid err ellipse
+DISTORT_KEYS           XWIN_IMAGE,YWIN_IMAGE # Cat. parameters or FITS keywords
+DISTORT_GROUPS         1,1             # Polynom group for each context key
+DISTORT_DEGREES        3               # Polynom degree for each group
+FOCDISTORT_DEGREE      1               # Polynom degree for focal plane coords
+ASTREF_WEIGHT          1.0             # Relative weight of ref.astrom.cat.
+ASTRACCURACY_TYPE      SIGMA-PIXEL     # SIGMA-PIXEL, SIGMA-ARCSEC,
+                                       # or TURBULENCE-ARCSEC
+ASTRACCURACY_KEY       ASTRACCU        # FITS keyword for ASTR_ACCURACY param.
+ASTR_ACCURACY          0.01            # Astrom. uncertainty floor parameter
+ASTRCLIP_NSIGMA        3.0             # Astrom. clipping threshold in sigmas
+COMPUTE_PARALLAXES     N               # Compute trigonom. parallaxes (Y/N)?
+COMPUTE_PROPERMOTIONS  N               # Compute proper motions (Y/N)?
+CORRECT_COLOURSHIFTS   N               # Correct for colour shifts (Y/N)?
+INCLUDE_ASTREFCATALOG  Y               # Include ref.cat in prop.motions (Y/N)?
+ASTR_FLAGSMASK         0x00fc          # Astrometry rejection mask on SEx FLAGS
+ASTR_IMAFLAGSMASK      0x0             # Astrometry rejection mask on IMAFLAGS
+
+#---------------------------- Photometric solution ----------------------------
+
+SOLVE_PHOTOM           Y               # Compute photometric solution (Y/N) ?
+MAGZERO_OUT            0.0             # Magnitude zero-point(s) in output
+MAGZERO_INTERR         0.01            # Internal mag.zero-point accuracy
+MAGZERO_REFERR         0.03            # Photom.field mag.zero-point accuracy
+PHOTINSTRU_KEY         FILTER          # FITS keyword(s) defining the photom.
+MAGZERO_KEY            PHOT_C          # FITS keyword for the mag zero-point
+EXPOTIME_KEY           EXPTIME         # FITS keyword for the exposure time (s)
+AIRMASS_KEY            AIRMASS         # FITS keyword for the airmass
+EXTINCT_KEY            PHOT_K          # FITS keyword for the extinction coeff
+PHOTOMFLAG_KEY         PHOTFLAG        # FITS keyword for the photometry flag
+PHOTFLUX_KEY           FLUX_AUTO       # Catalog param. for the flux measurement
+PHOTFLUXERR_KEY        FLUXERR_AUTO    # Catalog parameter for the flux error
+PHOTCLIP_NSIGMA        3.0             # Photom.clipping threshold in sigmas
+PHOT_ACCURACY          1e-3            # Photometric uncertainty floor (frac.)
+PHOT_FLAGSMASK         0x00fc          # Photometry rejection mask on SEx FLAGS
+PHOT_IMAFLAGSMASK      0x0             # Photometry rejection mask on IMAFLAGS
+
+#------------------------------- Check-plots ----------------------------------
+
+CHECKPLOT_CKEY         SCAMPCOL        # FITS keyword for PLPLOT field colour
+CHECKPLOT_DEV          PNG             # NULL, XWIN, TK, PS, PSC, XFIG, PNG,
+                                       # JPEG, AQT, PDF or SVG
+CHECKPLOT_RES          0               # Check-plot resolution (0 = default)
+CHECKPLOT_ANTIALIAS    Y               # Anti-aliasing using convert (Y/N) ?
+CHECKPLOT_TYPE         FGROUPS,DISTORTION,ASTR_INTERROR2D,ASTR_INTERROR1D,ASTR_REFERROR2D,ASTR_REFERROR1D,ASTR_CHI2,PHOT_ERROR
+CHECKPLOT_NAME         fgroups,distort,astr_interror2d,astr_interror1d,astr_referror2d,astr_referror1d,astr_chi2,psphot_error # Check-plot filename(s)
+
+#------------------------------ Miscellaneous ---------------------------------
+
+SN_THRESHOLDS          10.0,100.0      # S/N thresholds (in sigmas) for all and
+                                       # high-SN sample
+FWHM_THRESHOLDS        0.0,100.0       # FWHM thresholds (in pixels) for sources
+ELLIPTICITY_MAX        0.5             # Max. source ellipticity
+FLAGS_MASK             0x00f0          # Global rejection mask on SEx FLAGS
+WEIGHTFLAGS_MASK       0x00ff          # Global rejec. mask on SEx FLAGS_WEIGHT
+IMAFLAGS_MASK          0x0             # Global rejec. mask on SEx IMAFLAGS_ISO
+AHEADER_GLOBAL         scamp.ahead     # Filename of the global input header
+AHEADER_NAME                           # List of input header filenames
+AHEADER_SUFFIX         .ahead          # Filename extension for additional
+                                       # input headers
+HEADER_NAME                            # List of output header filenames
+HEADER_SUFFIX          .head           # Filename extension for output headers
+HEADER_TYPE            NORMAL          # NORMAL or FOCAL_PLANE
+VERBOSE_TYPE           NORMAL          # QUIET, NORMAL, LOG or FULL
+WRITE_XML              Y               # Write XML file (Y/N)?
+XML_NAME               scamp.xml       # Filename for XML output
+XSL_URL                file:///usr/share/scamp/scamp.xsl
+                                       # Filename for XSL style-sheet
+NTHREADS               1               # Number of simultaneous threads for
+                                       # the SMP version of SCAMP
+                                       # 0 = automatic
+"""
+
+SWARP_DUMP = """# Default configuration file for SWarp 2.38.0
+# EB 2014-03-20
+#
+#----------------------------------- Output -----------------------------------
+IMAGEOUT_NAME          coadd.fits      # Output filename
+WEIGHTOUT_NAME       coadd.weight.fits # Output weight-map filename
+
+HEADER_NAME                            # Filename of output header
+HEADER_ONLY            N               # Only a header as an output file (Y/N)?
+HEADER_SUFFIX          .head           # Filename extension for additional headers
+
+#------------------------------- Input Weights --------------------------------
+
+WEIGHT_TYPE            NONE            # BACKGROUND,MAP_RMS,MAP_VARIANCE
+                                       # or MAP_WEIGHT
+RESCALE_WEIGHTS        Y               # Rescale input weights/variances (Y/N)?
+WEIGHT_SUFFIX          .weight.fits    # Suffix to use for weight-maps
+WEIGHT_IMAGE                           # Weightmap filename if suffix not used
+                                       # (all or for each weight-map)
+WEIGHT_THRESH                          # Bad pixel weight-threshold
+
+#------------------------------- Co-addition ----------------------------------
+
+COMBINE                Y               # Combine resampled images (Y/N)?
+COMBINE_TYPE           MEDIAN          # MEDIAN,AVERAGE,MIN,MAX,WEIGHTED,CLIPPED
+                                       # CHI-OLD,CHI-MODE,CHI-MEAN,SUM,
+                                       # WEIGHTED_WEIGHT,MEDIAN_WEIGHT,
+                                       # AND,NAND,OR or NOR
+CLIP_AMPFRAC           0.3             # Fraction of flux variation allowed
+                                       # with clipping
+CLIP_SIGMA             4.0             # Maximum n-sigma variation allowed
+                                       # with clipping
+CLIP_WRITELOG          N               # Write output file with coordinates of
+                                       # clipped pixels (Y/N)
+CLIP_LOGNAME           clipped.log     # Name of output file with coordinates
+                                       # of clipped pixels
+BLANK_BADPIXELS        N               # Set to 0 pixels having a weight of 0
+
+#-------------------------------- Astrometry ----------------------------------
+
+CELESTIAL_TYPE         NATIVE          # NATIVE, PIXEL, EQUATORIAL,
+                                       # GALACTIC,ECLIPTIC, or SUPERGALACTIC
+PROJECTION_TYPE        TAN             # Any WCS projection code or NONE
+PROJECTION_ERR         0.001           # Maximum projection error (in output
+                                       # pixels), or 0 for no approximation
+CENTER_TYPE            ALL             # MANUAL, ALL or MOST
+CENTER         00:00:00.0, +00:00:00.0 # Coordinates of the image center
+PIXELSCALE_TYPE        MEDIAN          # MANUAL,FIT,MIN,MAX or MEDIAN
+PIXEL_SCALE            0.0             # Pixel scale
+IMAGE_SIZE             0               # Image size (0 = AUTOMATIC)
+
+#-------------------------------- Resampling ----------------------------------
+
+RESAMPLE               Y               # Resample input images (Y/N)?
+RESAMPLE_DIR           .               # Directory path for resampled images
+RESAMPLE_SUFFIX        .resamp.fits    # filename extension for resampled images
+
+RESAMPLING_TYPE        LANCZOS3        # NEAREST,BILINEAR,LANCZOS2,LANCZOS3
+                                       # LANCZOS4 (1 per axis) or FLAGS
+OVERSAMPLING           0               # Oversampling in each dimension
+                                       # (0 = automatic)
+INTERPOLATE            N               # Interpolate bad input pixels (Y/N)?
+                                       # (all or for each image)
+
+FSCALASTRO_TYPE        FIXED           # NONE,FIXED, or VARIABLE
+FSCALE_KEYWORD         FLXSCALE        # FITS keyword for the multiplicative
+                                       # factor applied to each input image
+FSCALE_DEFAULT         1.0             # Default FSCALE value if not in header
+
+GAIN_KEYWORD           GAIN            # FITS keyword for effect. gain (e-/ADU)
+GAIN_DEFAULT           0.0             # Default gain if no FITS keyword found
+
+#--------------------------- Background subtraction ---------------------------
+
+SUBTRACT_BACK          Y               # Subtraction sky background (Y/N)?
+                                       # (all or for each image)
+
+BACK_TYPE              AUTO            # AUTO or MANUAL
+                                       # (all or for each image)
+BACK_DEFAULT           0.0             # Default background value in MANUAL
+                                       # (all or for each image)
+BACK_SIZE              128             # Background mesh size (pixels)
+                                       # (all or for each image)
+BACK_FILTERSIZE        3               # Background map filter range (meshes)
+                                       # (all or for each image)
+
+#------------------------------ Memory management -----------------------------
+
+VMEM_DIR               .               # Directory path for swap files
+VMEM_MAX               2047            # Maximum amount of virtual memory (MB)
+MEM_MAX                256             # Maximum amount of usable RAM (MB)
+COMBINE_BUFSIZE        256             # RAM dedicated to co-addition(MB)
+
+#------------------------------ Miscellaneous ---------------------------------
+
+DELETE_TMPFILES        Y               # Delete temporary resampled FITS files
+                                       # (Y/N)?
+COPY_KEYWORDS          OBJECT          # List of FITS keywords to propagate
+                                       # from the input to the output headers
+WRITE_FILEINFO         N               # Write information about each input
+                                       # file in the output image header?
+WRITE_XML              Y               # Write XML file (Y/N)?
+XML_NAME               swarp.xml       # Filename for XML output
+VERBOSE_TYPE           NORMAL          # QUIET,LOG,NORMAL, or FULL
+
+NTHREADS               0               # Number of simultaneous threads for
+                                       # the SMP version of SWarp
+                                       # 0 = automatic
+"""
+
+DUMPS = {'sex': SEX_DUMP, 'scamp': SCAMP_DUMP, 'swarp': SWARP_DUMP}
+
+# the extension scamp gives check plots for each CHECKPLOT_DEV
+CHECKPLOT_EXTS = {'PS': '.ps', 'PSC': '.ps', 'PSTEX': '.ps', 'XFIG': '.fig',
+                  'PNG': '.png', 'JPEG': '.jpg', 'PLMETA': '.plm'}
+
+
+def _env_number(name, default, type_=int):
+    return type_(os.environ.get('FAKEASTROMATIC_' + name, default))
+
+
+def parse_arguments(args, dump):
+    """
+    Returns (positional arguments, configuration dict) the way the real tools
+    do it: the defaults, then the ``-c`` file, then ``-KEYWORD value``
+    overrides.
+    """
+    cfg = _parse_config(dump)
+    positional = []
+    overrides = {}
+    i = 0
+    while i < len(args):
+        if args[i].startswith('-') and i + 1 < len(args):
+            overrides[args[i][1:]] = args[i + 1]
+            i += 2
+        else:
+            positional.append(args[i])
+            i += 1
+
+    if 'c' in overrides:
+        with open(overrides.pop('c')) as f:
+            cfg.update(_parse_config(f.read()))
+    cfg.update(overrides)
+
+    # "@file" means "the names in this file"
+    expanded = []
+    for arg in positional:
+        if arg.startswith('@'):
+            with open(arg[1:]) as f:
+                expanded.extend(f.read().split())
+        else:
+            expanded.append(arg)
+    return expanded, cfg
+
+
+def _parse_config(contents):
+    cfg = {}
+    for line in contents.split('\n'):
+        line = line.split('#')[0].strip()
+        if line:
+            key, _, value = line.partition(' ')
+            cfg[key] = value.strip()
+    return cfg
+
+
+def chatter(toolname):
+    for i in range(_env_number('CHATTER', 10)):
+        sys.stderr.write('\x1b[1M> {0}: line {1} of progress report\n'.format(toolname, i + 1))
+
+
+def write_fits_image(fn, npix, extra_cards=()):
+    cards = [('SIMPLE', True), ('BITPIX', -32), ('NAXIS', 2), ('NAXIS1', npix),
+             ('NAXIS2', npix)] + list(extra_cards)
+    with open(fn, 'wb') as f:
+        f.write(_fits_header(cards))
+        f.write(_padded(struct.pack('>f', 1.0) * (npix * npix), b'\0'))
+
+
+def write_ldac(fn, params, nobj):
+    """
+    Writes a FITS_LDAC catalog: an empty primary HDU, the LDAC_IMHEAD table
+    and the LDAC_OBJECTS table with a double column per parameter.
+    """
+    imhead = _cards([('SIMPLE', True), ('BITPIX', 8), ('NAXIS', 0)])
+    with open(fn, 'wb') as f:
+        f.write(_fits_header([('SIMPLE', True), ('BITPIX', 8), ('NAXIS', 0),
+                              ('EXTEND', True)]))
+        f.write(_bintable('LDAC_IMHEAD', [('Field Header Card', '{0}A'.format(len(imhead)))],
+                          1, imhead))
+        rows = b''.join([struct.pack('>' + 'd' * len(params), *([float(i + 1)] * len(params)))
+                         for i in range(nobj)])
+        f.write(_bintable('LDAC_OBJECTS', [(p, 'D') for p in params], nobj, rows))
+
+
+def _bintable(extname, columns, nrows, data):
+    rowlen = len(data) // nrows if nrows else 0
+    cards = [('XTENSION', 'BINTABLE'), ('BITPIX', 8), ('NAXIS', 2),
+             ('NAXIS1', rowlen), ('NAXIS2', nrows), ('PCOUNT', 0), ('GCOUNT', 1),
+             ('TFIELDS', len(columns))]
+    for i, (name, form) in enumerate(columns):
+        cards.append(('TTYPE{0}'.format(i + 1), name))
+        cards.append(('TFORM{0}'.format(i + 1), form))
+    cards.append(('EXTNAME', extname))
+    return _fits_header(cards) + _padded(data, b'\0')
+
+
+def _cards(cards):
+    out = []
+    for key, value in cards:
+        if value is True or value is False:
+            out.append('{0:8}= {1:>20}'.format(key, 'T' if value else 'F'))
+        elif isinstance(value, str):
+            out.append("{0:8}= '{1:8}'".format(key, value))
+        else:
+            out.append('{0:8}= {1:>20}'.format(key, value))
+    out.append('END')
+    return ''.join([card.ljust(80) for card in out]).encode('ascii')
+
+
+def _fits_header(cards):
+    return _padded(_cards(cards), b' ')
+
+
+def _padded(data, fill):
+    return data + fill * (-len(data) % 2880)
+
+
+def run_sex(args):
+    if '-dp' in args:
+        for name, desc, unit in SEX_PARAMS:
+            line = '#{0:23}{1:58}'.format(name, desc)
+            sys.stdout.write((line + (' [{0}]'.format(unit) if unit else '')).rstrip() + '\n')
+        return 0
+
+    images, cfg = parse_arguments(args, SEX_DUMP)
+    for imgfn in images:
+        if not os.path.exists(imgfn):
+            sys.stderr.write('> \n*ERROR*: {0} not found\n'.format(imgfn))
+            return 1
+    with open(cfg['PARAMETERS_NAME']) as f:
+        params = [p for p in f.read().split() if not p.startswith('#')]
+    with open(cfg['FILTER_NAME']) as f:
+        f.read()
+
+    time.sleep(_env_number('DELAY', 0, float))
+    chatter('sex')
+
+    nobj = _env_number('NOBJ', 100)
+    cattype = cfg['CATALOG_TYPE'].upper()
+    if cattype.startswith('FITS'):
+        write_ldac(cfg['CATALOG_NAME'], params, nobj)
+    elif cattype != 'NONE':
+        descs = dict([(name, (desc, unit)) for name, desc, unit in SEX_PARAMS])
+        with open(cfg['CATALOG_NAME'], 'w') as f:
+            if cattype == 'ASCII_HEAD':
+                for i, p in enumerate(params):
+                    desc, unit = descs.get(p, ('', ''))
+                    f.write('#{0:4d} {1:22} {2:58}{3}\n'.format(
+                        i + 1, p, desc, ' [{0}]'.format(unit) if unit else ''))
+            for i in range(nobj):
+                f.write(' '.join(['{0:12.4f}'.format(i + 1 + j / 100)
+                                  for j in range(len(params))]) + '\n')
+
+    if cfg['WRITE_XML'] == 'Y':
+        with open(cfg['XML_NAME'], 'w') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n<VOTABLE>'
+                    '<RESOURCE ID="SExtractor"/></VOTABLE>\n')
+
+    if cfg['CHECKIMAGE_TYPE'].upper() != 'NONE':
+        for fn in cfg['CHECKIMAGE_NAME'].split(','):
+            write_fits_image(fn.strip(), _env_number('NPIX', 64))
+
+    sys.stderr.write('> All done (in 0.0 s: {0} lines/s , {1} detections/s)\n'.format(nobj, nobj))
+    return 0
+
+
+def run_scamp(args):
+    catalogs, cfg = parse_arguments(args, SCAMP_DUMP)
+    for catfn in catalogs:
+        if not os.path.exists(catfn):
+            sys.stderr.write('> \n*ERROR*: {0} not found\n'.format(catfn))
+            return 1
+
+    time.sleep(_env_number('DELAY', 0, float))
+    chatter('scamp')
+
+    for catfn in catalogs:
+        headfn = os.path.splitext(catfn)[0] + cfg['HEADER_SUFFIX']
+        with open(headfn, 'w') as f:
+            for key, value in [('EQUINOX', 2000.0), ('RADESYS', "'ICRS    '"),
+                               ('CTYPE1', "'RA---TPV'"), ('CTYPE2', "'DEC--TPV'"),
+                               ('CRVAL1', 150.0), ('CRVAL2', 2.0), ('CRPIX1', 1024.0),
+                               ('CRPIX2', 1024.0), ('CD1_1', -7.3e-5), ('CD1_2', 0.0),
+                               ('CD2_1', 0.0), ('CD2_2', 7.3e-5), ('FLXSCALE', 1.0),
+                               ('MAGZEROP', 0.0)]:
+                f.write('{0:8}= {1:>20}\n'.format(key, value))
+            f.write('END\n')
+
+    if cfg['WRITE_XML'] == 'Y':
+        with open(cfg['XML_NAME'], 'w') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n<VOTABLE>'
+                    '<RESOURCE ID="SCAMP"/></VOTABLE>\n')
+
+    ext = CHECKPLOT_EXTS.get(cfg['CHECKPLOT_DEV'].upper(), None)
+    if ext is not None:
+        for cpfn in cfg['CHECKPLOT_NAME'].split(','):
+            with open(cpfn.strip() + '_1' + ext, 'wb') as f:
+                f.write(b'%!PS-Adobe-2.0\n' if ext == '.ps' else b'\0' * 4096)
+
+    sys.stderr.write('> All done (in 0.0 s)\n')
+    return 0
+
+
+def run_swarp(args):
+    images, cfg = parse_arguments(args, SWARP_DUMP)
+    for imgfn in images:
+        if not os.path.exists(imgfn):
+            sys.stderr.write('> \n*ERROR*: {0} not found\n'.format(imgfn))
+            return 1
+
+    time.sleep(_env_number('DELAY', 0, float))
+    chatter('swarp')
+
+    npix = _env_number('NPIX', 64)
+    write_fits_image(cfg['IMAGEOUT_NAME'], npix, [('NCOMBINE', len(images))])
+    write_fits_image(cfg['WEIGHTOUT_NAME'], npix)
+    if cfg['WRITE_XML'] == 'Y':
+        with open(cfg['XML_NAME'], 'w') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n<VOTABLE>'
+                    '<RESOURCE ID="SWarp"/></VOTABLE>\n')
+
+    sys.stderr.write('> All done (in 0.0 s)\n')
+    return 0
+
+
+def main(toolname):
+    args = sys.argv[1:]
+    if '-dd' in args:
+        sys.stdout.write(DUMPS[toolname])
+        sys.exit(0)
+    elif '-dp' in args and toolname != 'sex':
+        sys.exit(0)
+    elif not args:
+        sys.stdout.write('syntax: {0} <image> [-c <config_file>][-<keyword> <value>]\n'.format(toolname))
+        sys.exit(0)
+
+    sys.exit({'sex': run_sex, 'scamp': run_scamp, 'swarp': run_swarp}[toolname](args))
@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+"""
+Benchmarks of the overhead the wrappers add on top of the AstrOmatic tools.
+
+The tools are replaced by the stand-ins in ``fakes/`` (see
+``fakes/fakeastromatic.py``), so this runs offline and measures only what
+happens in this package: building the tool objects, preparing and running an
+invocation, parsing the outputs, renaming them, and batch throughput.  Process
+spawning is measured on its own (``spawn_baseline``) so it can be subtracted.
+
+Usage::
+
+    python benchmarks/run_benchmarks.py [--repeat N] [--images N]
+                                        [--only NAME ...] [--output FILE]
+
+The results are written as JSON (to stdout, or `--output`), with a summary on
+stderr.  Each result has the benchmark ``name``, the number of timed runs, and
+the ``min``, ``median``, ``mean`` and ``max`` time in seconds, plus any
+benchmark-specific extras.  Benchmarks that can't run have a ``skipped``
+reason instead, and those that fail have the ``error`` they raised.
+"""
+from __future__ import division, print_function
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+from timeit import default_timer
+
+FAKESDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fakes')
+sys.path.insert(0, FAKESDIR)
+
+import fakeastromatic
+
+from pyphotwrappers import astromatic
+from pyphotwrappers.astromatic import AstromaticTool, AstromaticConfiguration
+from pyphotwrappers.resultcache import ResultCache
+from pyphotwrappers.sextractor import Sextractor
+from pyphotwrappers.scamp import Scamp
+from pyphotwrappers.swarp import Swarp
+
+BENCHMARKS = []
+
+
+def benchmark(func):
+    BENCHMARKS.append(func)
+    return func
+
+
+class Context(object):
+    """
+    What the benchmarks need to know: where things are and how hard to try.
+    """
+    def __init__(self, workdir, repeat, nimages):
+        self.workdir = workdir
+        self.repeat = repeat
+        self.nimages = nimages
+        self.dumpcachedir = os.path.join(workdir, 'dumpcache')
+        self.sexpath = os.path.join(FAKESDIR, 'sex')
+        self.scamppath = os.path.join(FAKESDIR, 'scamp')
+        self.swarppath = os.path.join(FAKESDIR, 'swarp')
+
+        self.imgfns = []
+        for i in range(max(nimages, 1)):
+            fn = self.path('img{0}.fits'.format(i))
+            fakeastromatic.write_fits_image(fn, 16)
+            self.imgfns.append(fn)
+        self.baselines = {}
+
+    def path(self, fn):
+        return os.path.join(self.workdir, fn)
+
+    def tool(self, cls, execpath, cached=True, **kwargs):
+        """
+        Makes a `cls` using the dump cache in the work directory, or no dump
+        cache if `cached` is False.
+        """
+        AstromaticTool.dumpcachedir = self.dumpcachedir if cached else False
+        try:
+            return cls(execpath, **kwargs)
+        finally:
+            AstromaticTool.dumpcachedir = None
+
+
+def time_calls(func, repeat, setup=None):
+    """
+    Returns a list of how long each of `repeat` calls of `func` took, calling
+    `setup` (untimed) before each if given.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        sttime = default_timer()
+        func()
+        times.append(default_timer() - sttime)
+    return times
+
+
+def summarize(name, times, **extras):
+    stimes = sorted(times)
+    n = len(stimes)
+    median = stimes[n // 2] if n % 2 else (stimes[n // 2 - 1] + stimes[n // 2]) / 2
+    result = {'name': name, 'repeat': n, 'min': stimes[0], 'median': median,
+              'mean': sum(stimes) / n, 'max': stimes[-1]}
+    result.update(extras)
+    return result
+
+
+def error_result(name, e):
+    return {'name': name, 'error': '{0}: {1}'.format(type(e).__name__, e)}
+
+
+@benchmark
+def spawn_baseline(ctx):
+    """
+    Running the fake sextractor directly, with no wrapper.
+    """
+    paramfn = ctx.path('baseline.param')
+    filterfn = ctx.path('baseline.conv')
+    with open(paramfn, 'w') as f:
+        f.write('NUMBER\nFLUX_AUTO\nX_IMAGE\nY_IMAGE\n')
+    with open(filterfn, 'w') as f:
+        f.write('CONV NORM\n1 2 1\n2 4 2\n1 2 1\n')
+    args = [ctx.sexpath, ctx.imgfns[0], '-PARAMETERS_NAME', paramfn,
+            '-FILTER_NAME', filterfn, '-CATALOG_NAME', ctx.path('baseline.cat')]
+
+    with open(os.devnull, 'w') as devnull:
+        times = time_calls(lambda: subprocess.check_call(args, stdout=devnull, stderr=devnull),
+                           ctx.repeat)
+    ctx.baselines['spawn'] = summarize('', times)['median']
+    return [summarize('spawn_baseline', times)]
+
+
+@benchmark
+def construction(ctx):
+    """
+    Creating the tool objects, with and without the dump cache.
+    """
+    results = []
+    for cls, execpath in [(Sextractor, ctx.sexpath), (Scamp, ctx.scamppath),
+                          (Swarp, ctx.swarppath)]:
+        name = cls.__name__.lower()
+        times = time_calls(lambda: ctx.tool(cls, execpath, cached=False), ctx.repeat)
+        results.append(summarize('construct_{0}_nocache'.format(name), times))
+
+        ctx.tool(cls, execpath)  # warm the cache
+        times = time_calls(lambda: ctx.tool(cls, execpath), ctx.repeat)
+        results.append(summarize('construct_{0}_cached'.format(name), times))
+    return results
+
+
+@benchmark
+def configuration(ctx):
+    """
+    Parsing a ``-dd`` dump, turning the configuration into arguments and a
+    config file, and deriving per-job configurations from it.
+    """
+    dump = fakeastromatic.SEX_DUMP
+    cfg = AstromaticConfiguration(dump)
+    reps = ctx.repeat * 10
+
+    def parse_cold():
+        astromatic._parsed_configs.clear()
+        return AstromaticConfiguration(dump)
+
+    return [summarize('config_parse', time_calls(parse_cold, reps)),
+            summarize('config_parse_memoized', time_calls(lambda: AstromaticConfiguration(dump), reps)),
+            summarize('config_cmdline', time_calls(cfg.get_cmdline_arguments, reps)),
+            summarize('config_file_contents', time_calls(cfg.get_file_contents, reps)),
+            summarize('config_getattr', time_calls(lambda: cfg.VERBOSE_TYPE, reps * 10)),
+            summarize('config_derive', time_calls(lambda: cfg.derive(DETECT_THRESH='3.0'), reps * 10))]
+
+
+@benchmark
+def invocation(ctx):
+    """
+    A bare `_invoke_tool` and a full `sextract_single` with a proxy catalog
+    (with the full and the minimal command line, and from the result cache),
+    with the overhead over the spawn baseline.
+    """
+    sex = ctx.tool(Sextractor, ctx.sexpath)
+    sex.use_proxy_catalog()
+
+    results = []
+    times = time_calls(lambda: sex._invoke_tool([ctx.imgfns[0]]), ctx.repeat)
+    results.append(summarize('invoke_tool', times, **_overhead(ctx, times)))
+    records = list(sex.records)[-ctx.repeat:]
+    results.append(summarize('invoke_tool_run_phase', [r.walltime for r in records],
+                             maxrss=max([r.maxrss or 0 for r in records]),
+                             argvlength=records[-1].argvlength))
+
+    times = time_calls(lambda: sex.sextract_single(ctx.imgfns[0]), ctx.repeat)
+    results.append(summarize('sextract_single_proxy', times, **_overhead(ctx, times)))
+
+    sex.minimalcmdline = True
+    times = time_calls(lambda: sex.sextract_single(ctx.imgfns[0]), ctx.repeat)
+    results.append(summarize('sextract_single_minimal_cmdline', times,
+                             argvlength=sex.lastrecord.argvlength, **_overhead(ctx, times)))
+
+    sex.resultcache = ResultCache(ctx.path('resultcache'))
+    sex.sextract_single(ctx.imgfns[0])  # fill the cache
+    times = time_calls(lambda: sex.sextract_single(ctx.imgfns[0]), ctx.repeat)
+    results.append(summarize('sextract_single_result_cache_hit', times))
+    return results
+
+
+def _overhead(ctx, times):
+    if 'spawn' not in ctx.baselines:
+        return {}
+    return {'overhead_median': summarize('', times)['median'] - ctx.baselines['spawn']}
+
+
+@benchmark
+def output_parsing(ctx):
+    """
+    `Sextractor.get_output` on ASCII and FITS_LDAC proxy catalogs (needs
+    astropy).
+    """
+    try:
+        import astropy
+    except ImportError:
+        return [{'name': 'get_output', 'skipped': 'astropy is not installed'}]
+
+    results = []
+    for cattype in ('ASCII_HEAD', 'FITS_LDAC'):
+        name = 'get_output_' + cattype.lower()
+        sex = ctx.tool(Sextractor, ctx.sexpath)
+        sex.use_proxy_catalog(cattype)
+        sex.sextract_single(ctx.imgfns[0])
+        try:
+            times = time_calls(sex.get_output, ctx.repeat)
+        except Exception as e:
+            # e.g. an astropy that can't read this catalog type
+            results.append(error_result(name, e))
+            continue
+        results.append(summarize(name, times, catalogbytes=len(sex.cfg.CATALOG_NAME.content)))
+    return results
+
+
+@benchmark
+def renaming(ctx):
+    """
+    `sextract_single` with renamed catalog, XML and check image outputs, and
+    the time spent renaming.
+    """
+    outdir = ctx.path('renamed')
+    sex = ctx.tool(Sextractor, ctx.sexpath, renameoutputs=os.path.join(outdir, '{input}_{fn}'))
+    sex.cfg.CATALOG_NAME = ctx.path('rename.cat')
+    sex.cfg.WRITE_XML = 'Y'
+    sex.cfg.XML_NAME = ctx.path('rename.xml')
+    sex.cfg.CHECKIMAGE_TYPE = 'BACKGROUND,SEGMENTATION'
+    sex.cfg.CHECKIMAGE_NAME = ctx.path('back.fits') + ',' + ctx.path('seg.fits')
+
+    times = time_calls(lambda: sex.sextract_single(ctx.imgfns[0]), ctx.repeat,
+                       setup=lambda: shutil.rmtree(outdir, ignore_errors=True))
+    records = list(sex.records)[-ctx.repeat:]
+    return [summarize('sextract_single_renamed', times, **_overhead(ctx, times)),
+            summarize('reprocess_phase', [r.phases.get('reprocess', 0) for r in records])]
+
+
+@benchmark
+def batch_throughput(ctx):
+    """
+    `sextract_many` over all the images, serially and with one worker per
+    CPU.
+    """
+    results = []
+    ncpu = multiprocessing.cpu_count()
+    for workers in sorted(set([1, ncpu])):
+        outdir = ctx.path('batch{0}'.format(workers))
+        sex = ctx.tool(Sextractor, ctx.sexpath, renameoutputs=os.path.join(outdir, '{input}.cat'))
+        sex.cfg.CATALOG_NAME = ctx.path('batch.cat')
+
+        times = time_calls(lambda: sex.sextract_many(ctx.imgfns, max_workers=workers),
+                           max(ctx.repeat // 5, 1),
+                           setup=lambda: shutil.rmtree(outdir, ignore_errors=True))
+        median = summarize('', times)['median']
+        results.append(summarize('sextract_many_{0}workers'.format(workers), times,
+                                 nimages=len(ctx.imgfns),
+                                 images_per_sec=len(ctx.imgfns) / median))
+    return results
+
+
+@benchmark
+def scamp_and_swarp(ctx):
+    """
+    End-to-end `Scamp.scamp_catalogs` (with renamed outputs) and
+    `Swarp.swarp_images` runs.
+    """
+    catfns = []
+    for i, imgfn in enumerate(ctx.imgfns):
+        catfn = ctx.path('scamp{0}.cat'.format(i))
+        fakeastromatic.write_ldac(catfn, ['XWIN_IMAGE', 'YWIN_IMAGE', 'FLUX_AUTO'], 100)
+        catfns.append(catfn)
+
+    outdir = ctx.path('scampout')
+    scamp = ctx.tool(Scamp, ctx.scamppath, pstopdf=False,
+                     renameoutputs=os.path.join(outdir, '{input}_{fn}'))
+    scamp.cfg.XML_NAME = ctx.path('scamp.xml')
+    scamp.cfg.CHECKPLOT_NAME = ','.join([ctx.path(nm) for nm in scamp.cfg.CHECKPLOT_NAME.split(',')])
+    scamp.cfg.AHEADER_GLOBAL = ctx.path('scamp.ahead')
+    scamptimes = time_calls(lambda: scamp.scamp_catalogs(catfns), ctx.repeat,
+                            setup=lambda: shutil.rmtree(outdir, ignore_errors=True))
+
+    swarp = ctx.tool(Swarp, ctx.swarppath)
+    swarp.cfg.IMAGEOUT_NAME = ctx.path('coadd.fits')
+    swarp.cfg.WEIGHTOUT_NAME = ctx.path('coadd.weight.fits')
+    swarp.cfg.XML_NAME = ctx.path('swarp.xml')
+    swarp.cfg.RESAMPLE_DIR = ctx.workdir
+    swarp.cfg.VMEM_DIR = ctx.workdir
+    swarptimes = time_calls(lambda: swarp.swarp_images(ctx.imgfns), ctx.repeat)
+
+    return [summarize('scamp_catalogs', scamptimes, ncatalogs=len(catfns)),
+            summarize('swarp_images', swarptimes, nimages=len(ctx.imgfns))]
+
+
+def run(ctx, only=None):
+    results = []
+    for bench in BENCHMARKS:
+        if only and bench.__name__ not in only:
+            continue
+        print('running', bench.__name__, file=sys.stderr)
+        try:
+            benchresults = bench(ctx)
+        except Exception as e:
+            # record it and go on, so one broken benchmark doesn't lose the rest
+            benchresults = [error_result(bench.__name__, e)]
+        for result in benchresults:
+            results.append(result)
+            if 'median' in result:
+                print('  {name:32} median {median:.6f}s  min {min:.6f}s'.format(**result),
+                      file=sys.stderr)
+            elif 'error' in result:
+                print('  {name:32} failed: {error}'.format(**result), file=sys.stderr)
+            else:
+                print('  {name:32} skipped: {skipped}'.format(**result), file=sys.stderr)
+    return results
+
+
+def metadata(ctx):
+    import pyphotwrappers
+
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'cpus': multiprocessing.cpu_count(),
+            'pyphotwrappers': getattr(pyphotwrappers, '__version__', None),
+            'repeat': ctx.repeat,
+            'nimages': ctx.nimages,
+            'fake_settings': dict([(k, v) for k, v in os.environ.items()
+                                   if k.startswith('FAKEASTROMATIC_')])}
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='how many times each benchmark is timed')
+    parser.add_argument('--images', type=int, default=16,
+                        help='how many images to use in the batch benchmarks')
+    parser.add_argument('--only', nargs='+', metavar='NAME',
+                        choices=[b.__name__ for b in BENCHMARKS],
+                        help='run only these benchmarks')
+    parser.add_argument('--output', help='where to write the JSON results '
+                                         '(default: stdout)')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='pyphotwrappers-bench-')
+    olddir = os.getcwd()
+    try:
+        os.chdir(workdir)  # so any stray outputs of the fakes end up here
+        ctx = Context(workdir, args.repeat, args.images)
+        output = {'metadata': metadata(ctx), 'results': run(ctx, args.only)}
+    finally:
+        os.chdir(olddir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2, sort_keys=True)
+    else:
+        json.dump(output, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+
+if __name__ == '__main__':
+    main()
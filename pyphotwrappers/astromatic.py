@@ -5,12 +5,27 @@ Specific tools are in their own modules.
 """
 from __future__ import division, print_function
 
-import collections
+import contextlib
+import re
+import threading
+
+try:
+    from collections.abc import Mapping, MutableMapping
+except ImportError:  # Python 2
+    from collections import Mapping, MutableMapping
+
+try:
+    basestring
+except NameError:  # Python 3
+    basestring = str
 
 __all__ = ['AstromaticTool',
            'AstromaticConfiguration',
            'AstromaticComments',
            'AstromaticError',
+           'AstromaticTimeoutError',
+           'InvocationRecord',
+           'PhaseHook',
            'ProxyInputFile',
            'ProxyOutputFile'
           ]
@@ -21,6 +36,64 @@ class AstromaticTool(object):
     A superclass for a generic astromatic tool
     """
     defaultexecname = None  # subclasses define to enable `find_execpath`
+    # where the ``-dd``-style dumps of the tool are cached.  None means
+    # ``~/.pyphotwrappers/dumpcache``, False disables the cache
+    dumpcachedir = None
+    # if True, proxies stream through named pipes instead of temp files unless
+    # the proxy says otherwise (see `ProxyInputFile`)
+    usefifos = False
+    # the `~pyphotwrappers.scratch.ScratchSpace` for temporary files, or None
+    # to use the process-wide one
+    scratch = None
+    # the scratch space reserved for an output proxy file, if its size isn't
+    # known from an earlier run (then it's the size of that run's output)
+    outputproxybytes = 16 * 1024 ** 2
+    # subclasses that take images set this (see `_try_decompress`)
+    autodecompress = False
+    # how inputs get decompressed: 'inprocess' (in this process, see
+    # `pyphotwrappers.utils.decompress_inprocess`), 'external' (with the
+    # programs in `pyphotwrappers.utils.fitsextension_to_decompresser`) or
+    # 'auto' (in-process when possible, otherwise external)
+    decompressengine = 'auto'
+    # how many files are decompressed at once when a run has several, or None
+    # for one per CPU
+    decompressthreads = None
+    # a `~pyphotwrappers.framecache.FrameCache` that decompressed inputs are
+    # kept in (and taken from) instead of being made for each run, or None
+    framecache = None
+    # how many bytes of the end of the tool's stdout and stderr are kept (each),
+    # or None to keep all of it
+    outputlimit = 64 * 1024
+    # if not None, called as ``outputcallback(streamname, line)`` for each line
+    # the tool prints ('stdout' or 'stderr'), as it prints it
+    outputcallback = None
+    # seconds a single run of the tool may take before it is killed, or None
+    # for no limit
+    timeout = None
+    # how many `InvocationRecord`s to keep in `records`
+    recordhistory = 100
+    # if True, only the configuration items that differ from the tool's
+    # built-in defaults (from ``-dd``) are passed on the command line
+    minimalcmdline = False
+    # if the command line would be longer than this many bytes, the
+    # configuration is passed in a temporary config file instead (None for no
+    # limit)
+    maxcmdlinelength = 128 * 1024
+    # True for tools that read ``@file`` arguments as lists of input files
+    acceptslistfiles = False
+    # if the names of the input files add up to more than this many bytes,
+    # tools that `acceptslistfiles` get them in a temporary list file (None
+    # to never do this)
+    listfilethreshold = 32 * 1024
+    # whether a manifest (see `pyphotwrappers.manifest`) is written next to
+    # the main output of each run: None for only when ``overwrite=False`` (the
+    # only time they're read), True for always, False for never.  With
+    # ``overwrite=False``, runs are only skipped if the manifest shows their
+    # outputs are up to date.
+    writemanifests = None
+    # the config items that only say where outputs go (so they aren't part of
+    # what's compared to see if outputs are up to date)
+    _OUTPUT_NAME_ITEMS = ()
 
     def __init__(self, execpath=None, initialconfig=None, verbose=False):
         """
@@ -28,11 +101,18 @@ class AstromaticTool(object):
         taken from calling the tool with ``-dd``.
         """
         import os
+        import collections
 
         from .utils import which_path
 
         self.verbose = verbose
         self.cfg = None  # gets replaced below, but needed when initializing some parts
+        self.lastrecord = None
+        self.records = collections.deque(maxlen=self.recordhistory)
+        self.phasehooks = []
+        self._phases = None
+        self._tooldefaults = None
+        self._toolid = None
 
         if execpath is None:
             execpath = which_path(self.defaultexecname)
@@ -40,96 +120,896 @@ class AstromaticTool(object):
         self.execpath = os.path.abspath(execpath)
 
         if initialconfig is None:
-            initialconfig = self._invoke_tool(['-dd'], useconfig=False)[0]  # [0] is stdout
+            initialconfig = self._get_tool_dump('-dd')
+            self._tooldefaults = _parse_config_string(initialconfig)[1]
         self.cfg = AstromaticConfiguration(initialconfig)
 
-    def _invoke_tool(self, arguments, validretcodes=[0], useconfig=True, showoutput=False):
+    def _get_tool_defaults(self):
+        """
+        Returns a dict mapping the names of the tool's config items to its
+        built-in defaults.
+        """
+        if self._tooldefaults is None:
+            self._tooldefaults = _parse_config_string(self._get_tool_dump('-dd'))[1]
+        return self._tooldefaults
+
+    def _get_tool_dump(self, flag):
+        """
+        Returns the stdout of running the tool with just `flag` (e.g. ``-dd``),
+        from the on-disk dump cache if possible.
+
+        The cache is keyed on the resolved executable path and its size and
+        modification time, so it is invalidated whenever the executable
+        changes.
+        """
+        import os
+        import hashlib
+
+        if self.dumpcachedir is False:
+            return self._invoke_tool([flag], useconfig=False, outputlimit=None)[0]  # [0] is stdout
+
+        cachedir = self.dumpcachedir
+        if cachedir is None:
+            cachedir = os.path.join(os.path.expanduser('~'), '.pyphotwrappers', 'dumpcache')
+
+        realpath = os.path.realpath(self.execpath)
+        try:
+            st = os.stat(realpath)
+        except OSError:
+            # let _invoke_tool give the usual error for a missing executable
+            return self._invoke_tool([flag], useconfig=False, outputlimit=None)[0]
+
+        pathkey = hashlib.sha1(realpath.encode('utf-8')).hexdigest() + flag
+        statkey = '{0}-{1!r}'.format(st.st_size, st.st_mtime)
+        cachefn = os.path.join(cachedir, pathkey + '_' + statkey)
+
+        if os.path.isfile(cachefn):
+            if self.verbose:
+                print('Using cached {0} output from {1}'.format(flag, cachefn))
+            with open(cachefn, 'r') as f:
+                return f.read()
+
+        dump = self._invoke_tool([flag], useconfig=False, outputlimit=None)[0]
+
+        try:
+            if not os.path.isdir(cachedir):
+                os.makedirs(cachedir)
+            # drop entries for older versions of this executable
+            for fn in os.listdir(cachedir):
+                if fn.startswith(pathkey + '_') and not fn.endswith('.tmp'):
+                    os.remove(os.path.join(cachedir, fn))
+            # write-then-rename so concurrent processes never see partial files
+            tmpfn = '{0}.{1}.tmp'.format(cachefn, os.getpid())
+            with open(tmpfn, 'w') as f:
+                f.write(dump)
+            os.rename(tmpfn, cachefn)
+        except (IOError, OSError) as e:
+            if self.verbose:
+                print('Could not write dump cache file {0}: {1}'.format(cachefn, e))
+        return dump
+
+    def _invoke_tool(self, arguments, validretcodes=[0], useconfig=True, showoutput=False,
+                     outputlimit='default', timeout=None, cfg=None):
         """
         Runs the tool with the given arguments, returns (stdout, stderr)
 
         if `useconfig` is a string, it will be treated as a filename to send the
-        configuration file to.
+        configuration file to.  Otherwise the configuration goes on the command
+        line (see `minimalcmdline`), or in a temporary config file if that would
+        be longer than `maxcmdlinelength`.
 
         If not a valid return code, raises an AstromaticError with stderr as the
         second argument
 
         `showoutput` being True means that the return values will be None
         instead of stdout and stderr
+
+        Only the last `outputlimit` bytes of stdout and stderr are kept, with
+        'default' meaning the `outputlimit` attribute.  If `outputcallback` is
+        set, it gets every line (and the output is also shown if `showoutput`).
+
+        If the tool takes longer than `timeout` seconds (None means the
+        `timeout` attribute), it and everything it started are killed and an
+        `AstromaticTimeoutError` is raised.
+
+        Either way, an `InvocationRecord` describing the run ends up in
+        `lastrecord` and `records`.
+
+        The run uses `cfg`, a snapshot from `_snapshot_cfg`, or a new snapshot
+        of the current configuration if None.  Nothing else about this object
+        is changed by the run (apart from the `last*` attributes and
+        `records`), so several threads can use the same tool at once.
         """
-        import os
-        import shlex
+        import sys
+        import time
+        import threading
         import subprocess
 
-        from tempfile import NamedTemporaryFile
+        if outputlimit == 'default':
+            outputlimit = self.outputlimit
+        if timeout is None:
+            timeout = self.timeout
+        capture = self.outputcallback is not None or not showoutput
+
+        if cfg is None and self.cfg is not None:
+            cfg = self._snapshot_cfg()
+        inproxies, outproxies = self._get_invocation_proxies(cfg)
+        timer = None
+        record = None
+        try:
+            arguments = self._prepare_invocation(arguments, useconfig, cfg, inproxies, outproxies)
+            record = self._start_record(arguments, inproxies)
+
+            with self._phase('run'):
+                if capture:
+                    # read as bytes, so `_pump_output` can decode leniently
+                    p = subprocess.Popen(arguments, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                         **_new_session_kwargs())
+                else:
+                    p = subprocess.Popen(arguments, **_new_session_kwargs())
+
+                timedout = []
+                if timeout is not None:
+                    timer = threading.Timer(timeout, _kill_process_group, (p, timedout))
+                    timer.daemon = True
+                    timer.start()
+
+                try:
+                    if capture:
+                        outbuf = _OutputTail(outputlimit)
+                        errbuf = _OutputTail(outputlimit)
+                        threads = []
+                        for stream, buf, name, echo in [(p.stdout, outbuf, 'stdout', sys.stdout),
+                                                        (p.stderr, errbuf, 'stderr', sys.stderr)]:
+                            t = threading.Thread(target=self._pump_output,
+                                                 args=(stream, buf, name, echo if showoutput else None))
+                            t.daemon = True
+                            t.start()
+                            threads.append(t)
+                        rusage = _wait_with_rusage(p)
+                        for t in threads:
+                            t.join()
+                        if showoutput:
+                            stdout = stderr = None
+                        else:
+                            stdout = outbuf.getvalue()
+                            stderr = errbuf.getvalue()
+                    else:
+                        rusage = _wait_with_rusage(p)
+                        stdout = stderr = None
+                except BaseException:
+                    # e.g. KeyboardInterrupt - the tool is in its own process
+                    # group, so it won't have gotten the signal
+                    _kill_process_group(p)
+                    raise
+
+            record.walltime = time.time() - record.starttime
+            record.returncode = p.returncode
+            record.timedout = bool(timedout)
+            record.set_rusage(rusage)
+
+            if timedout:
+                msg = 'Running of {0} timed out after {1} secs'.format(self.execpath, timeout)
+                raise AstromaticTimeoutError(msg, stderr, stdout)
+            self._finish_invocation(p.returncode, stdout, stderr, validretcodes, outproxies)
+            record.proxybytesread = sum([len(outp.content) for outp in outproxies])
+        finally:
+            if timer is not None:
+                timer.cancel()
+                timer.join()
+            self._cleanup_invocation(inproxies + outproxies)
+
+        return stdout, stderr
+
+    def _start_record(self, arguments, inproxies):
+        """
+        Creates the `InvocationRecord` for a run with the full argument list
+        `arguments`, and makes it the `lastrecord`.
+        """
+        record = InvocationRecord(arguments)
+        record.proxybyteswritten = sum([len(self._proxy_content(inp)) for inp in inproxies])
+        phases = self._current_phases()
+        if phases is not None:
+            # the driver method is timing phases, which then show up here
+            record.phases = phases
+        self.lastrecord = record
+        self.records.append(record)
+        return record
+
+    def add_phase_hook(self, hook):
+        """
+        Registers `hook` (a `PhaseHook`) to be told about every phase of the
+        work this tool does.  Copies of this object made for a single call
+        share the hooks.
+        """
+        self.phasehooks.append(hook)
+
+    def remove_phase_hook(self, hook):
+        """
+        Unregisters a hook added with `add_phase_hook`.
+        """
+        self.phasehooks.remove(hook)
+
+    def _current_phases(self):
+        """
+        Returns the dictionary the current driver method is timing its phases
+        in, or None if there isn't one.
+        """
+        if self._phases is not None:
+            return self._phases  # a private copy made by an async driver
+        return getattr(_thread_state, 'phases', None)
+
+    @contextlib.contextmanager
+    def _phase(self, name):
+        """
+        Times the block as the phase `name` (e.g. 'decompress') of the current
+        driver method, and calls the `phasehooks` around it.
+        """
+        import time
+
+        hooks = self.phasehooks
+        phases = self._current_phases()
+        if not hooks and phases is None:
+            yield  # nobody's interested
+            return
+
+        for hook in hooks:
+            hook.before(self, name)
+        sttime = time.time()
+        exc = None
+        try:
+            yield
+        except BaseException as e:
+            exc = e
+            raise
+        finally:
+            elapsed = time.time() - sttime
+            if phases is not None:
+                phases[name] = phases.get(name, 0) + elapsed
+            for hook in reversed(hooks):
+                hook.after(self, name, elapsed, exc)
+
+    def _pump_output(self, stream, buf, name, echo):
+        """
+        Reads lines from the binary pipe `stream` into the `_OutputTail` `buf`
+        until it's closed, passing them to `outputcallback` and `echo` (a
+        file) as well.
+
+        This must keep reading to the end, or the tool blocks once the pipe
+        fills up, so bytes that aren't valid UTF-8 are replaced, and errors
+        from `outputcallback` or `echo` are warned about (once) and otherwise
+        ignored.
+        """
+        import sys
+        import codecs
+        from warnings import warn
+
+        if sys.version_info[0] >= 3:
+            decode = codecs.getincrementaldecoder('utf-8')('replace').decode
+        else:
+            decode = lambda chunk, final=False: chunk  # str is already bytes
+
+        warned = False
+        while True:
+            chunk = stream.readline(_OutputTail.MAX_LINE)
+            line = decode(chunk, final=not chunk)
+            if line:
+                buf.append(line)
+                try:
+                    if echo is not None:
+                        echo.write(line)
+                    if self.outputcallback is not None:
+                        self.outputcallback(name, line)
+                except Exception as e:
+                    if not warned:
+                        warn('Error handling the {0} of {1} (it is still being '
+                             'read): {2!r}'.format(name, self.execpath, e))
+                        warned = True
+            if not chunk:
+                break
+        stream.close()
+
+    def invoke_async(self, arguments, validretcodes=[0], useconfig=True,
+                     showoutput=False, limiter=None, timeout=None, cfg=None):
+        """
+        An `asyncio` counterpart to `_invoke_tool`: returns a coroutine that
+        runs the tool without blocking the event loop, and gives (stdout,
+        stderr).
+
+        `limiter` is an `asyncio.Semaphore` used to limit how many tools run at
+        once, or None to use the event loop's default one (see
+        `pyphotwrappers.asynctools`).
+
+        Like `_invoke_tool`, each invocation works from its own snapshot of
+        the configuration (`cfg`), so many can run at once on one object.
+        """
+        from .asynctools import invoke_tool_async
+
+        return invoke_tool_async(self, arguments, validretcodes=validretcodes,
+                                 useconfig=useconfig, showoutput=showoutput,
+                                 limiter=limiter, timeout=timeout, cfg=cfg)
+
+    def _snapshot_cfg(self, **overrides):
+        """
+        Returns the frozen snapshot of the configuration (with `overrides`)
+        that a single run works from.  Subclasses can override this to fill in
+        values that depend on other state of the tool.
+        """
+        return self.cfg.snapshot(**overrides)
+
+    def _describe_run(self, cfg):
+        """
+        Returns (parts, fns) for a run with the snapshot `cfg`: `parts` is a
+        list of strings describing the tool version and the settings (with the
+        contents of input proxies, but not where the outputs go), and `fns` are
+        the existing files the settings name (e.g. weight maps), whose
+        contents matter too.
+        """
+        import os
+
+        from . import utils
+
+        if self._toolid is None or self._toolid[0] != self.execpath:
+            # the -dd dump includes the version
+            self._toolid = (self.execpath, utils.hash_strings([self._get_tool_dump('-dd')]))
+
+        parts = ['tool=' + self._toolid[1]]
+        fns = []
+        for nm in cfg.names:
+            val = cfg[nm]
+            if nm in self._OUTPUT_NAME_ITEMS:
+                continue
+            elif isinstance(val, ProxyInputFile):
+                parts.append(nm + '=' + self._proxy_content(val))
+            elif isinstance(val, ProxyOutputFile):
+                parts.append(nm + '=PROXY OUTPUT FILE')
+            else:
+                parts.append(nm + '=' + val)
+                fns.extend([fn.strip() for fn in val.split(',') if os.path.isfile(fn.strip())])
+        return parts, fns
+
+    def _manifest_is_current(self, outfn, inputfns, cfg):
+        """
+        Determines if the manifest for the main output `outfn` shows that it
+        (and the other outputs) came from a run with the snapshot `cfg` on
+        `inputfns`, and that nothing has changed since.
+        """
+        from . import utils
+        from .manifest import RunManifest, manifest_fn
+
+        manifest = RunManifest.load(manifest_fn(outfn))
+        if manifest is None:
+            return False
+        with self._phase('manifest'):
+            parts, fns = self._describe_run(cfg)
+            return manifest.is_current(utils.hash_strings(parts), list(inputfns) + fns)
+
+    def _write_manifest(self, outfn, inputfns, cfg, outputfns):
+        """
+        Writes the manifest for a run with the snapshot `cfg` on `inputfns`,
+        next to the main output `outfn`.  `outputfns` are all the outputs
+        (those that don't exist are left out).
+        """
+        import os
+
+        from . import utils
+        from .manifest import RunManifest, manifest_fn
+
+        if self.writemanifests is None:
+            if getattr(self, 'overwrite', True):
+                return
+        elif not self.writemanifests:
+            return
+        if not os.path.isfile(outfn):
+            return
+        with self._phase('manifest'):
+            parts, fns = self._describe_run(cfg)
+            outputfns = [fn for fn in outputfns if os.path.isfile(fn)]
+            try:
+                settings = utils.hash_strings(parts)
+                manifest = RunManifest.from_run(settings, list(inputfns) + fns, outputfns)
+                manifest.save(manifest_fn(outfn))
+            except (IOError, OSError) as e:
+                if self.verbose:
+                    print('Could not write the manifest for {0}: {1}'.format(outfn, e))
+
+    def _get_invocation_proxies(self, cfg):
+        if cfg is None:
+            return [], []
+        else:
+            return cfg.get_proxies()
+
+    def _proxy_content(self, proxy):
+        """
+        Returns what should be written to the temporary file for the input
+        `proxy`.  Subclasses can override this to fill in placeholders.
+        """
+        return proxy.content
+
+    def _proxy_uses_fifo(self, proxy, cfg):
+        """
+        Determines if `proxy` (in the snapshot `cfg`) should be a named pipe
+        rather than a temp file.  Subclasses should override this to return
+        False for proxies the tool needs to seek in.
+        """
+        import os
+
+        usefifo = self.usefifos if proxy.fifo is None else proxy.fifo
+        return bool(usefifo) and hasattr(os, 'mkfifo')
+
+    def _prepare_invocation(self, arguments, useconfig, cfg, inproxies, outproxies):
+        """
+        Creates the temp files for the proxies of the snapshot `cfg` and
+        returns the full argument list (including the executable) to run.
+        """
+        import shlex
 
         if isinstance(arguments, basestring):
             arguments = shlex.split(arguments)
 
-        if self.cfg is None:
-            inproxies = []
-            outproxies = []
-        else:
-            inproxies, outproxies = self.cfg.get_proxies()
-        allproxies = inproxies + outproxies
+        scratch = self._get_scratch()
 
-        try:
+        with self._phase('proxies'):
             #now prepare the proxy files
             for inp in inproxies:
-                inp.tempfileobj = NamedTemporaryFile(delete=False)
+                content = self._proxy_content(inp)
+                if self._proxy_uses_fifo(inp, cfg):
+                    inp.tempfileobj = _ProxyFifo(scratch, content)
+                else:
+                    inp.tempfileobj = scratch.tempfile(len(content), mode='w')
+                    inp.tempfileobj.write(content)
+                    inp.tempfileobj.close()
                 if self.verbose:
                     print('Using temporary file {0} for input {1}'.format(inp.tempfileobj.name, inp.configname))
                     if self.verbose == 'debug':
-                        print('Contents:\n' + inp.content)
-                inp.tempfileobj.write(inp.content)
-                inp.tempfileobj.close()
+                        print('Contents:\n' + content)
             for outp in outproxies:
-                outp.tempfileobj = NamedTemporaryFile(delete=False)
+                if self._proxy_uses_fifo(outp, cfg):
+                    outp.tempfileobj = _ProxyFifo(scratch)
+                else:
+                    outp.tempfileobj = scratch.tempfile(self._estimate_output_size(outp))
+                    # all we actually wanted was the name so just close right away
+                    outp.tempfileobj.close()
                 if self.verbose:
                     print('Using temporary file {0} for output {1}'.format(outp.tempfileobj.name, outp.configname))
-                # all we actually wanted was the name so just close right away
-                outp.tempfileobj.close()
-
-            #construct invocation arguments
-            #has to be here because the proxies have to be in place to know where they are
-            arguments = list(arguments)
-            if useconfig:
-                if isinstance(useconfig, basestring):
-                    if self.verbose:
-                        print("Writing config file to " + useconfig)
-                    with open(useconfig, 'w') as f:
-                        f.write(self.cfg.get_file_contents())
-                    arguments.insert(0, useconfig)
+
+        #construct invocation arguments
+        #has to be here because the proxies have to be in place to know where they are
+        arguments = list(arguments)
+        if useconfig:
+            if isinstance(useconfig, basestring):
+                if self.verbose:
+                    print("Writing config file to " + useconfig)
+                with open(useconfig, 'w') as f:
+                    f.write(cfg.get_file_contents())
+                arguments.insert(0, useconfig)
+                arguments.insert(0, '-c')
+            else:
+                cfgargs = self._get_config_arguments(cfg)
+                argvlength = sum([len(arg) + 1 for arg in arguments + cfgargs])
+                if self.maxcmdlinelength is not None and argvlength > self.maxcmdlinelength:
+                    cfgfn = self._write_temp_config(cfg, inproxies, scratch)
+                    arguments.insert(0, cfgfn)
                     arguments.insert(0, '-c')
                 else:
-                    arguments.extend(self.cfg.get_cmdline_arguments())
-            arguments.insert(0, self.execpath)
+                    arguments.extend(cfgargs)
+        arguments.insert(0, self.execpath)
 
-            self.lastinvocation = arguments
+        self.lastinvocation = arguments
+        return arguments
 
-            if showoutput:
-                p = subprocess.Popen(arguments)
-            else:
-                p = subprocess.Popen(arguments, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = p.communicate()
-            if p.returncode not in validretcodes:
-                msg = 'Running of {0} failed with retcode {1}'.format(self.execpath,
-                                                                      p.returncode)
-                raise AstromaticError(msg, stderr, stdout)
+    def _estimate_output_size(self, outp):
+        """
+        Returns how many bytes the output proxy `outp` will probably need.
+        """
+        previous = outp.source.content if outp.source is not None else None
+        if previous:
+            return len(previous)
+        return self.outputproxybytes
+
+    def _get_config_arguments(self, cfg):
+        """
+        Returns the command line arguments that pass the snapshot `cfg` to the
+        tool: all of it, or if `minimalcmdline` is set, just the items that
+        differ from the tool's defaults.
+        """
+        import os
+
+        if not self.minimalcmdline:
+            return cfg.get_cmdline_arguments()
+        # an empty config file, so that a default.sex (or similar) in the
+        # working directory can't change what the defaults are
+        return ['-c', os.devnull] + cfg.get_cmdline_arguments(defaults=self._get_tool_defaults())
 
+    def _write_temp_config(self, cfg, inproxies, scratch):
+        """
+        Writes the snapshot `cfg` to a temporary config file and returns its
+        name.  The file is added to `inproxies`, so it is removed along with
+        the proxy files.
+        """
+        cfgfile = ProxyInputFile(cfg.get_file_contents(), fifo=False)
+        cfgfile.tempfileobj = scratch.tempfile(len(cfgfile.content), mode='w')
+        cfgfile.tempfileobj.write(cfgfile.content)
+        cfgfile.tempfileobj.close()
+        inproxies.append(cfgfile)
+        if self.verbose:
+            print('Command line too long, using temporary config file ' + cfgfile.tempfileobj.name)
+        return cfgfile.tempfileobj.name
+
+    def _input_arguments(self, fns):
+        """
+        Returns (arguments, listfn), where `arguments` gives the tool the input
+        files `fns`.  If the tool `acceptslistfiles` and the names are longer
+        than `listfilethreshold`, they are written to the temporary list file
+        `listfn` and `arguments` is ``['@' + listfn]``.  Otherwise `listfn` is
+        None.  The caller should `_remove_temp` the list file when done.
+        """
+        fns = list(fns)
+        if (not self.acceptslistfiles or self.listfilethreshold is None or
+                sum([len(fn) + 1 for fn in fns]) <= self.listfilethreshold or
+                [fn for fn in fns if len(fn.split()) != 1]):  # can't list names with spaces
+            return fns, None
+
+        contents = '\n'.join(fns) + '\n'
+        listfile = self._get_scratch().tempfile(len(contents), mode='w', suffix='.lis')
+        try:
+            listfile.write(contents)
+        finally:
+            listfile.close()
+        if self.verbose:
+            print('Passing {0} input files in list file {1}'.format(len(fns), listfile.name))
+        return ['@' + listfile.name], listfile.name
+
+    def _finish_invocation(self, returncode, stdout, stderr, validretcodes, outproxies):
+        """
+        Checks the return code and reads the output proxies back in (also
+        setting the `content` of the proxies the snapshot was made from).
+        """
+        if returncode not in validretcodes:
+            msg = 'Running of {0} failed with retcode {1}'.format(self.execpath,
+                                                                  returncode)
+            raise AstromaticError(msg, stderr, stdout)
+
+        with self._phase('readback'):
             for outp in outproxies:
                 #get the content from the output proxies
-                with open(outp.tempfileobj.name, 'r') as f:
-                    outp.content = f.read()
+                if isinstance(outp.tempfileobj, _ProxyFifo):
+                    outp.content = outp.tempfileobj.get_content()
+                else:
+                    with open(outp.tempfileobj.name, 'r') as f:
+                        outp.content = f.read()
+                if outp.source is not None:
+                    outp.source.content = outp.content
+
+    def _cleanup_invocation(self, allproxies):
+        #close and delete all
+        for px in allproxies:
+            if px.tempfileobj is not None:
+                px.tempfileobj.close()  # shouldn't be necessary, but just in case...
+                self._remove_temp(px.tempfileobj.name)
+                px.tempfileobj = None
+
+    def _get_scratch(self):
+        from .scratch import get_scratch
+
+        if self.scratch is None:
+            return get_scratch()
+        return self.scratch
+
+    def _remove_temp(self, fn):
+        """
+        Deletes the temporary file `fn`, giving its space back to the scratch
+        space if it came from there.
+        """
+        import os
+
+        scratch = self._get_scratch()
+        if scratch.owns(fn):
+            scratch.release(fn)
+        elif os.path.isfile(fn):
+            os.remove(fn)
+
+    def _try_decompress(self, fn):
+        """
+        Decompresses `fn` if necessary (see `decompressengine`), or gets it
+        from the `framecache` if there is one.
+
+        Returns a file name for the decompressed file, or None if decompression
+        not needed.  Pass it to `_remove_decompressed` once the run is done.
+        The callers (`_decompress_many`) time this as the 'decompress' phase.
+        """
+        import os
+        import tempfile
+
+        from . import utils
+
+        if not self.autodecompress or fn is None:
+            return None  # bail immediately
+
+        for ext in utils.fitsextension_to_decompresser:
+            if fn.endswith(ext):
+                break
+        else:
+            return None  # not a decompressible file
+
+        if self.framecache is not None:
+            basefn = os.path.split(fn[:-len(ext)])[1]
+            return self.framecache.acquire(fn, self._decompress_to, basefn)
+
+        scratch = None
+        if self.autodecompress == 'tempfile':
+            scratch = self._get_scratch()
+            decompfn = os.path.split(fn[:-len(ext)])[1]  # the base file name
+            decompfn = scratch.mkpath(tempfile.gettempprefix() + decompfn,
+                                      utils.estimate_decompressed_size(fn))
+        else:
+            decompfn = self._get_decompressed_fn(fn, ext)
+
+        # Other threads or processes may want the same file at once (e.g. the
+        # same master image in several dual-image runs), so only one makes it,
+        # under a temporary name so nobody sees a partial file, and it's held
+        # (see `_hold_decompressed`) so nobody removes it while it's in use.
+        # The files made here get a marker file next to them, so a
+        # decompressed copy the user made themselves is used but never removed.
+        markfn = decompfn + _DECOMPRESS_MARK_SUFFIX
+        with utils.exclusive_lock(decompfn + _DECOMPRESS_LOCK_SUFFIX):
+            if _hold_decompressed(decompfn):
+                #assume it has already been decompressed
+                if self.verbose:
+                    print("Not decompressing {0} because it already exists as {1}".format(fn, decompfn))
+                return decompfn
+
+            tmpfn = '{0}.{1}{2}'.format(decompfn, os.getpid(), _DECOMPRESS_TEMP_SUFFIX)
+            try:
+                self._decompress_to(fn, tmpfn)
+                open(markfn, 'w').close()
+                os.rename(tmpfn, decompfn)
+            except BaseException:
+                if os.path.isfile(tmpfn):
+                    os.remove(tmpfn)
+                if os.path.isfile(markfn) and not os.path.exists(decompfn):
+                    os.remove(markfn)
+                if scratch is not None:
+                    scratch.release(decompfn)
+                raise
+            if scratch is not None:
+                scratch.commit(decompfn)
+            _hold_decompressed(decompfn)
+
+        return decompfn
+
+    def _decompress_to(self, fn, decompfn):
+        """
+        Decompresses `fn` to `decompfn`, with the `decompressengine`.
+        """
+        import time
+
+        from . import utils
+
+        ext = [ext for ext in utils.fitsextension_to_decompresser if fn.endswith(ext)][0]
+        inprocess = self.decompressengine == 'inprocess' or (
+            self.decompressengine == 'auto' and utils.can_decompress_inprocess(fn))
+        prog = 'in-process decompression' if inprocess else utils.fitsextension_to_decompresser[ext]
+        if self.verbose:
+            print('Running {prog} to extract file {0} to {1}'.format(fn, decompfn, prog=prog))
+        sttime = time.time()
+        if inprocess:
+            utils.decompress_inprocess(fn, decompfn)
+        else:
+            self._run_decompresser(fn, ext, decompfn)
+        if self.verbose:
+            print('{prog} finished in {0} secs'.format(time.time() - sttime, prog=prog))
+
+    def _run_decompresser(self, fn, ext, decompfn):
+        """
+        Decompresses `fn` (which ends in `ext`) to `decompfn` with the external
+        program for `ext`.
+        """
+        import subprocess
+
+        from . import utils
+
+        decompresser = utils.find_decompresser(ext)
+        if decompresser is None:
+            raise OSError('Could not find {0} to decompress {1}'.format(
+                          utils.fitsextension_to_decompresser[ext], fn))
+        if ext == '.gz':
+            # gunzip can only write to stdout
+            with open(decompfn, 'wb') as f:
+                retcode = subprocess.call([decompresser, '-c', fn], stdout=f)
+        else:
+            retcode = subprocess.call([decompresser, '-O', decompfn, fn])
+        if retcode != 0:
+            raise OSError('{prog} failed with return code '.format(prog=decompresser) + str(retcode))
+
+    def _decompress_many(self, fns):
+        """
+        Like `_try_decompress` for each of `fns`, but decompressing up to
+        `decompressthreads` at once.  If any fails, those that were
+        decompressed are removed again before the error is raised.
+        """
+        import multiprocessing
+        from multiprocessing.pool import ThreadPool
+
+        from . import utils
+
+        exts = tuple(utils.fitsextension_to_decompresser)
+        ntodo = len([fn for fn in fns if fn is not None and fn.endswith(exts)])
+        nthreads = self.decompressthreads
+        if nthreads is None:
+            nthreads = multiprocessing.cpu_count()
+        nthreads = min(nthreads, ntodo)
+        if not self.autodecompress or nthreads <= 1:
+            return self._decompress_serially(fns)
+
+        uniquefns = []  # so the same file isn't decompressed twice at once
+        for fn in fns:
+            if fn not in uniquefns:
+                uniquefns.append(fn)
+
+        pool = ThreadPool(nthreads)
+        try:
+            with self._phase('decompress'):
+                pending = [pool.apply_async(self._try_decompress, (fn,)) for fn in uniquefns]
+                decompfns = {}
+                error = None
+                for fn, p in zip(uniquefns, pending):
+                    try:
+                        decompfns[fn] = p.get()
+                    except Exception as e:
+                        error = e if error is None else error
         finally:
-            #close and delete all
-            for px in allproxies:
-                if px.tempfileobj is not None:
-                    px.tempfileobj.close()  # shouldn't be necessary, but just in case...
-                    if os.path.isfile(px.tempfileobj.name):
-                        os.remove(px.tempfileobj.name)
-                    px.tempfileobj = None
+            pool.close()
+            pool.join()
+        if error is not None:
+            self._remove_decompressed(decompfns.values())
+            raise error
+        return [decompfns[fn] for fn in fns]
+
+    def _decompress_inputs(self, fns, cfg):
+        """
+        Like `_decompress_many` for `fns`, but also decompressing (at the same
+        time) the compressed files the snapshot `cfg` names as inputs, e.g. a
+        ``WEIGHT_IMAGE`` or ``FLAG_IMAGE``.
+
+        Returns (decompfns, runcfg, alldecompfns): the decompressed names for
+        `fns` (as from `_decompress_many`), a snapshot like `cfg` that names the
+        decompressed files instead (see `AstromaticConfiguration._with_values`)
+        to run the tool with, and everything that was decompressed, to pass to
+        `_remove_decompressed` once the run is done.
+        """
+        import os
 
-        return stdout, stderr
+        from . import utils
+
+        exts = tuple(utils.fitsextension_to_decompresser)
+        itemfns = {}  # maps item name -> the (stripped) file names in it
+        cfgfns = []
+        if self.autodecompress:
+            for nm in cfg.names:
+                val = cfg[nm]
+                if nm in self._OUTPUT_NAME_ITEMS or not isinstance(val, basestring):
+                    continue
+                vals = [fn.strip() for fn in val.split(',')]
+                compressed = [fn for fn in vals if fn.endswith(exts) and os.path.isfile(fn)]
+                if compressed:
+                    itemfns[nm] = vals
+                    cfgfns.extend(compressed)
+
+        alldecompfns = self._decompress_many(list(fns) + cfgfns)
+        decompressed = dict(zip(cfgfns, alldecompfns[len(fns):]))
+        if itemfns:
+            overrides = {}
+            for nm, vals in itemfns.items():
+                overrides[nm] = ','.join([decompressed.get(fn) or fn for fn in vals])
+            cfg = cfg._with_values(**overrides)
+        return alldecompfns[:len(fns)], cfg, alldecompfns
+
+    def _decompress_serially(self, fns):
+        decompfns = []
+        try:
+            with self._phase('decompress'):
+                for fn in fns:
+                    decompfns.append(self._try_decompress(fn))
+        except BaseException:
+            self._remove_decompressed(decompfns)
+            raise
+        return decompfns
+
+    def _remove_decompressed(self, decompfns):
+        """
+        Lets go of the files `_try_decompress` returned, removing each once
+        no other run (in any process) is using it, unless `keeptemps` is set,
+        it's in the `framecache`, or `_try_decompress` didn't make it.
+        """
+        from . import utils
+
+        for decompfn in decompfns:
+            if decompfn is None:
+                continue
+            if self.framecache is not None and self.framecache.owns(decompfn):
+                self.framecache.release(decompfn)
+                continue
+            _unhold_decompressed(decompfn)
+            if not getattr(self, 'keeptemps', False):
+                with utils.exclusive_lock(decompfn + _DECOMPRESS_LOCK_SUFFIX):
+                    _remove_marked(decompfn, self._remove_temp)
+
+    def _get_decompressed_fn(self, fn, ext):
+        """
+        Returns where `_try_decompress` puts the decompressed version of `fn`
+        (which ends in `ext`), unless it goes in the scratch space.
+        """
+        import os
+
+        decompfn = os.path.split(fn[:-len(ext)])[1]  # the base file name
+        if self.autodecompress is True:
+            return os.path.join(os.path.split(fn)[0], decompfn)
+        else:
+            # use it as the path to where the decompressed file should go
+            return os.path.join(self.autodecompress, decompfn)
+
+    def _remove_orphaned_temps(self, fns):
+        """
+        Removes the decompressed versions of the inputs `fns` (and any
+        half-written ones) that a run that died partway through may have left
+        outside the scratch space, unless another run is using them or they
+        weren't made by `_try_decompress`.  Those in the scratch space go when
+        it does.
+        """
+        import os
+
+        from . import utils
+
+        if (not self.autodecompress or self.autodecompress == 'tempfile'
+                or self.framecache is not None):
+            return
+        for fn in fns:
+            for ext in utils.fitsextension_to_decompresser:
+                if fn.endswith(ext):
+                    decompfn = self._get_decompressed_fn(fn, ext)
+                    dirnm, basefn = os.path.split(decompfn)
+                    if not os.path.isdir(dirnm or '.'):
+                        continue
+                    with utils.exclusive_lock(decompfn + _DECOMPRESS_LOCK_SUFFIX):
+                        for nm in os.listdir(dirnm or '.'):
+                            if nm.startswith(basefn + '.') and nm.endswith(_DECOMPRESS_TEMP_SUFFIX):
+                                os.remove(os.path.join(dirnm, nm))
+                        if _remove_marked(decompfn) and self.verbose:
+                            print('Removed {0}, left over from an interrupted run'.format(decompfn))
+
+    def run_batch(self, method, jobs, journalfn, max_workers=1, retryfailed=False):
+        """
+        Runs the driver method called `method` (e.g. ``'sextract_single'``)
+        once for each of `jobs`, keeping track of which are done in the journal
+        file `journalfn`, so an interrupted batch can be resumed by calling
+        this again with the same arguments.  See
+        `pyphotwrappers.batch.BatchRunner`.
+
+        Returns (results, errors) like `Sextractor.sextract_many`.
+        """
+        from .batch import BatchRunner
+
+        runner = BatchRunner(self, method, journalfn, retryfailed=retryfailed)
+        return runner.run(jobs, max_workers=max_workers)
+
+    def _get_parallel_method(self, method):
+        """
+        Returns the driver method called `method`, or a version of it that's
+        safe to run in several processes at once (e.g. one that doesn't write
+        to the same raw output files), for `run_batch`.
+        """
+        return getattr(self, method)
+
+    def _copy_for_call(self):
+        """
+        Returns a shallow copy of this object, so the per-run state of an
+        async driver (like the phases it times) stays off this one.  The
+        configuration is shared, since runs only use snapshots of it.
+        """
+        import copy
+
+        return copy.copy(self)
 
 
 class AstromaticConfiguration(object):
@@ -145,6 +1025,10 @@ class AstromaticConfiguration(object):
         of items to values (comments will be empty).
     """
     _config_items = tuple()  # ensures getattr and setattr work right
+    _config_index = {}  # maps item name -> position in _config_items
+    _frozen = False  # True for snapshots
+    _changes = 0  # bumped whenever a value changes
+    _itemcache = None  # (stamp, _ItemTemplate) from _item_template
 
     def __init__(self, config, values=None):
         self._initial_cfgstr = None
@@ -160,43 +1044,21 @@ class AstromaticConfiguration(object):
                 self._config_settings[nm] = config[nm]
                 comments_dict[nm] = ''
             self._comments = AstromaticComments(comments_dict)
+            self._index_items()
 
     def _parse_config_file(self, configstr):
         """
         REPLACES existing config
         """
-        self._config_items = []
-        self._config_settings = {}
-        comments_dict = {}
-        for l in configstr.split('\n'):
-            if not (l.startswith('#') or l.strip() == ''):
-                ls = l.split('#')
-                if len(ls) > 1:
-                    content, comment = ls
-                else:
-                    content = ls[0]
-                    comment = ''
-
-                contentstrip = content.strip()
-                if contentstrip == '':
-                    #it's a continuation from the previous comment
-                    lasti = self._config_items[-1]
-                    comments_dict[lasti] += ' ' + comment.strip()
-                else:
-                    contentsplit = contentstrip.split()
-                    if len(contentsplit) > 1:
-                        nm = contentsplit[0]
-                        val = contentstrip[len(nm):].strip()
-                    elif len(contentsplit) == 1:
-                        nm = contentsplit[0]
-                        val = ''
-                    else:
-                        raise ValueError('Invalid content in config file: ' + str(contentsplit))
+        items, settings, index = _parse_config_string(configstr)
+        self._config_items = items
+        self._config_index = index
+        self._config_settings = dict(settings)
+        self._comments = AstromaticComments(None, configstr)
 
-                    self._config_items.append(nm)
-                    self._config_settings[nm] = val
-                    comments_dict[nm] = comment
-        self._comments = AstromaticComments(comments_dict)
+    def _index_items(self):
+        self._config_items = tuple(self._config_items)
+        self._config_index = dict([(nm, i) for i, nm in enumerate(self._config_items)])
 
     @property
     def names(self):
@@ -213,16 +1075,19 @@ class AstromaticConfiguration(object):
         return '\n'.join([str(i) for i in lines])
 
     def __getattr__(self, name):
-        if name.startswith('_') or name not in self._config_items:
-            # this should always fail in the standard way
-            return object.__getattribute__(self, name)
-        return self._config_settings[name]
+        if name in self._config_index:
+            return self._config_settings[name]
+        # this should always fail in the standard way
+        return object.__getattribute__(self, name)
 
     def __setattr__(self, name, value):
-        if name in self._config_items:
+        if name in self._config_index:
             self[name] = value  # got through setitem to do any special steps
         else:
             object.__setattr__(self, name, value)
+            if name == '_config_settings':
+                # e.g. restoring a backup - anything cached is now stale
+                self._changes += 1
 
     def __dir__(self):
         drs = dir(self.__class__)
@@ -234,8 +1099,11 @@ class AstromaticConfiguration(object):
         return self._config_settings[key]
 
     def __setitem__(self, key, value):
-        if key in self._config_items:
+        if self._frozen:
+            raise TypeError('Configuration snapshots cannot be changed')
+        if key in self._config_index:
             self._config_settings[key] = value
+            self._changes += 1
             if hasattr(value, 'configname'):
                 value.configname = key
         else:
@@ -244,33 +1112,115 @@ class AstromaticConfiguration(object):
     def __len__(self):
         return len(self._config_items)
 
+    def derive(self, **overrides):
+        """
+        Returns a configuration that shares this one's values, except for the
+        items in `overrides` (and anything later set on it), which only it
+        stores.  This is cheap enough to make one per job in a large batch.
+
+        Later changes to this configuration show through in the derived one,
+        unless that item has been overridden there.
+        """
+        derived = AstromaticConfiguration.__new__(AstromaticConfiguration)
+        derived._initial_cfgstr = self._initial_cfgstr
+        derived._config_items = self._config_items
+        derived._config_index = self._config_index
+        derived._config_settings = _LayeredSettings(self)
+        derived._comments = self._comments
+        for nm, val in overrides.items():
+            derived[nm] = val
+        return derived
+
+    def snapshot(self, **overrides):
+        """
+        Returns a frozen copy of this configuration, with the items in
+        `overrides` changed, for a single run of a tool.
+
+        The proxy files in the copy are new objects (whose `source` is the
+        proxy in this configuration), so the temporary files and outputs of
+        the run are not shared with other runs.
+        """
+        return self._derive(overrides, True)
+
+    def _with_values(self, **overrides):
+        """
+        Returns a snapshot like this one (a snapshot itself) with the items in
+        `overrides` changed, but sharing its proxy files, so that a run with
+        it fills in the outputs of this one.
+        """
+        return self._derive(overrides, False)
+
+    def _derive(self, overrides, newproxies):
+        settings = dict(self._config_settings)
+        for nm, val in overrides.items():
+            if nm not in settings:
+                raise KeyError('Invalid config item name ' + str(nm))
+            settings[nm] = val
+        if newproxies:
+            for nm, val in settings.items():
+                if isinstance(val, (ProxyInputFile, ProxyOutputFile)):
+                    settings[nm] = val._for_call(nm)
+
+        snap = AstromaticConfiguration.__new__(AstromaticConfiguration)
+        snap._initial_cfgstr = self._initial_cfgstr
+        snap._config_items = self._config_items
+        snap._config_index = self._config_index
+        snap._config_settings = settings
+        snap._comments = self._comments
+        snap._frozen = True
+        # only the proxies and overridden items differ from this one's values
+        changed = [self._config_index[nm] for nm in overrides]
+        snap._itemcache = (snap._stamp(), self._item_template().updated(settings, changed))
+        return snap
+
+    def _stamp(self):
+        """
+        Returns a value that changes whenever any of this configuration's
+        values (including those it gets from the one it was derived from) do.
+        """
+        if isinstance(self._config_settings, _LayeredSettings):
+            return (self._changes, self._config_settings._base._stamp())
+        return self._changes
+
+    def _item_template(self):
+        """
+        Returns the `_ItemTemplate` for the current values, reusing the last
+        one if nothing has changed since.
+        """
+        stamp = self._stamp()
+        cache = self._itemcache
+        if cache is None or cache[0] != stamp:
+            settings = self._config_settings
+            items = [(nm, settings[nm]) for nm in self._config_items]
+            cache = self._itemcache = (stamp, _ItemTemplate(items, range(len(items))))
+        return cache[1]
+
     def get_normalized_items(self, acceptungenerated=False):
         """
         Returns a list of (name, value) pairs with proxy objects
         replaced with the actual values that should get passed into the
         tool (e.g., temporary file names)
         """
-        elems = []
-        for iname in self._config_items:
-            val = self._config_settings[iname]
+        template = self._item_template()
+        elems = list(template.items)
+        for i in template.specialslots:
+            iname, val = elems[i]
             if isinstance(val, ProxyInputFile):
                 if val.tempfileobj is not None:
-                    elems.append((iname, val.tempfileobj.name))
+                    elems[i] = (iname, val.tempfileobj.name)
                 elif acceptungenerated:
-                    elems.append((iname, 'PROXY INPUT FILE NOT PRESENT'))
+                    elems[i] = (iname, 'PROXY INPUT FILE NOT PRESENT')
                 else:
                     raise ValueError("Item {0} is an input file but the file "
                                      "hasn't been generated!".format(iname))
             elif isinstance(val, ProxyOutputFile):
                 if val.tempfileobj is not None:
-                    elems.append((iname, val.tempfileobj.name))
+                    elems[i] = (iname, val.tempfileobj.name)
                 elif acceptungenerated:
-                    elems.append((iname, 'PROXY OUTPUT FILE NOT PRESENT'))
+                    elems[i] = (iname, 'PROXY OUTPUT FILE NOT PRESENT')
                 else:
                     raise ValueError("Item {0} is an output file but the file "
                                      "hasn't been generated!".format(iname))
-            elif isinstance(val, basestring):
-                elems.append((iname, val))
             else:
                 raise TypeError('Invalid config item ' + str(val))
         return elems
@@ -289,22 +1239,28 @@ class AstromaticConfiguration(object):
         """
         ins = []
         outs = []
-        for iname in self._config_items:
-            val = self._config_settings[iname]
+        template = self._item_template()
+        for i in template.specialslots:
+            val = template.items[i][1]
             if isinstance(val, ProxyInputFile):
                 ins.append(val)
             elif isinstance(val, ProxyOutputFile):
                 outs.append(val)
         return ins, outs
 
-    def get_cmdline_arguments(self, acceptungenerated=False):
+    def get_cmdline_arguments(self, acceptungenerated=False, defaults=None):
         """
         Returns a list of the command line argument items needed to use
         these settings.  To get the actual command line string, do
         ``' '.join(res)`` on the return value
+
+        If `defaults` (a dict mapping names to values) is given, items with
+        the same value as in `defaults` are left out.
         """
         elems = []
         for iname, val in self.get_normalized_items(acceptungenerated=acceptungenerated):
+            if defaults is not None and defaults.get(iname, None) == val:
+                continue
             elems.append('-' + iname)
             elems.append(val)
         return elems
@@ -342,13 +1298,80 @@ class AstromaticConfiguration(object):
         return contents
 
 
-class AstromaticComments(collections.Mapping):
+class _ItemTemplate(object):
+    """
+    A configuration's (name, value) pairs, in order, along with the positions
+    of the values that are not plain strings (i.e. proxies, or invalid), so
+    that normalizing the items only has to look at those.
+    """
+    def __init__(self, items, positions):
+        self.items = items
+        self.specialslots = [i for i in positions if not isinstance(items[i][1], basestring)]
+
+    def updated(self, settings, positions):
+        """
+        Returns a new template with the values at `positions`, and those that
+        are not plain strings, re-read from `settings`.
+        """
+        positions = sorted(set(positions).union(self.specialslots))
+        items = list(self.items)
+        for i in positions:
+            nm = items[i][0]
+            items[i] = (nm, settings[nm])
+        return _ItemTemplate(items, positions)
+
+
+class _LayeredSettings(MutableMapping):
+    """
+    The settings of a configuration made by `AstromaticConfiguration.derive`:
+    the values set on it, on top of the settings of `base`, the configuration
+    it came from.
+    """
+    def __init__(self, base, overrides=None):
+        self._base = base
+        self._overrides = {} if overrides is None else overrides
+
+    def __getitem__(self, key):
+        if key in self._overrides:
+            return self._overrides[key]
+        return self._base._config_settings[key]
+
+    def __setitem__(self, key, value):
+        self._overrides[key] = value
+
+    def __delitem__(self, key):
+        raise TypeError('Configuration items cannot be removed')
+
+    def __contains__(self, key):
+        return key in self._base._config_index
+
+    def __iter__(self):
+        return iter(self._base._config_items)
+
+    def __len__(self):
+        return len(self._base._config_items)
+
+    def copy(self):
+        return _LayeredSettings(self._base, dict(self._overrides))
+
+
+class AstromaticComments(Mapping):
     """
     A very simple class for storing comments that allows attribute-style *OR*
     dict-style access
+
+    If `comment_dict` is None, the comments are parsed out of the config file
+    contents `configstr` the first time they are needed.
     """
-    def __init__(self, comment_dict):
-        self._comment_dict = comment_dict
+    def __init__(self, comment_dict, configstr=None):
+        self._parsed = comment_dict
+        self._configstr = configstr
+
+    @property
+    def _comment_dict(self):
+        if self._parsed is None:
+            self._parsed = _parse_config_comments(self._configstr)
+        return self._parsed
 
     def __getattr__(self, key):
         if key.startswith('_') or key not in self._comment_dict:
@@ -385,11 +1408,27 @@ class ProxyInputFile(object):
     """
     A stand-in for an input file - a temp file will be created during invokation
     of the tool, and then deleted.  The content comes from this object.
+
+    If `fifo` is True, the content is instead streamed to the tool through a
+    named pipe, so it never touches the disk.  Only use this if the tool reads
+    the file straight through exactly once.  None means use the tool's
+    `usefifos` setting.
     """
-    def __init__(self, content):
+    def __init__(self, content, fifo=None):
         self.content = content
         self.configname = None
         self.tempfileobj = None
+        self.fifo = fifo
+        self.source = None
+
+    def _for_call(self, configname):
+        """
+        Returns a copy of this proxy for a configuration snapshot.
+        """
+        proxy = ProxyInputFile(self.content, self.fifo)
+        proxy.configname = configname
+        proxy.source = self
+        return proxy
 
 
 class ProxyOutputFile(object):
@@ -397,11 +1436,28 @@ class ProxyOutputFile(object):
     A stand-in for an output file - a temp file will be created during invokation
     of the tool, and then deleted.  The `content` attribute of this object will
     be populated
+
+    If `fifo` is True, the output is instead streamed back from the tool
+    through a named pipe, unless the tool needs to seek in the file (e.g. FITS
+    catalogs), in which case a temp file is still used.  None means use the
+    tool's `usefifos` setting.
     """
-    def __init__(self):
+    def __init__(self, fifo=None):
         self.content = None
         self.configname = None
         self.tempfileobj = None
+        self.fifo = fifo
+        self.source = None
+
+    def _for_call(self, configname):
+        """
+        Returns a copy of this proxy for a configuration snapshot, which gets
+        the output of that run.
+        """
+        proxy = ProxyOutputFile(self.fifo)
+        proxy.configname = configname
+        proxy.source = self
+        return proxy
 
     def read_ascii(self, *args, **kwargs):
         """
@@ -413,5 +1469,404 @@ class ProxyOutputFile(object):
         return ascii.read(self.content, *args, **kwargs)
 
 
+class InvocationRecord(object):
+    """
+    Resource usage and other information about one run of a tool.
+
+    Times are in seconds, `maxrss` (the peak resident memory of the tool) is
+    in bytes.  The CPU times and `maxrss` are None if they couldn't be
+    measured (e.g. for `AstromaticTool.invoke_async`).  `phases` maps the
+    names of the steps a driver method did around the run (like
+    'decompress' or 'rename') to how long they took.
+    """
+    def __init__(self, argv):
+        import time
+
+        self.argv = argv
+        self.argvlength = sum([len(arg) + 1 for arg in argv])
+        self.starttime = time.time()
+        self.walltime = None
+        self.usertime = None
+        self.systime = None
+        self.maxrss = None
+        self.returncode = None
+        self.timedout = False
+        self.proxybyteswritten = 0
+        self.proxybytesread = 0
+        self.phases = {}
+
+    def set_rusage(self, rusage):
+        """
+        Sets the CPU times and peak memory from a `resource.struct_rusage` of
+        the tool (or does nothing if None).
+        """
+        import sys
+
+        if rusage is not None:
+            self.usertime = rusage.ru_utime
+            self.systime = rusage.ru_stime
+            # linux gives kilobytes, macOS bytes
+            self.maxrss = rusage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+    def as_dict(self):
+        """
+        Returns the record as a dictionary (e.g., for writing out as JSON).
+        """
+        return dict(self.__dict__)
+
+    def __repr__(self):
+        return ('<InvocationRecord of {0}: returncode={1} walltime={2} '
+                'usertime={3} systime={4} maxrss={5}>'.format(
+                    self.argv[0], self.returncode, self.walltime, self.usertime,
+                    self.systime, self.maxrss))
+
+
+class PhaseHook(object):
+    """
+    Base class for objects that want to know about the phases of the work a
+    tool does (for profiling, metrics, etc.), registered with
+    `AstromaticTool.add_phase_hook`.
+
+    The phases are 'proxies' (writing the proxy files), 'run' (the tool
+    itself), 'readback' (reading the output proxies), 'decompress', 'manifest'
+    (checking and writing manifests, see `writemanifests`), 'reprocess'
+    (renaming the outputs, including the 'rename', 'compress' and 'convert'
+    phases within it), for `Sextractor`, 'cache' (looking up and storing
+    results in `Sextractor.resultcache`) and 'wait' (waiting for the next
+    input to be prefetched in `Sextractor.sextract_pipelined`), and for
+    `Swarp`, 'fluxscale' and 'cleanup'.  Phases can nest, and the hooks are
+    called from whatever thread is doing the work.
+    """
+    def before(self, tool, phase):
+        """
+        Called with the tool and phase name just before the phase starts.
+        """
+        pass
+
+    def after(self, tool, phase, elapsed, exc):
+        """
+        Called when the phase is over, with how long it took in seconds and
+        the exception that ended it (or None if it finished normally).
+        """
+        pass
+
+
+class _OutputTail(object):
+    """
+    Keeps the last `maxbytes` bytes worth of lines written to it (or all of
+    them if `maxbytes` is None).
+    """
+    MAX_LINE = 8192  # longer lines are read in pieces, so memory stays bounded
+
+    def __init__(self, maxbytes):
+        import collections
+
+        self.maxbytes = maxbytes
+        self._lines = collections.deque()
+        self._size = 0
+        self._dropped = 0
+
+    def append(self, line):
+        self._lines.append(line)
+        self._size += len(line)
+        if self.maxbytes is not None:
+            while self._size > self.maxbytes and len(self._lines) > 1:
+                dropped = self._lines.popleft()
+                self._size -= len(dropped)
+                self._dropped += len(dropped)
+
+    def getvalue(self):
+        content = ''.join(self._lines)
+        if self._dropped:
+            content = '[... {0} earlier bytes dropped ...]\n'.format(self._dropped) + content
+        return content
+
+
+class _ProxyFifo(object):
+    """
+    A named pipe standing in for a proxy's temp file.  A background thread
+    writes `content` into it (for inputs), or reads what the tool writes (for
+    outputs, if `content` is None).  Has the ``name`` and ``close`` that the
+    proxies expect of their ``tempfileobj``.
+    """
+    def __init__(self, scratch, content=None):
+        import os
+        import threading
+
+        self._dir = scratch.mkdtemp(prefix='proxyfifo')
+        self.name = os.path.join(self._dir, 'fifo')
+        os.mkfifo(self.name)
+
+        self._result = []
+        if content is None:
+            self._thread = threading.Thread(target=self._read)
+        else:
+            self._thread = threading.Thread(target=self._write, args=(content,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _read(self):
+        with open(self.name, 'r') as f:
+            self._result.append(f.read())
+
+    def _write(self, content):
+        try:
+            with open(self.name, 'w') as f:
+                f.write(content)
+        except (IOError, OSError):
+            pass  # the tool closed the pipe without reading everything
+
+    def _unblock(self):
+        """
+        If the tool never opened the pipe, the thread is stuck waiting for it
+        to, so open the pipe from this end to let the thread finish.
+        """
+        import os
+
+        if self._thread.is_alive():
+            # O_RDWR never blocks on a fifo and counts as both ends
+            fd = os.open(self.name, os.O_RDWR | os.O_NONBLOCK)
+            try:
+                self._thread.join(0.1)
+            finally:
+                os.close(fd)
+        self._thread.join()
+
+    def get_content(self):
+        """
+        Returns what the tool wrote to the pipe.  Should only be called after
+        the tool has exited.
+        """
+        self._unblock()
+        return self._result[0] if self._result else ''
+
+    def close(self):
+        import shutil
+
+        if self._dir is not None:
+            self._unblock()
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._dir = None
+
+
 class AstromaticError(Exception):
     pass
+
+
+class AstromaticTimeoutError(AstromaticError):
+    """
+    Raised when a tool is killed for taking longer than its timeout.
+    """
+    pass
+
+
+def _new_session_kwargs():
+    """
+    The `subprocess.Popen` keywords to start the tool in its own process
+    group, so that it and anything it spawns can be killed together.
+    """
+    import os
+    import sys
+
+    if not hasattr(os, 'setsid'):
+        return {}
+    elif sys.version_info[0] < 3:
+        return {'preexec_fn': os.setsid}
+    else:
+        return {'start_new_session': True}
+
+
+# A '#' only starts a comment in a config file at the start of a line or
+# after whitespace, so values can contain them.
+# An item line: its name and value (comments are skipped)
+_CONFIG_ITEM_RE = re.compile(r'^[^\S\n]*([^\s#]\S*)[^\S\n]*(.*?)[^\S\n]*'
+                             r'(?:(?<=[^\S\n])#.*)?$', re.MULTILINE)
+# Any line but a full-line comment: the item name (if any) and the comment
+_CONFIG_COMMENT_RE = re.compile(r'^(?!#)[^\S\n]*(?P<name>[^\s#]\S*)?.*?'
+                                r'(?:(?<=[^\S\n])#(?P<comment>.*))?$', re.MULTILINE)
+
+_PARSED_CONFIGS_MAX = 64
+_parsed_configs = {}  # maps config file contents -> _parse_config_string result
+_parsed_comments = {}  # maps config file contents -> _parse_config_comments result
+
+
+def _remember_parse(cache, configstr, result):
+    if len(cache) >= _PARSED_CONFIGS_MAX:
+        cache.clear()
+    cache[configstr] = result
+    return result
+
+
+def _parse_config_string(configstr):
+    """
+    Parses the item names and values out of the contents of a config file
+    (e.g. a ``-dd`` dump), returning (names, settings, index), with `names` a
+    tuple in file order, `settings` a dict mapping them to their values, and
+    `index` a dict mapping them to their position in `names`.
+
+    Results are remembered, so parsing the same contents again is nearly
+    free.  They are shared, so must not be changed.
+    """
+    result = _parsed_configs.get(configstr, None)
+    if result is None:
+        items = _CONFIG_ITEM_RE.findall(configstr)
+        names = tuple([nm for nm, val in items])
+        index = dict([(nm, i) for i, nm in enumerate(names)])
+        result = _remember_parse(_parsed_configs, configstr, (names, dict(items), index))
+    return result
+
+
+def _parse_config_comments(configstr):
+    """
+    Parses the comments out of the contents of a config file, returning a
+    dict mapping item names to comments (with continuation lines joined on).
+
+    Like `_parse_config_string`, results are remembered and shared.
+    """
+    comments = _parsed_comments.get(configstr, None)
+    if comments is not None:
+        return comments
+
+    comments = {}
+    lastnm = None
+    for match in _CONFIG_COMMENT_RE.finditer(configstr):
+        nm, comment = match.group('name', 'comment')
+        if nm is not None:
+            comments[nm] = '' if comment is None else comment
+            lastnm = nm
+        elif comment is not None:
+            # it's a continuation of the previous item's comment
+            if lastnm is None:
+                raise ValueError('Invalid content in config file: ' + match.group())
+            comments[lastnm] += ' ' + comment.strip()
+    return _remember_parse(_parsed_comments, configstr, comments)
+
+
+_DECOMPRESS_LOCK_SUFFIX = '.lock'
+_DECOMPRESS_TEMP_SUFFIX = '.tmp'
+_DECOMPRESS_MARK_SUFFIX = '.pyphotwrappers'
+_decompressed_holds = {}  # maps decompressed file -> list of open (locked) files
+_decompressed_holds_lock = threading.Lock()
+
+
+def _hold_decompressed(decompfn):
+    """
+    Takes a shared lock on `decompfn` (if it exists) to say a run is using
+    it, until the matching `_unhold_decompressed`.  Returns True if it did.
+    """
+    from .utils import open_with_shared_lock
+
+    f = open_with_shared_lock(decompfn)
+    if f is None:
+        return False
+    with _decompressed_holds_lock:
+        _decompressed_holds.setdefault(decompfn, []).append(f)
+    return True
+
+
+def _remove_marked(decompfn, remove=None):
+    """
+    Removes `decompfn` (like `utils.remove_if_unused`) only if it has the
+    marker file `_try_decompress` leaves next to the files it makes, and then
+    the marker too.  Call with the lock on `decompfn` held.  Returns True if
+    `decompfn` was removed.
+    """
+    import os
+
+    from .utils import remove_if_unused
+
+    markfn = decompfn + _DECOMPRESS_MARK_SUFFIX
+    if not os.path.isfile(markfn):
+        return False  # not ours
+    if not os.path.exists(decompfn):
+        os.remove(markfn)  # left by a run that died before it finished
+        return False
+    if not remove_if_unused(decompfn, remove):
+        return False
+    os.remove(markfn)
+    return True
+
+
+def _unhold_decompressed(decompfn):
+    with _decompressed_holds_lock:
+        held = _decompressed_holds.get(decompfn, [])
+        f = held.pop() if held else None
+        if not held:
+            _decompressed_holds.pop(decompfn, None)
+    if f is not None:
+        f.close()  # also drops the lock
+
+
+_thread_state = threading.local()  # holds the phases being timed in each thread
+
+
+def _records_phases(method):
+    """
+    Decorator for the driver methods of tools, so that the `_phase`s they time
+    end up on the `InvocationRecord` of their run.
+    """
+    import functools
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        oldphases = getattr(_thread_state, 'phases', None)
+        _thread_state.phases = {}
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            _thread_state.phases = oldphases
+    return wrapper
+
+
+def _wait_with_rusage(p):
+    """
+    Waits for the `subprocess.Popen` `p` to finish, setting its
+    ``returncode``, and returns the resource usage of the process (or None if
+    `os.wait4` isn't available).
+    """
+    import os
+
+    if not hasattr(os, 'wait4'):
+        p.wait()
+        return None
+
+    while True:
+        try:
+            pid, status, rusage = os.wait4(p.pid, 0)
+            break
+        except OSError as e:
+            import errno
+            if e.errno == errno.EINTR:
+                continue
+            elif e.errno == errno.ECHILD:
+                # someone else reaped it
+                p.wait()
+                return None
+            raise
+    if os.WIFSIGNALED(status):
+        p.returncode = -os.WTERMSIG(status)
+    else:
+        p.returncode = os.WEXITSTATUS(status)
+    return rusage
+
+
+def _kill_process_group(p, timedout=None):
+    """
+    Kills the process group of the `subprocess.Popen` `p` (which should have
+    been started with `_new_session_kwargs`).  `timedout` is a list that gets
+    True appended, so the caller can tell that this happened.
+    """
+    import os
+    import signal
+
+    if p.returncode is not None:
+        return  # finished just before the timeout
+    if timedout is not None:
+        timedout.append(True)
+    try:
+        if hasattr(os, 'killpg'):
+            os.killpg(p.pid, signal.SIGKILL)
+        else:
+            p.kill()
+    except OSError:
+        pass  # already gone
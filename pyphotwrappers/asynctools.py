@@ -0,0 +1,279 @@
+"""
+`asyncio` versions of the tool invocations and driver methods, for running
+many tools concurrently from one event loop.
+
+These are normally used through the ``*_async`` methods of the tool classes
+(e.g. `AstromaticTool.invoke_async` or `Sextractor.sextract_single_async`).
+This module requires Python 3.5 or later.
+"""
+from __future__ import division, print_function
+
+import asyncio
+import weakref
+
+__all__ = ['get_limiter', 'set_default_limit', 'invoke_tool_async',
+           'sextract_single_async', 'scamp_catalogs_async',
+           'swarp_images_async']
+
+# the number of tools run at once by the default limiter, or None to use one
+# per CPU
+default_limit = None
+
+_limiters = weakref.WeakKeyDictionary()  # maps event loop -> Semaphore
+
+
+def get_limiter(loop=None):
+    """
+    Returns the default concurrency limiter (an `asyncio.Semaphore`) for
+    `loop`, or the running loop if None.
+    """
+    import multiprocessing
+
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    limiter = _limiters.get(loop, None)
+    if limiter is None:
+        limit = default_limit
+        if limit is None:
+            limit = multiprocessing.cpu_count()
+        limiter = _limiters[loop] = asyncio.Semaphore(limit)
+    return limiter
+
+
+def set_default_limit(limit):
+    """
+    Sets how many tools the default limiter lets run at once.  Only affects
+    event loops that haven't used the default limiter yet.
+    """
+    global default_limit
+    default_limit = limit
+    _limiters.clear()
+
+
+async def invoke_tool_async(tool, arguments, validretcodes=[0], useconfig=True,
+                            showoutput=False, limiter=None, outputlimit='default',
+                            timeout=None, cfg=None):
+    """
+    Runs `tool` with the given arguments using
+    `asyncio.create_subprocess_exec`, and returns (stdout, stderr).  See
+    `AstromaticTool._invoke_tool` for the meaning of the arguments.
+    """
+    import sys
+    import time
+
+    from .astromatic import (_OutputTail, _new_session_kwargs, _kill_process_group,
+                             AstromaticTimeoutError)
+
+    if limiter is None:
+        limiter = get_limiter()
+    if outputlimit == 'default':
+        outputlimit = tool.outputlimit
+    if timeout is None:
+        timeout = tool.timeout
+    capture = tool.outputcallback is not None or not showoutput
+
+    if cfg is None and tool.cfg is not None:
+        cfg = tool._snapshot_cfg()
+
+    async with limiter:
+        inproxies, outproxies = tool._get_invocation_proxies(cfg)
+        try:
+            arguments = tool._prepare_invocation(arguments, useconfig, cfg, inproxies, outproxies)
+            # no rusage here: asyncio reaps the child itself
+            record = tool._start_record(arguments, inproxies)
+
+            with tool._phase('run'):
+                if capture:
+                    p = await asyncio.create_subprocess_exec(*arguments,
+                                                             stdout=asyncio.subprocess.PIPE,
+                                                             stderr=asyncio.subprocess.PIPE,
+                                                             **_new_session_kwargs())
+                    outbuf = _OutputTail(outputlimit)
+                    errbuf = _OutputTail(outputlimit)
+                    run = asyncio.gather(
+                        _pump_output(tool, p.stdout, outbuf, 'stdout', sys.stdout if showoutput else None),
+                        _pump_output(tool, p.stderr, errbuf, 'stderr', sys.stderr if showoutput else None),
+                        p.wait())
+                else:
+                    p = await asyncio.create_subprocess_exec(*arguments, **_new_session_kwargs())
+                    run = p.wait()
+
+                try:
+                    await asyncio.wait_for(run, timeout)
+                    timedout = False
+                except asyncio.TimeoutError:
+                    _kill_process_group(p)
+                    await p.wait()
+                    timedout = True
+                except BaseException:
+                    # e.g. the task was cancelled
+                    _kill_process_group(p)
+                    raise
+
+            if capture and not showoutput:
+                stdout = outbuf.getvalue()
+                stderr = errbuf.getvalue()
+            else:
+                stdout = stderr = None
+
+            record.walltime = time.time() - record.starttime
+            record.returncode = p.returncode
+            record.timedout = timedout
+
+            if timedout:
+                msg = 'Running of {0} timed out after {1} secs'.format(tool.execpath, timeout)
+                raise AstromaticTimeoutError(msg, stderr, stdout)
+            tool._finish_invocation(p.returncode, stdout, stderr, validretcodes, outproxies)
+            record.proxybytesread = sum([len(outp.content) for outp in outproxies])
+        finally:
+            tool._cleanup_invocation(inproxies + outproxies)
+
+    return stdout, stderr
+
+
+async def _pump_output(tool, stream, buf, name, echo):
+    """
+    The async version of `AstromaticTool._pump_output`.  Like that, errors
+    from `outputcallback` or `echo` are warned about (once) and otherwise
+    ignored, so the pipe keeps being read.
+    """
+    import codecs
+    from warnings import warn
+
+    from .astromatic import _OutputTail
+
+    decoder = codecs.getincrementaldecoder('utf-8')('replace')
+    partial = ''
+    warned = False
+    while True:
+        chunk = await stream.read(_OutputTail.MAX_LINE)
+        text = partial + decoder.decode(chunk, final=not chunk)
+        lines = text.splitlines(True)
+        partial = ''
+        if chunk and lines and not lines[-1].endswith('\n') and len(lines[-1]) < _OutputTail.MAX_LINE:
+            partial = lines.pop()
+        for line in lines:
+            buf.append(line)
+            try:
+                if echo is not None:
+                    echo.write(line)
+                if tool.outputcallback is not None:
+                    tool.outputcallback(name, line)
+            except Exception as e:
+                if not warned:
+                    warn('Error handling the {0} of {1} (it is still being '
+                         'read): {2!r}'.format(name, tool.execpath, e))
+                    warned = True
+        if not chunk:
+            break
+
+
+async def _in_executor(func, *args):
+    return await asyncio.get_event_loop().run_in_executor(None, func, *args)
+
+
+async def sextract_single_async(sextractor, imgfn, limiter=None, timeout=None):
+    """
+    The coroutine behind `Sextractor.sextract_single_async`.
+    """
+    sex = sextractor._copy_for_call()
+    sex._phases = {}  # the copy is private, so no need to restore it
+
+    cfg = sex._snapshot_cfg()
+    if not sex.overwrite:
+        prevoutputfn = await _in_executor(sex._check_output_exists, [imgfn], cfg)
+        if prevoutputfn:
+            if sex.verbose:
+                print("Output {0} is up to date, not running Sextractor".format(prevoutputfn))
+            return prevoutputfn
+
+    cachekey, cached = await _in_executor(sex._fetch_cached_result, [imgfn], cfg)
+    if not cached:
+        (decompfn,), runcfg, alldecompfns = await _in_executor(sex._decompress_inputs, [imgfn], cfg)
+        try:
+            await invoke_tool_async(sex, [imgfn if decompfn is None else decompfn],
+                                    showoutput=True, limiter=limiter, timeout=timeout,
+                                    cfg=runcfg)
+        finally:
+            await _in_executor(sex._remove_decompressed, alldecompfns)
+        await _in_executor(sex._store_cached_result, cachekey, cfg)
+
+    if sex.renameoutputs:
+        outputmaps = sex.get_renamed_output_fns(mkdirs=True, imgfn=imgfn, cfg=cfg)
+        result = await _in_executor(sex._reprocess_outputs, outputmaps)
+    else:
+        outputmaps = None
+        result = cfg.CATALOG_NAME
+    await _in_executor(sex._record_outputs, [imgfn], cfg, outputmaps)
+    return result
+
+
+async def scamp_catalogs_async(scamp, catfns, limiter=None, timeout=None):
+    """
+    The coroutine behind `Scamp.scamp_catalogs_async`.
+    """
+    scamp = scamp._copy_for_call()
+    scamp._phases = {}  # the copy is private, so no need to restore it
+
+    if isinstance(catfns, str):
+        catfns = [catfns]
+
+    cfg = scamp._snapshot_cfg()
+    if not scamp.overwrite:
+        prevoutputheads = await _in_executor(scamp._check_outputs_current, catfns, cfg)
+        if prevoutputheads:
+            if scamp.verbose:
+                print("Outputs {0} are up to date, not running Scamp".format(prevoutputheads))
+            return prevoutputheads
+
+    arguments, listfn = scamp._input_arguments(catfns)
+    try:
+        await invoke_tool_async(scamp, arguments, showoutput=True, limiter=limiter,
+                                timeout=timeout, cfg=cfg)
+    finally:
+        if listfn is not None:
+            scamp._remove_temp(listfn)
+
+    if scamp.renameoutputs:
+        await _in_executor(scamp._reprocess_outputs, catfns, cfg)
+    await _in_executor(scamp._record_outputs, catfns, cfg)
+
+    return scamp._check_output_exists(catfns)
+
+
+async def swarp_images_async(swarp, imgfns, headfns=None, weightfns=None,
+                             limiter=None, timeout=None):
+    """
+    The coroutine behind `Swarp.swarp_images_async`.
+    """
+    swarp = swarp._copy_for_call()
+    swarp._phases = {}  # the copy is private, so no need to restore it
+
+    imgfns, headfns, weightfns = swarp._check_inputs(imgfns, headfns, weightfns)
+    inputfns, desccfg = swarp._get_run_description(imgfns, headfns, weightfns)
+
+    if not swarp.overwrite:
+        if await _in_executor(swarp._manifest_is_current, desccfg.IMAGEOUT_NAME, inputfns, desccfg):
+            print("Swarp output file {0} is up to date, not running Swarp.".format(desccfg.IMAGEOUT_NAME))
+            return
+
+    infns, weightfns, decompfns = await _in_executor(swarp._decompress_images, imgfns, weightfns)
+    infns, links = swarp._determine_links(infns, headfns, weightfns)
+    listfn = None
+
+    try:
+        overrides = {'WEIGHT_IMAGE': ''}
+        if swarp.fluxscalebytexp:
+            overrides['FSCALE_DEFAULT'] = await _in_executor(swarp._fscales_from_texp, infns)
+
+        swarp._make_links(links)
+
+        arguments, listfn = swarp._input_arguments(infns)
+        await invoke_tool_async(swarp, arguments, showoutput=True, limiter=limiter,
+                                timeout=timeout, cfg=swarp._snapshot_cfg(**overrides))
+    finally:
+        if listfn is not None:
+            swarp._remove_temp(listfn)
+        await _in_executor(swarp._cleanup_temps, decompfns, links)
+    await _in_executor(swarp._record_outputs, inputfns, desccfg)
+
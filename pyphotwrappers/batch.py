@@ -0,0 +1,442 @@
+"""
+Resumable batch runs of the driver methods, with a write-ahead journal of job
+states so that a batch that dies partway through can pick up where it left
+off.
+"""
+from __future__ import division, print_function
+
+import os
+
+try:
+    basestring
+except NameError:  # Python 3
+    basestring = str
+
+__all__ = ['BatchRunner', 'JobJournal', 'WatchedPool']
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobJournal(object):
+    """
+    An append-only file of job state changes, one JSON object per line.
+
+    Each change is flushed to disk before `record` returns, so after a crash
+    the journal shows every job that was started, and which of those had
+    finished.  A line left incomplete by a crash is ignored when the journal
+    is read back.
+
+    Parameters
+    ----------
+    fn : str
+        The journal file (created if it doesn't exist).
+    """
+    def __init__(self, fn):
+        self.fn = fn
+        self._f = None
+
+    def open(self):
+        """
+        Opens the journal for appending, taking a lock on it so that only one
+        batch uses it at a time.  Raises `RuntimeError` if another process
+        has it.
+        """
+        import fcntl
+
+        f = open(self.fn, 'a')
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            f.close()
+            raise RuntimeError('The journal {0} is in use by another batch'.format(self.fn))
+        self._f = f
+
+        # end a line torn by a crash, so the next entry isn't joined onto it
+        if os.path.getsize(self.fn) > 0:
+            with open(self.fn, 'rb') as g:
+                g.seek(-1, os.SEEK_END)
+                torn = g.read(1) != b'\n'
+            if torn:
+                f.write('\n')
+                f.flush()
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()  # also releases the lock
+            self._f = None
+
+    def read(self):
+        """
+        Returns a dict mapping the id of each job in the journal to the last
+        entry recorded for it (a dict with at least 'job' and 'state').
+        """
+        import json
+
+        latest = {}
+        if not os.path.isfile(self.fn):
+            return latest
+        with open(self.fn, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    latest[entry['job']] = entry
+                except (ValueError, KeyError, TypeError):
+                    pass  # torn by a crash in the middle of a write
+        return latest
+
+    def record(self, jobids, state, **info):
+        """
+        Appends an entry saying each of `jobids` (one id or a list of them)
+        is now in `state`, with any extra `info`, and makes sure it's on disk.
+        """
+        import json
+        import time
+
+        if isinstance(jobids, basestring):
+            jobids = [jobids]
+        lines = []
+        for jobid in jobids:
+            entry = dict(info)
+            entry.update({'job': jobid, 'state': state, 'time': time.time()})
+            lines.append(json.dumps(entry, sort_keys=True) + '\n')
+        self._f.write(''.join(lines))
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+
+class BatchRunner(object):
+    """
+    Runs a driver method of a tool (e.g. `Sextractor.sextract_single`) on
+    many inputs, keeping a `JobJournal` of each job's state (queued, running,
+    done or failed).
+
+    Running the same jobs with the same journal again resumes the batch: jobs
+    the journal shows are done are skipped, and jobs that were running when
+    the batch died are cleaned up after (see
+    `AstromaticTool._remove_orphaned_temps`) and run again.  So at most the
+    jobs that were in flight are lost.
+
+    Parameters
+    ----------
+    tool : `AstromaticTool`
+        The tool to run (copied to each worker process).
+    method : str
+        The name of the driver method of `tool` to call for each job.
+    journalfn : str
+        The journal file.
+    retryfailed : bool, optional
+        If True, jobs the journal shows failed are run again, otherwise they
+        are left failed.
+    """
+    def __init__(self, tool, method, journalfn, retryfailed=False):
+        if not callable(getattr(tool, method, None)):
+            raise ValueError('{0} has no method {1}'.format(type(tool).__name__, method))
+        self.tool = tool
+        self.method = method
+        self.journal = JobJournal(journalfn)
+        self.retryfailed = retryfailed
+
+    def run(self, jobs, max_workers=1):
+        """
+        Runs the jobs that aren't done yet.
+
+        Parameters
+        ----------
+        jobs : list
+            The arguments for each call of the method: a tuple of arguments,
+            or anything else as the only argument.  Jobs are identified by
+            their arguments, so they must be JSON-serializable.
+        max_workers : int or None, optional
+            The number of worker processes to use, or None to use one per CPU.
+            If 1, the jobs are run serially in this process.  Jobs run at
+            once must not write the same output files (e.g. for
+            ``sextract_single``, use `renameoutputs` or a proxy catalog, as
+            for `Sextractor.sextract_many`).
+
+        Returns
+        -------
+        results : list
+            What the method returned for each job (in the same order), or None
+            if it failed.  For jobs done in an earlier run, this is what was
+            recorded in the journal (None unless it was a file name).
+        errors : list
+            The exception raised for each job (or a description of it, for
+            jobs that failed in an earlier run), or None if it succeeded.
+        """
+        import multiprocessing
+
+        jobargs = [job if isinstance(job, tuple) else (job,) for job in jobs]
+        jobids = [_job_id(args) for args in jobargs]
+        results = [None] * len(jobs)
+        errors = [None] * len(jobs)
+
+        self.journal.open()
+        try:
+            previous = self.journal.read()
+            self._cleanup_interrupted(previous, jobids, jobargs)
+
+            todo = []
+            for i, jobid in enumerate(jobids):
+                entry = previous.get(jobid, None)
+                state = None if entry is None else entry['state']
+                if state == DONE:
+                    results[i] = entry.get('result', None)
+                elif state == FAILED and not self.retryfailed:
+                    errors[i] = entry.get('error', 'failed')
+                else:
+                    todo.append(i)
+            newids = [jobids[i] for i in todo if jobids[i] not in previous]
+            if newids:
+                self.journal.record(newids, QUEUED)
+            if self.tool.verbose:
+                print('Batch of {0} jobs: {1} to run'.format(len(jobs), len(todo)))
+
+            if max_workers is None:
+                max_workers = multiprocessing.cpu_count()
+            max_workers = min(max_workers, len(todo))
+            if max_workers <= 1:
+                self._run_serial(todo, jobids, jobargs, results, errors)
+            else:
+                self._run_pool(todo, jobids, jobargs, results, errors, max_workers)
+        finally:
+            self.journal.close()
+
+        return results, errors
+
+    def _cleanup_interrupted(self, previous, jobids, jobargs):
+        """
+        Cleans up after the jobs the journal shows were running when the last
+        batch died.
+        """
+        from .scratch import _remove_stale_dirs
+
+        interrupted = [args for jobid, args in zip(jobids, jobargs)
+                       if jobid in previous and previous[jobid]['state'] == RUNNING]
+        if not interrupted:
+            return
+
+        # scratch directories of dead processes (e.g. decompressed inputs)
+        scratch = self.tool._get_scratch()
+        for dirnm in (scratch.ramdir, scratch.diskdir):
+            if dirnm is not None:
+                _remove_stale_dirs(os.path.dirname(dirnm))
+        for args in interrupted:
+            self.tool._remove_orphaned_temps(_job_fns(args))
+
+    def _run_serial(self, todo, jobids, jobargs, results, errors):
+        for i in todo:
+            self.journal.record(jobids[i], RUNNING)
+            try:
+                result = getattr(self.tool, self.method)(*jobargs[i])
+            except Exception as e:
+                errors[i] = e
+                self.journal.record(jobids[i], FAILED, error=repr(e))
+            else:
+                results[i] = result
+                self.journal.record(jobids[i], DONE, result=_result_for_journal(result))
+
+    def _run_pool(self, todo, jobids, jobargs, results, errors, max_workers):
+        """
+        Runs the jobs in a pool of worker processes, with no more than
+        `max_workers` handed out at once, so that the journal's "running" jobs
+        are the ones actually in flight.
+        """
+        pool = WatchedPool(max_workers, _batch_init, (self.tool, self.method))
+        try:
+            pending = list(reversed(todo))
+            nrunning = 0
+            while pending or nrunning:
+                while pending and nrunning < max_workers:
+                    i = pending.pop()
+                    self.journal.record(jobids[i], RUNNING)
+                    pool.submit(i, _batch_worker, jobargs[i])
+                    nrunning += 1
+                i, result, error = pool.next_finished()
+                nrunning -= 1
+                if error is None:
+                    results[i] = result
+                    self.journal.record(jobids[i], DONE, result=_result_for_journal(result))
+                else:
+                    errors[i] = error
+                    self.journal.record(jobids[i], FAILED, error=repr(error))
+        finally:
+            pool.close()
+
+
+class WatchedPool(object):
+    """
+    A `multiprocessing.Pool` for running jobs one call at a time, that
+    notices when a worker process dies in the middle of a job (e.g. killed
+    for running out of memory).  A plain pool would wait for that job
+    forever.  The job is reported as failed with a `RuntimeError`, and the
+    pool starts a new worker in its place.
+
+    Parameters
+    ----------
+    processes : int
+        The number of worker processes.
+    initializer, initargs
+        As for `multiprocessing.Pool`.
+    """
+    # how often (in seconds) to check for dead workers while waiting
+    checkinterval = 0.5
+
+    def __init__(self, processes, initializer=None, initargs=()):
+        import multiprocessing
+
+        try:
+            import queue
+        except ImportError:  # Python 2
+            import Queue as queue
+        try:
+            from multiprocessing import SimpleQueue
+        except ImportError:  # Python 2
+            from multiprocessing.queues import SimpleQueue
+
+        self._queue_empty = queue.Empty
+        # unlike a `multiprocessing.Queue`, this sends right away, so a job's
+        # worker is known even if it dies straight after starting it
+        self._started = SimpleQueue()
+        self._finished = queue.Queue()
+        self._running = {}  # maps job id -> pid of its worker (None until known)
+        self._lost = False
+        self.pool = multiprocessing.Pool(processes, _watched_init,
+                                         (self._started, initializer, initargs))
+
+    def submit(self, i, func, args):
+        """
+        Starts running ``func(*args)`` (which must be picklable, e.g. a
+        module-level function) as the job with id `i`.
+        """
+        import sys
+
+        kwargs = {}
+        if sys.version_info[0] >= 3:
+            kwargs['error_callback'] = _ErrorReporter(self._finished, i)
+        self._running[i] = None
+        self.pool.apply_async(_watched_call, (i, func, args), callback=self._finished.put, **kwargs)
+
+    def next_finished(self):
+        """
+        Waits for a job to finish, returning (id, result, error), where
+        `error` is the exception it raised, or None if it succeeded.
+        """
+        while True:
+            try:
+                i, result, error = self._finished.get(timeout=self.checkinterval)
+            except self._queue_empty:
+                self._check_workers()
+                continue
+            if i in self._running:  # i.e., not already reported lost
+                del self._running[i]
+                return i, result, error
+
+    def close(self):
+        if self._lost:
+            # a lost job would keep a plain close waiting for it forever
+            self.pool.terminate()
+        else:
+            self.pool.close()
+        self.pool.join()
+
+    def _check_workers(self):
+        while not self._started.empty():
+            i, pid = self._started.get()
+            if i in self._running:
+                self._running[i] = pid
+        for i, pid in list(self._running.items()):
+            if pid is not None and not _process_exists(pid):
+                self._lost = True
+                self._finished.put((i, None, RuntimeError(
+                    'The worker process running job {0} died (e.g. killed for '
+                    'using too much memory)'.format(i))))
+                self._running[i] = None  # only report it once
+
+
+class _ErrorReporter(object):
+    def __init__(self, finished, i):
+        self.finished = finished
+        self.i = i
+
+    def __call__(self, error):
+        self.finished.put((self.i, None, error))
+
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        import errno
+
+        return e.errno != errno.ESRCH
+    return True
+
+
+def _job_id(args):
+    import json
+
+    return json.dumps(list(args), sort_keys=True)
+
+
+def _job_fns(args):
+    """
+    Returns the file names among the arguments of a job (including those in
+    lists).
+    """
+    fns = []
+    for arg in args:
+        if isinstance(arg, basestring):
+            fns.append(arg)
+        elif isinstance(arg, (list, tuple)):
+            fns.extend([fn for fn in arg if isinstance(fn, basestring)])
+    return fns
+
+
+def _result_for_journal(result):
+    return result if isinstance(result, basestring) else None
+
+
+#state for the worker processes of `WatchedPool`
+_watched_started = None
+
+
+def _watched_init(started, initializer, initargs):
+    global _watched_started
+    _watched_started = started
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _watched_call(i, func, args):
+    import pickle
+
+    _watched_started.put((i, os.getpid()))
+    try:
+        result = func(*args)
+        # a result that can't be pickled would otherwise be lost on the way
+        # back (with no error_callback on Python 2)
+        pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+    except Exception as e:
+        return i, None, e
+    return i, result, None
+
+
+#state for the worker processes of `BatchRunner`
+_batch_func = None
+
+
+def _batch_init(tool, method):
+    global _batch_func
+    _batch_func = tool._get_parallel_method(method)
+
+
+def _batch_worker(*args):
+    from .astromatic import ProxyOutputFile
+
+    result = _batch_func(*args)
+    if isinstance(result, ProxyOutputFile):
+        result.source = None  # no need to send the tool's own proxy back too
+    return result
@@ -4,6 +4,14 @@
 
 from astropy.tests.pytest_plugins import *
 
+import sys
+
+# asynctools uses async/await syntax, so it can't even be imported (e.g. by
+# doctest collection) before Python 3.5
+collect_ignore = []
+if sys.version_info < (3, 5):
+    collect_ignore.append('asynctools.py')
+
 ## Uncomment the following line to treat all DeprecationWarnings as
 ## exceptions
 # enable_deprecations_as_exceptions()
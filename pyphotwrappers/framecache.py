@@ -0,0 +1,171 @@
+"""
+A cache of decompressed FITS frames on local disk, shared by the tools in a
+process and by all the processes that use the same directory, so that a
+compressed frame is only decompressed once however many runs read it.
+"""
+from __future__ import division, print_function
+
+import os
+
+from .utils import LRUDirectoryCache, exclusive_lock, open_with_shared_lock
+
+__all__ = ['FrameCache']
+
+
+class FrameCache(LRUDirectoryCache):
+    """
+    Stores decompressed versions of compressed frames, keyed by the name,
+    size and modification time of the compressed file, and evicts the least
+    recently used ones once they take up more than `maxbytes`.
+
+    Frames are reference counted: `acquire` gives the name of the
+    decompressed frame and holds a shared lock (`fcntl.flock`) on it until
+    the matching `release`, and frames are only evicted if nobody holds them
+    (so while many are in use, the cache can be bigger than `maxbytes`).
+    The locks go away with the process that held them, so a crash never pins
+    a frame.  Each frame is decompressed under a temporary name and renamed
+    into place, with a lock per frame so only one process decompresses it.
+
+    Parameters
+    ----------
+    path : str or None, optional
+        The cache directory, or None for ``~/.pyphotwrappers/framecache``.
+    maxbytes : int, optional
+        The size the frames may add up to before old ones are evicted.
+    """
+    def __init__(self, path=None, maxbytes=20 * 1024 ** 3):
+        if path is None:
+            path = os.path.join(os.path.expanduser('~'), '.pyphotwrappers', 'framecache')
+        super(FrameCache, self).__init__(path, maxbytes)
+        self._init_holds()
+
+    def _init_holds(self):
+        import threading
+
+        self._held = {}  # maps frame name -> list of open (locked) files
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # the holds belong to this process
+        state = self.__dict__.copy()
+        del state['_held']
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_holds()
+
+    def key(self, fn):
+        """
+        Returns the key of the compressed file `fn`.
+        """
+        import hashlib
+
+        st = os.stat(fn)
+        desc = '{0}\0{1}\0{2!r}'.format(os.path.abspath(fn), st.st_size, st.st_mtime)
+        return hashlib.sha1(desc.encode('utf-8')).hexdigest()
+
+    def acquire(self, fn, decompress, decompfn):
+        """
+        Returns the name of the decompressed version of `fn`, calling
+        ``decompress(fn, outfn)`` to make it if it isn't cached, and holds it
+        until `release` is called with that name.  `decompfn` is the base name
+        the decompressed file should have.
+        """
+        key = self.key(fn)
+        entrydir = os.path.join(self.path, key)
+        framefn = os.path.join(entrydir, decompfn)
+        while True:
+            f = open_with_shared_lock(framefn)
+            if f is None:
+                self._add_frame(fn, decompress, entrydir, decompfn)
+                continue
+            with self._lock:
+                self._held.setdefault(framefn, []).append(f)
+            try:
+                os.utime(entrydir, None)  # i.e., just used
+            except OSError:
+                pass
+            return framefn
+
+    def release(self, framefn):
+        """
+        Lets go of a frame returned by `acquire`.
+        """
+        with self._lock:
+            held = self._held.get(framefn, [])
+            f = held.pop() if held else None
+            if not held:
+                self._held.pop(framefn, None)
+        if f is not None:
+            f.close()  # also drops the lock
+
+    def owns(self, fn):
+        """
+        Determines if `fn` is a frame in this cache.
+        """
+        entrydir = os.path.dirname(os.path.dirname(os.path.abspath(fn)))
+        return entrydir == os.path.abspath(self.path)
+
+    def evict(self, maxbytes=None):
+        """
+        Removes the least recently used frames that nobody holds until the
+        rest add up to no more than `maxbytes` (None means the `maxbytes`
+        attribute).
+        """
+        super(FrameCache, self).evict(maxbytes)
+
+    def _add_frame(self, fn, decompress, entrydir, decompfn):
+        """
+        Decompresses `fn` into a new entry, unless another process or thread
+        does it first.
+        """
+        import shutil
+
+        self._make_dir()
+        with exclusive_lock(entrydir + self.LOCK_SUFFIX):
+            if os.path.isfile(os.path.join(entrydir, decompfn)):
+                return  # someone else just did it
+
+            # make room first, so the frame never pushes out itself
+            self.evict(self.maxbytes - _estimate_size(fn))
+
+            tmpdir = self._make_temp_dir()
+            try:
+                decompress(fn, os.path.join(tmpdir, decompfn))
+                if os.path.isdir(entrydir):
+                    self._remove_entry(entrydir)  # e.g. under another name
+                os.rename(tmpdir, entrydir)
+            except BaseException:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+                raise
+
+    def _remove_entry(self, entrydir):
+        """
+        Removes an entry if nobody holds its frame.  Returns True if it was
+        removed.
+        """
+        import fcntl
+
+        files = []
+        try:
+            for nm in os.listdir(entrydir):
+                f = open(os.path.join(entrydir, nm), 'rb')
+                files.append(f)
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except (IOError, OSError):
+                    return False  # in use
+            return super(FrameCache, self)._remove_entry(entrydir)
+        except (IOError, OSError):
+            return False  # e.g. already gone
+        finally:
+            for f in files:
+                f.close()
+
+
+def _estimate_size(fn):
+    from .utils import estimate_decompressed_size
+
+    return estimate_decompressed_size(fn)
@@ -0,0 +1,119 @@
+"""
+Run manifests: sidecar files recording what went into a run of a tool and
+what came out of it, so that a later run can tell whether the outputs are
+still up to date.
+"""
+from __future__ import division, print_function
+
+import os
+
+__all__ = ['RunManifest', 'manifest_fn']
+
+MANIFEST_SUFFIX = '.manifest.json'
+
+
+def manifest_fn(outfn):
+    """
+    Returns the name of the manifest for a run whose main output is `outfn`.
+    """
+    return outfn + MANIFEST_SUFFIX
+
+
+class RunManifest(object):
+    """
+    The inputs, settings and outputs of a completed run of a tool.
+
+    Files are recorded by their size and modification time, so writing and
+    checking a manifest is just a `stat` per file.  A file counts as
+    unchanged if both match, so one that was copied or touched makes the run
+    out of date even if its contents are the same.
+
+    Parameters
+    ----------
+    settings : str
+        A hash of everything other than the input files that went into the
+        run (e.g. the configuration and the tool version).
+    inputs : dict
+        Maps the (absolute) names of the input files to their states, as
+        returned by `file_state`.
+    outputs : dict
+        Like `inputs`, for the output files.
+    """
+    def __init__(self, settings, inputs, outputs):
+        self.settings = settings
+        self.inputs = inputs
+        self.outputs = outputs
+
+    @classmethod
+    def from_run(cls, settings, inputfns, outputfns):
+        """
+        Makes the manifest for a run that just finished, from the names of
+        its input and output files.
+        """
+        inputs = dict([(os.path.abspath(fn), file_state(fn)) for fn in inputfns])
+        outputs = dict([(os.path.abspath(fn), file_state(fn)) for fn in outputfns])
+        return cls(settings, inputs, outputs)
+
+    @classmethod
+    def load(cls, fn):
+        """
+        Reads a manifest written by `save`, or returns None if `fn` is
+        missing or isn't a valid manifest.
+        """
+        import json
+
+        try:
+            with open(fn, 'r') as f:
+                dct = json.load(f)
+            return cls(dct['settings'], dct['inputs'], dct['outputs'])
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def save(self, fn):
+        """
+        Writes the manifest to `fn`, atomically (so a crash never leaves a
+        partial manifest behind).
+        """
+        import json
+
+        tmpfn = '{0}.{1}.tmp'.format(fn, os.getpid())
+        with open(tmpfn, 'w') as f:
+            json.dump({'settings': self.settings, 'inputs': self.inputs,
+                       'outputs': self.outputs}, f, indent=1, sort_keys=True)
+        os.rename(tmpfn, fn)
+
+    def is_current(self, settings, inputfns):
+        """
+        Determines if this manifest describes a run with `settings` on the
+        input files `inputfns` as they are now, with all of its outputs still
+        as it left them.
+        """
+        if settings != self.settings:
+            return False
+        if set([os.path.abspath(fn) for fn in inputfns]) != set(self.inputs):
+            return False
+        for states in (self.inputs, self.outputs):
+            for fn, state in states.items():
+                if not file_matches(fn, state):
+                    return False
+        return True
+
+
+def file_state(fn):
+    """
+    Returns a dict with the size and modification time of the file `fn`.
+    """
+    st = os.stat(fn)
+    return {'size': st.st_size, 'mtime': st.st_mtime}
+
+
+def file_matches(fn, state):
+    """
+    Determines if the file `fn` is (still) the one described by `state` (from
+    `file_state`).
+    """
+    try:
+        st = os.stat(fn)
+    except OSError:
+        return False
+    return st.st_size == state['size'] and st.st_mtime == state['mtime']
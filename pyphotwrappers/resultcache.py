@@ -0,0 +1,115 @@
+"""
+A content-addressed cache of the output files of tool runs on local disk, so
+that a run identical to an earlier one can be skipped.
+"""
+from __future__ import division, print_function
+
+import os
+
+from .utils import LRUDirectoryCache, file_sha1, hash_strings, _dir_size
+
+__all__ = ['ResultCache']
+
+
+class ResultCache(LRUDirectoryCache):
+    """
+    Stores the output files of tool runs under a key that describes everything
+    that went into the run, and evicts the least recently used entries once
+    they take up more than `maxbytes`.
+
+    Each entry is a directory that is written under a temporary name and then
+    renamed into place, so several processes can share the cache without ever
+    seeing partial entries.
+
+    Parameters
+    ----------
+    path : str or None, optional
+        The cache directory, or None for ``~/.pyphotwrappers/resultcache``.
+    maxbytes : int, optional
+        The size the entries may add up to before old ones are evicted.
+    fastfingerprints : bool, optional
+        If True, `fingerprint` identifies input files by their path, size and
+        modification time instead of by hashing their contents.
+    """
+    def __init__(self, path=None, maxbytes=10 * 1024 ** 3, fastfingerprints=False):
+        if path is None:
+            path = os.path.join(os.path.expanduser('~'), '.pyphotwrappers', 'resultcache')
+        super(ResultCache, self).__init__(path, maxbytes)
+        self.fastfingerprints = fastfingerprints
+        self._total = None  # bytes in the cache, as of the last scan plus puts since
+
+    def fingerprint(self, fn):
+        """
+        Returns a string that changes whenever the contents of the file `fn`
+        do (see `fastfingerprints`).
+        """
+        if self.fastfingerprints:
+            st = os.stat(fn)
+            return 'stat:{0}:{1}:{2!r}'.format(os.path.abspath(fn), st.st_size, st.st_mtime)
+        return 'sha1:' + file_sha1(fn)
+
+    def make_key(self, parts):
+        """
+        Returns the key for a run described by `parts` (a sequence of
+        strings).
+        """
+        return hash_strings(parts)
+
+    def get(self, key):
+        """
+        Returns a dict mapping the names of the files stored for `key` to
+        their paths in the cache, or None if there's no such entry.  The entry
+        counts as just used.
+        """
+        entrydir = os.path.join(self.path, key)
+        try:
+            names = os.listdir(entrydir)
+            os.utime(entrydir, None)
+        except OSError:
+            return None
+        return dict([(nm, os.path.join(entrydir, nm)) for nm in names])
+
+    def put(self, key, files, contents=None):
+        """
+        Stores the entry for `key` (replacing any existing one), made of
+        copies of `files` (a dict mapping names to the paths of the files) and
+        the strings in `contents` (a dict mapping names to text), then evicts
+        old entries if the cache is too big.
+        """
+        import shutil
+
+        tmpdir = self._make_temp_dir()
+        try:
+            for nm, fn in files.items():
+                shutil.copyfile(fn, os.path.join(tmpdir, nm))
+            for nm, content in (contents or {}).items():
+                with open(os.path.join(tmpdir, nm), 'w') as f:
+                    f.write(content)
+            nbytes = _dir_size(tmpdir)
+
+            entrydir = os.path.join(self.path, key)
+            if os.path.isdir(entrydir):
+                self._remove_entry(entrydir)
+            try:
+                os.rename(tmpdir, entrydir)
+            except OSError:
+                # someone else just stored the same entry
+                shutil.rmtree(tmpdir, ignore_errors=True)
+                return
+        except BaseException:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+            raise
+
+        if self._total is None:
+            self._total = self.size()
+        else:
+            self._total += nbytes
+        if self._total > self.maxbytes:
+            self.evict()
+
+    def evict(self, maxbytes=None):
+        """
+        Removes the least recently used entries until the rest add up to no
+        more than `maxbytes` (None means the `maxbytes` attribute).
+        """
+        self._total = super(ResultCache, self).evict(maxbytes)
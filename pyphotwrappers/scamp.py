@@ -1,8 +1,14 @@
 from __future__ import division, print_function
 
 from .astromatic import *
+from .astromatic import _records_phases
 from . import utils
 
+try:
+    basestring
+except NameError:  # Python 3
+    basestring = str
+
 __all__ = ['Scamp']
 
 
@@ -27,11 +33,14 @@ class Scamp(AstromaticTool):
         `pstopdf`.
     overwrite : bool, optional
         If True, will overwrite the output header files even if they already
-        exist.
+        exist.  If False, a run is skipped if the manifest next to the first
+        header shows it's up to date (see `writemanifests`).
     verbose : bool, optional
         If True, diagnostic information will be printed while running.
     """
     defaultexecname = 'scamp'
+    acceptslistfiles = True
+    _OUTPUT_NAME_ITEMS = ('XML_NAME', 'CHECKPLOT_NAME', 'MERGEDOUTCAT_NAME', 'FULLOUTCAT_NAME')
 
     def __init__(self, execpath=None, renameoutputs=None, checkplotpath=None,
                  pstopdf=True, overwrite=True, verbose=False):
@@ -41,42 +50,66 @@ class Scamp(AstromaticTool):
         self.pstopdf = pstopdf
         self.overwrite = overwrite
 
-    def scamp_catalogs(self, catfns):
-        """
-        Runs scamp on the given `catfns`
+    @_records_phases
+    def scamp_catalogs(self, catfns, timeout=None):
         """
-        from warnings import warn
+        Runs scamp on the given `catfns`.  If it takes longer than `timeout`
+        seconds (None means the `timeout` attribute), it is killed and an
+        `AstromaticTimeoutError` is raised.
 
+        If there are many catalogs, they are passed in a list file (see
+        `listfilethreshold`).
+        """
         if isinstance(catfns, basestring):
             catfns = [catfns]
 
+        cfg = self._snapshot_cfg()
         if not self.overwrite:
-            prevoutputheads = self._check_output_exists(catfns)
+            prevoutputheads = self._check_outputs_current(catfns, cfg)
             if prevoutputheads:
                 if self.verbose:
-                    print("Outputs {0} already exist, not running Scamp".format(prevoutputheads))
+                    print("Outputs {0} are up to date, not running Scamp".format(prevoutputheads))
                 return prevoutputheads
 
-        initialcpdev = self.cfg.CHECKPLOT_DEV
+        arguments, listfn = self._input_arguments(catfns)
         try:
-            if self.pstopdf and self._CP_DEV_TO_EXT[self.cfg.CHECKPLOT_DEV] != '.ps':
-                warn('CHECKPLOT_DEV is not a postscript output, but ps->pdf '
-                     'conversion was requested.  Changing to "PSC".')
-                self.cfg.CHECKPLOT_DEV = 'PSC'
-            self._invoke_tool(catfns, showoutput=True)
+            self._invoke_tool(arguments, showoutput=True, timeout=timeout, cfg=cfg)
         finally:
-            self.cfg.CHECKPLOT_DEV = initialcpdev
+            if listfn is not None:
+                self._remove_temp(listfn)
 
         self.lastcats = catfns
 
         if self.renameoutputs:
-            self._reprocess_outputs()
+            self._reprocess_outputs(catfns, cfg)
+        self._record_outputs(catfns, cfg)
 
         return self._check_output_exists(catfns)
 
+    def scamp_catalogs_async(self, catfns, limiter=None, timeout=None):
+        """
+        An `asyncio` counterpart to `scamp_catalogs`: returns a coroutine that
+        runs scamp on a snapshot of this object's configuration.
+
+        `limiter` is as for `invoke_async`.
+        """
+        from .asynctools import scamp_catalogs_async
+
+        return scamp_catalogs_async(self, catfns, limiter, timeout)
+
+    def _snapshot_cfg(self, **overrides):
+        from warnings import warn
+
+        cpdev = overrides.get('CHECKPLOT_DEV', self.cfg.CHECKPLOT_DEV)
+        if self.pstopdf and self._CP_DEV_TO_EXT[cpdev] != '.ps':
+            warn('CHECKPLOT_DEV is not a postscript output, but ps->pdf '
+                 'conversion was requested.  Changing to "PSC".')
+            overrides['CHECKPLOT_DEV'] = 'PSC'
+        return super(Scamp, self)._snapshot_cfg(**overrides)
+
     def set_ahead_from_dict(self, dct):
         headlns = []
-        for k, v in dct.iteritems():
+        for k, v in dct.items():
             if len(k) > 8:
                 raise ValueError('Keys must be <= 8 chars - "{0}" is not'.format(k))
             keystr = k.upper() + ((8 - len(k)) * ' ')
@@ -96,7 +129,7 @@ class Scamp(AstromaticTool):
                       'PSTEX': '.ps'
                      }  # used in get_reprocessed_output_fns
 
-    def get_reprocessed_output_fns(self, mkdirs=False):
+    def get_reprocessed_output_fns(self, mkdirs=False, catfns=None, cfg=None):
         """
         Gets the names that the scamp outputs will get mapped to if
         `renameoutputs` is True.
@@ -105,6 +138,10 @@ class Scamp(AstromaticTool):
         ----------
         mkdirs : bool, optional
             If True, any directories necessary will be created
+        catfns : list of str or None, optional
+            The input catalogs, or None to use `lastcats`
+        cfg : `AstromaticConfiguration` or None, optional
+            The configuration the outputs were made with, or None to use `cfg`
 
         Returns
         -------
@@ -117,7 +154,9 @@ class Scamp(AstromaticTool):
         """
         import os
 
-        lastcat = self.lastcats[0]
+        lastcat = (self.lastcats if catfns is None else catfns)[0]
+        if cfg is None:
+            cfg = self.cfg
 
         input_ = os.path.split(lastcat)[1]
         for ext in ['.cat', '.ldac', '.dat', '.fits']:
@@ -126,7 +165,7 @@ class Scamp(AstromaticTool):
                 break
 
         #XML output
-        oldxmlfn = self.cfg.XML_NAME
+        oldxmlfn = cfg.XML_NAME
         path, fn = os.path.split(oldxmlfn)
         newxmlfn = self.renameoutputs.format(
             path=path + ('' if path.endswith(os.path.sep) or path == '' else os.path.sep),
@@ -139,11 +178,11 @@ class Scamp(AstromaticTool):
             utils.nested_mkdir(xmldir)
 
         cppatmap = {}
-        cpext = self._CP_DEV_TO_EXT[self.cfg.CHECKPLOT_DEV]
+        cpext = self._CP_DEV_TO_EXT[cfg.CHECKPLOT_DEV]
         if cpext is None:
             # means this is a type that doesn't generate files
             return xmlmap, cppatmap
-        for cpfn in self.cfg.CHECKPLOT_NAME.split(','):
+        for cpfn in cfg.CHECKPLOT_NAME.split(','):
             cpfn = cpfn.strip() + cpext
             path, fn = os.path.split(cpfn)
 
@@ -169,57 +208,87 @@ class Scamp(AstromaticTool):
 
         return xmlmap, cppatmap
 
-    def _reprocess_outputs(self):
+    def _reprocess_outputs(self, catfns=None, cfg=None):
         import os
         import re
         from glob import glob
         from shutil import move
 
-        xmlmap, cppatmap = self.get_reprocessed_output_fns(mkdirs=True)
+        with self._phase('reprocess'):
+            xmlmap, cppatmap = self.get_reprocessed_output_fns(mkdirs=True, catfns=catfns, cfg=cfg)
+
+            for ofn, nfn in xmlmap.items():
+                if os.path.isfile(ofn):
+                    if self.verbose:
+                        print("Moving XML file {0} to {1}".format(ofn, nfn))
+                    with self._phase('rename'):
+                        move(ofn, nfn)
+
+            #find all the actual check plots based on the patterns
+            cpmap = {}
+            for opat, npat in cppatmap.items():
+                rex = re.compile(opat.replace('*', '(.*?)'))
+                for fn in glob(opat):
+                    cpmap[fn] = npat.replace('*', rex.match(fn).group(1))
+
+            for ofn, nfn in cpmap.items():
+                if nfn.endswith('.pdf'):
+                    with self._phase('convert'):
+                        converted = self._do_pstopdf(ofn, nfn)
+                    if converted:
+                        os.remove(ofn)
+                        continue  # instead of moving ps, just remove it
+                    else:
+                        #_do_pstopdf returns None/False only if pstopdf missing
+                        nfn = nfn[:-4] + '.ps'
 
-        for ofn, nfn in xmlmap.iteritems():
-            if os.path.isfile(ofn):
                 if self.verbose:
-                    print("Moving XML file {0} to {1}".format(ofn, nfn))
-                move(ofn, nfn)
-
-        #find all the actual check plots based on the patterns
-        cpmap = {}
-        for opat, npat in cppatmap.iteritems():
-            rex = re.compile(opat.replace('*', '(.*?)'))
-            for fn in glob(opat):
-                cpmap[fn] = npat.replace('*', rex.match(fn).group(1))
-
-        for ofn, nfn in cpmap.iteritems():
-            if nfn.endswith('.pdf'):
-                if self._do_pstopdf(ofn, nfn):
-                    os.remove(ofn)
-                    continue  # instead of moving ps, just remove it
-                else:
-                    #_do_pstopdf returns None/False only if pstopdf missing
-                    nfn = nfn[:-4] + '.ps'
-
-            if self.verbose:
-                print("Moving check plot {0} to {1}".format(ofn, nfn))
-            move(ofn, nfn)
-
-    def _check_output_exists(self, catfns):
-        import os
-
-        existingheads = []
+                    print("Moving check plot {0} to {1}".format(ofn, nfn))
+                with self._phase('rename'):
+                    move(ofn, nfn)
 
+    def _get_head_fns(self, catfns):
+        """
+        Returns the names of the headers scamp writes for `catfns`.
+        """
+        headfns = []
         for catfn in catfns:
             splfn = catfn.split('.')
             if len(splfn) > 0:
                 catbase = '.'.join(splfn[:-1])
             else:
                 catbase = splfn[0]
-            headfn = catbase + '.head'
+            headfns.append(catbase + '.head')
+        return headfns
+
+    def _check_output_exists(self, catfns):
+        import os
+
+        return [headfn for headfn in self._get_head_fns(catfns) if os.path.exists(headfn)]
 
-            if os.path.exists(headfn):
-                existingheads.append(headfn)
+    def _check_outputs_current(self, catfns, cfg):
+        """
+        Returns the output headers of a run on `catfns` with the snapshot
+        `cfg` only if the manifest next to the first one shows they're up to
+        date, otherwise an empty list.
+        """
+        headfns = self._get_head_fns(catfns)
+        if self._manifest_is_current(headfns[0], catfns, cfg):
+            return headfns
+        return []
 
-        return existingheads
+    def _record_outputs(self, catfns, cfg):
+        """
+        Writes the manifest for a run on `catfns` with the snapshot `cfg`,
+        covering the headers and (possibly renamed) XML output.
+        """
+        outputfns = self._get_head_fns(catfns)
+        if cfg.WRITE_XML.strip().upper() == 'Y':
+            if self.renameoutputs:
+                outputfns.extend(self.get_reprocessed_output_fns(catfns=catfns, cfg=cfg)[0].values())
+            else:
+                outputfns.append(cfg.XML_NAME)
+        self._write_manifest(outputfns[0], catfns, cfg, outputfns)
 
     def _do_pstopdf(self, psfn, newfn):
         import subprocess
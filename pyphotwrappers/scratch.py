@@ -0,0 +1,249 @@
+"""
+Management of scratch space for temporary files (proxy files, decompressed
+images, links), preferring a RAM-backed filesystem when there's room.
+"""
+from __future__ import division, print_function
+
+import os
+
+__all__ = ['ScratchSpace', 'get_scratch', 'set_scratch', 'is_scratch_path']
+
+_DIR_PREFIX = 'pyphotwrappers-scratch-'
+
+
+class ScratchSpace(object):
+    """
+    Hands out temporary file names in a RAM-backed directory, up to a budget
+    of bytes, and on disk after that.
+
+    Everything is put in private directories that are removed by `cleanup`,
+    which is also called when the process exits.  Directories left behind by
+    processes that died without cleaning up are removed when a new
+    `ScratchSpace` is created in the same place.
+
+    Parameters
+    ----------
+    path : str or None, optional
+        The RAM-backed directory (e.g. a tmpfs mount) to use, or None to use
+        ``/dev/shm`` if it's available.  If False, everything goes on disk.
+    budget : int or None, optional
+        The number of bytes that can be put in `path` at once, or None to use
+        half of the space free in `path` when this object is created.
+    fallbackpath : str or None, optional
+        Where files go when the budget is used up, or None for wherever the
+        python `tempfile` package puts temporary files.
+    """
+    def __init__(self, path=None, budget=None, fallbackpath=None):
+        import atexit
+        import multiprocessing.util
+        import socket
+        import tempfile
+        import threading
+
+        if path is None:
+            path = '/dev/shm'
+            if not (os.path.isdir(path) and os.access(path, os.W_OK)):
+                path = False
+        if fallbackpath is None:
+            fallbackpath = tempfile.gettempdir()
+
+        self.pid = os.getpid()
+        self._settings = (path, budget, fallbackpath)
+        prefix = '{0}{1}@{2}-'.format(_DIR_PREFIX, self.pid, socket.gethostname())
+
+        if path:
+            _remove_stale_dirs(path)
+            self.ramdir = tempfile.mkdtemp(prefix=prefix, dir=path)
+            if budget is None:
+                budget = _free_bytes(path) // 2
+        else:
+            self.ramdir = None
+            budget = 0
+        self.budget = budget
+
+        _remove_stale_dirs(fallbackpath)
+        self.diskdir = tempfile.mkdtemp(prefix=prefix, dir=fallbackpath)
+
+        self._reserved = {}  # maps path in ramdir -> bytes reserved for it
+        self._lock = threading.Lock()
+
+        atexit.register(self.cleanup)
+        # multiprocessing workers skip atexit, but do run these
+        multiprocessing.util.Finalize(self, self.cleanup, exitpriority=0)
+
+    @property
+    def used(self):
+        """
+        The number of bytes currently reserved in the RAM-backed directory.
+        """
+        with self._lock:
+            return sum(self._reserved.values())
+
+    def _choose_and_reserve(self, nbytes, name=None):
+        """
+        Picks the directory for a file of `nbytes`, and if `name` is given
+        reserves the space for the file of that name in it.  Returns the
+        directory.
+        """
+        with self._lock:
+            dirnm = self.diskdir
+            if self.ramdir is not None:
+                used = sum(self._reserved.values())
+                # the budget might be stale if something else is using the tmpfs
+                if used + nbytes <= self.budget and nbytes < _free_bytes(self.ramdir):
+                    dirnm = self.ramdir
+            if name is not None and dirnm == self.ramdir:
+                self._reserved[os.path.join(dirnm, name)] = nbytes
+        return dirnm
+
+    def mkpath(self, basename, nbytes=0):
+        """
+        Returns a path ending in `basename` for a file of about `nbytes` bytes.
+        The file is not created.  The same `basename` always gives the same
+        path as long as the file exists.
+        """
+        for dirnm in (self.ramdir, self.diskdir):
+            if dirnm is not None:
+                fn = os.path.join(dirnm, basename)
+                if os.path.lexists(fn):
+                    return fn
+
+        return os.path.join(self._choose_and_reserve(nbytes, basename), basename)
+
+    def tempfile(self, nbytes=0, mode='w+b', prefix='tmp', suffix=''):
+        """
+        Creates a `tempfile.NamedTemporaryFile` (that isn't deleted on close)
+        meant to hold about `nbytes` bytes.
+        """
+        from tempfile import NamedTemporaryFile
+
+        dirnm = self._choose_and_reserve(nbytes)
+        f = NamedTemporaryFile(mode=mode, delete=False, prefix=prefix,
+                               suffix=suffix, dir=dirnm)
+        if dirnm == self.ramdir:
+            with self._lock:
+                self._reserved[f.name] = nbytes
+        return f
+
+    def mkdtemp(self, prefix='tmp'):
+        """
+        Creates a temporary directory (for things like named pipes that take up
+        no space).
+        """
+        import tempfile
+
+        dirnm = self.ramdir if self.ramdir is not None else self.diskdir
+        return tempfile.mkdtemp(prefix=prefix, dir=dirnm)
+
+    def commit(self, fn):
+        """
+        Updates the reservation for `fn` to its actual size, once it's
+        written.
+        """
+        with self._lock:
+            if fn in self._reserved and os.path.isfile(fn):
+                self._reserved[fn] = os.path.getsize(fn)
+
+    def release(self, fn):
+        """
+        Deletes `fn` (if it exists) and frees up the space it was using.
+        """
+        with self._lock:
+            self._reserved.pop(fn, None)
+        if os.path.islink(fn) or os.path.isfile(fn):
+            os.remove(fn)
+
+    def owns(self, fn):
+        """
+        Determines if `fn` is in one of the directories of this object.
+        """
+        dirnm = os.path.dirname(os.path.abspath(fn))
+        return dirnm in (self.ramdir, self.diskdir)
+
+    def cleanup(self):
+        """
+        Removes everything in the scratch space.  Does nothing in a forked
+        child, which doesn't own the directories.
+        """
+        import shutil
+
+        if os.getpid() != self.pid:
+            return
+        for dirnm in (self.ramdir, self.diskdir):
+            if dirnm is not None:
+                shutil.rmtree(dirnm, ignore_errors=True)
+        with self._lock:
+            self._reserved.clear()
+
+
+_scratch = None
+
+
+def get_scratch():
+    """
+    Returns the process-wide `ScratchSpace`, creating it with the default
+    settings if necessary.  A forked child process gets its own, with the same
+    settings as its parent's.
+    """
+    global _scratch
+    if _scratch is None:
+        _scratch = ScratchSpace()
+    elif _scratch.pid != os.getpid():
+        _scratch = ScratchSpace(*_scratch._settings)
+    return _scratch
+
+
+def set_scratch(path=None, budget=None, fallbackpath=None):
+    """
+    Replaces the process-wide `ScratchSpace` with one using the given settings
+    (see `ScratchSpace`), and returns it.
+    """
+    global _scratch
+    if _scratch is not None:
+        _scratch.cleanup()
+    _scratch = ScratchSpace(path, budget, fallbackpath)
+    return _scratch
+
+
+def is_scratch_path(fn):
+    """
+    Determines if `fn` looks like it was in a scratch space (of any process).
+    """
+    return (os.sep + _DIR_PREFIX) in fn
+
+
+def _free_bytes(path):
+    st = os.statvfs(path)
+    return st.f_bavail * st.f_frsize
+
+
+def _remove_stale_dirs(path):
+    """
+    Removes scratch directories in `path` left by processes that are gone.
+    """
+    import errno
+    import shutil
+    import socket
+
+    hostname = socket.gethostname()
+
+    try:
+        fns = os.listdir(path)
+    except OSError:
+        return
+    for fn in fns:
+        if not fn.startswith(_DIR_PREFIX):
+            continue
+        # names are <prefix><pid>@<host>-<random>
+        pidstr, _, host = fn[len(_DIR_PREFIX):].rpartition('-')[0].partition('@')
+        if host != hostname:
+            continue  # can't tell if processes on other machines are alive
+        try:
+            pid = int(pidstr)
+        except ValueError:
+            continue
+        try:
+            os.kill(pid, 0)
+        except OSError as e:
+            if e.errno == errno.ESRCH:
+                shutil.rmtree(os.path.join(path, fn), ignore_errors=True)
@@ -4,8 +4,14 @@ import os
 import tempfile
 
 from .astromatic import *
+from .astromatic import _records_phases
 from . import utils
 
+try:
+    basestring
+except NameError:  # Python 3
+    basestring = str
+
 __all__ = ['Sextractor']
 
 
@@ -20,13 +26,17 @@ class Sextractor(AstromaticTool):
     autodecompress : bool or str, optional
         Indicates if decompression tools should be used when needed when
         compressed fits files are encountered.  If True, before runing
-        Sextractor, this object will automatically use whatever executable value
-        is in the  `pyphotwrappers.utils.fitsextension_to_decompresser`
-        dictionary to  decompress files with the extension given by the
-        dictionary key. If True, the file will be decompressed in the same place
-        path as the input file.  If a string, the string gives the path to where
-        it should be decompressed, with the special string 'tempfile' meaning
-        wherever the python `tempfile` package puts named temporary files.
+        Sextractor, this object will automatically decompress files with the
+        extensions in the `pyphotwrappers.utils.fitsextension_to_decompresser`
+        dictionary (the images, and any input files the configuration names,
+        like WEIGHT_IMAGE or FLAG_IMAGE, all at once), in-process or with the
+        executable given there (see `decompressengine`). If True, the file
+        will be decompressed in the same place path as the input file.  If a
+        string, the string gives the path to where it should be decompressed,
+        with the special string 'tempfile' meaning the scratch space (see
+        `pyphotwrappers.scratch`), which uses RAM if there's room.  Runs in
+        other threads or processes can safely share a decompressed file: it's
+        made once, and removed after the last of them.
     renameoutputs : str or None, optional
         If present, indicates that the output files should be renamed to the
         provided string pattern.  The string can include '{path}', '{fn}',
@@ -41,6 +51,8 @@ class Sextractor(AstromaticTool):
         if a string, it will be interpreted as an executable path to `fpack`.
     overwrite : bool, optional
         If True, will overwrite the output catalog even if it already exists.
+        If False, a run is skipped if the manifest next to its catalog shows
+        it's up to date (see `writemanifests`).
     keeptemps: bool, optional
         If True, indicates that temporary files (e.g., decompressed .fits.fz
         files) should be left in place, otherwise they are deleted.
@@ -48,13 +60,17 @@ class Sextractor(AstromaticTool):
         If True, diagnostic information will be printed while running.
     """
     defaultexecname = 'sex'
+    # a `~pyphotwrappers.resultcache.ResultCache` to get the outputs from
+    # instead of running sextractor, when it has them for the same image(s)
+    # and settings, or None
+    resultcache = None
 
     def __init__(self, execpath=None, autodecompress=True, renameoutputs=None,
                  checkimgpath=None, compresscheckimg=False, overwrite=True,
                  keeptemps=False, verbose=False):
         super(Sextractor, self).__init__(execpath, verbose=verbose)
 
-        self._parse_outputs(self._invoke_tool(['-dp'])[0])
+        self._parse_outputs(self._get_tool_dump('-dp'))
         self.reset_outputs()
         self.choose_conv_filter('default')
 
@@ -78,18 +94,18 @@ class Sextractor(AstromaticTool):
                 values.append(l[:24].replace('#', '').strip())
                 comments[values[-1]] = l[24:]
 
-    def _invoke_tool(self, *args, **kwargs):
-        if self.cfg is not None and hasattr(self.cfg.PARAMETERS_NAME, 'content'):
-            oldcontent = self.cfg.PARAMETERS_NAME.content
-        else:
-            oldcontent = None
-        try:
-            if oldcontent is not None and self.cfg.PARAMETERS_NAME.content.startswith('PLACEHOLDER'):
-                self.cfg.PARAMETERS_NAME.content = '\n'.join(self.outputs)
-            return super(Sextractor, self)._invoke_tool(*args, **kwargs)
-        finally:
-            if oldcontent is not None:
-                self.cfg.PARAMETERS_NAME.content = oldcontent
+    def _snapshot_cfg(self, **overrides):
+        params = self.cfg.PARAMETERS_NAME
+        if ('PARAMETERS_NAME' not in overrides and isinstance(params, ProxyInputFile)
+                and params.content.startswith('PLACEHOLDER')):
+            overrides['PARAMETERS_NAME'] = ProxyInputFile('\n'.join(self.outputs), params.fifo)
+        return super(Sextractor, self)._snapshot_cfg(**overrides)
+
+    def _proxy_uses_fifo(self, proxy, cfg):
+        # FITS catalogs are written with seeks, so they need a real file
+        if proxy.configname == 'CATALOG_NAME' and 'FITS' in cfg.CATALOG_TYPE.upper():
+            return False
+        return super(Sextractor, self)._proxy_uses_fifo(proxy, cfg)
 
     def choose_conv_filter(self, fname):
         if fname not in _CONV_FILTER_NAMES:
@@ -170,7 +186,7 @@ class Sextractor(AstromaticTool):
             if v not in self.outputs:
                 self.outputs.append(v)
 
-    def use_proxy_catalog(self, outtype=None):
+    def use_proxy_catalog(self, outtype=None, fifo=None):
         """
         Switches to using a proxy for the output catalog so that the results are
         stored in this object rather than saved out to a file.
@@ -179,6 +195,9 @@ class Sextractor(AstromaticTool):
         ----------
         outtype : str or None
             The CATALOG_TYPE
+        fifo : bool or None
+            If True, stream the catalog back through a named pipe instead of a
+            temp file (ignored for FITS catalogs).  See `ProxyOutputFile`.
         """
         if outtype is not None:
             validtypes = [t.strip() for t in self.cfg.comments['CATALOG_TYPE']
@@ -187,7 +206,7 @@ class Sextractor(AstromaticTool):
                 raise ValueError('Requested output type {0} is not one of the '
                                  'valid types:{1}'.format(outtype, validtypes))
             self.cfg.CATALOG_TYPE = outtype
-        self.cfg.CATALOG_NAME = ProxyOutputFile()
+        self.cfg.CATALOG_NAME = ProxyOutputFile(fifo)
 
     def get_output(self, astable=True):
         from astropy.io import ascii
@@ -201,7 +220,7 @@ class Sextractor(AstromaticTool):
                 print("Can't get output if a proxy output was not used - "
                       "reading from file " + self.cfg.CATALOG_NAME)
             if self.renameoutputs:
-                catfn = self.get_renamed_output_fns()[0].values()[0]
+                catfn = list(self.get_renamed_output_fns()[0].values())[0]
             else:
                 catfn = self.cfg.CATALOG_NAME
             with open(catfn, 'rb') as f:
@@ -221,7 +240,8 @@ class Sextractor(AstromaticTool):
         else:
             return content
 
-    def sextract_single(self, imgfn=None):
+    @_records_phases
+    def sextract_single(self, imgfn=None, timeout=None):
         """
         Run sextractor in single output mode
 
@@ -229,32 +249,58 @@ class Sextractor(AstromaticTool):
         ----------
         imgfn : str or None
             The input file or None to use `lastimgfn`
+        timeout : float or None
+            Seconds the tool may run before it is killed (raising
+            `AstromaticTimeoutError`), or None to use the `timeout` attribute.
         """
         if imgfn is None:
             imgfn = getattr(self, 'lastimgfn', None)
 
+        cfg = self._snapshot_cfg()
         if not self.overwrite:
-            prevoutputfn = self._check_output_exists(imgfn)
+            prevoutputfn = self._check_output_exists([imgfn], cfg)
             if prevoutputfn:
                 if self.verbose:
-                    print("Output {0} already exists, not running Sextractor".format(prevoutputfn))
+                    print("Output {0} is up to date, not running Sextractor".format(prevoutputfn))
                 return prevoutputfn
 
-        decompfn = self._try_decompress(imgfn)
-        try:
-            self._invoke_tool([imgfn if decompfn is None else decompfn], showoutput=True)
-            self.lastimgfn = imgfn
+        cachekey, cached = self._fetch_cached_result([imgfn], cfg)
+        if not cached:
+            (decompfn,), runcfg, alldecompfns = self._decompress_inputs([imgfn], cfg)
+            try:
+                self._invoke_tool([imgfn if decompfn is None else decompfn], showoutput=True,
+                                  timeout=timeout, cfg=runcfg)
+            finally:
+                self._remove_decompressed(alldecompfns)
+            self._store_cached_result(cachekey, cfg)
+        self.lastimgfn = imgfn
+
+        if self.renameoutputs:
+            outputmaps = self.get_renamed_output_fns(mkdirs=True, imgfn=imgfn, cfg=cfg)
+            result = self._reprocess_outputs(outputmaps)
+        else:
+            outputmaps = None
+            result = cfg.CATALOG_NAME
+        self._record_outputs([imgfn], cfg, outputmaps)
+        return result
 
-            if self.renameoutputs:
-                return self._reprocess_outputs()  # uses lastimgfn to figure out the new names
-            else:
-                return self.cfg.CATALOG_NAME
-        finally:
-            if (not self.keeptemps) and decompfn is not None:
-                if os.path.isfile(decompfn):
-                    os.remove(decompfn)
+    def sextract_single_async(self, imgfn=None, limiter=None, timeout=None):
+        """
+        An `asyncio` counterpart to `sextract_single`: returns a coroutine that
+        runs sextractor on a snapshot of this object's configuration.
 
-    def sextract_double(self, masterimgfn=None, analysisimgfn=None):
+        This object's `lastimgfn` is not updated, and for a proxy catalog the
+        returned `ProxyOutputFile` holds the output of this run.  `limiter` is
+        as for `invoke_async`.
+        """
+        from .asynctools import sextract_single_async
+
+        if imgfn is None:
+            imgfn = getattr(self, 'lastimgfn', None)
+        return sextract_single_async(self, imgfn, limiter, timeout)
+
+    @_records_phases
+    def sextract_double(self, masterimgfn=None, analysisimgfn=None, timeout=None):
         """
         Run sextractor in single output mode
 
@@ -264,42 +310,441 @@ class Sextractor(AstromaticTool):
             The input file or None to use `lastmasterimgfn`
         analysisimgfn : str or None
             The input analysis file or None to use `lastimgfn`
+        timeout : float or None
+            Seconds the tool may run before it is killed (raising
+            `AstromaticTimeoutError`), or None to use the `timeout` attribute.
         """
         if masterimgfn is None:
             masterimgfn = getattr(self, 'lastmasterimgfn', None)
         if analysisimgfn is None:
             analysisimgfn = getattr(self, 'lastimgfn', None)
 
+        cfg = self._snapshot_cfg()
+        if not self.overwrite:
+            prevoutputfn = self._check_output_exists([masterimgfn, analysisimgfn], cfg)
+            if prevoutputfn:
+                if self.verbose:
+                    print("Output {0} is up to date, not running Sextractor".format(prevoutputfn))
+                return prevoutputfn
+
+        cachekey, cached = self._fetch_cached_result([masterimgfn, analysisimgfn], cfg)
+        if not cached:
+            decompfns, runcfg, alldecompfns = self._decompress_inputs([masterimgfn, analysisimgfn], cfg)
+            masterdecompfn, analysisdecompfn = decompfns
+            try:
+                self._invoke_tool([masterimgfn if masterdecompfn is None else masterdecompfn,
+                                   analysisimgfn if analysisdecompfn is None else analysisdecompfn],
+                                  showoutput=True, timeout=timeout, cfg=runcfg)
+            finally:
+                self._remove_decompressed(alldecompfns)
+            self._store_cached_result(cachekey, cfg)
+
+        self.lastimgfn = analysisimgfn
+        self.lastmasterimgfn = masterimgfn
+
+        if self.renameoutputs:
+            outputmaps = self.get_renamed_output_fns(mkdirs=True, imgfn=analysisimgfn, cfg=cfg)
+            result = self._reprocess_outputs(outputmaps)
+        else:
+            outputmaps = None
+            result = cfg.CATALOG_NAME
+        self._record_outputs([masterimgfn, analysisimgfn], cfg, outputmaps)
+        return result
+
+    def sextract_many(self, imgfns, max_workers=None, timeout=None):
+        """
+        Run sextractor in single output mode on many images at once, using
+        a pool of worker processes that each get a copy of this object's
+        current configuration.
+
+        Each run gets its own proxy files and decompressed input, and (if
+        `renameoutputs` is set) writes its raw outputs to a private scratch
+        directory before they are renamed, so runs do not clobber each other.
+
+        Parameters
+        ----------
+        imgfns : list of str
+            The input files
+        max_workers : int or None, optional
+            The number of worker processes to use, or None to use one per CPU.
+            If 1, the images are processed serially in this process.
+        timeout : float or None
+            Seconds each run may take before it is killed (and reported as an
+            `AstromaticTimeoutError` in `errors`), or None to use the `timeout`
+            attribute.
+
+        Returns
+        -------
+        results : list
+            What `sextract_single` returned for each of `imgfns` (in the same
+            order), or None if that image failed.  For a proxy catalog, this is
+            a `ProxyOutputFile` with the catalog `content` populated.
+        errors : list
+            The exception raised for each of `imgfns`, or None if it succeeded.
+        """
+        import multiprocessing
+
+        if isinstance(imgfns, basestring):
+            imgfns = [imgfns]
+
+        if not (self.renameoutputs or isinstance(self.cfg.CATALOG_NAME, ProxyOutputFile)):
+            raise ValueError('sextract_many needs either `renameoutputs` or a '
+                             'proxy catalog, otherwise every run writes to the '
+                             'same catalog file')
+
+        if max_workers is None:
+            max_workers = multiprocessing.cpu_count()
+        max_workers = min(max_workers, len(imgfns))
+
+        if max_workers <= 1:
+            # a private copy rather than the workers' global, so that
+            # concurrent calls in other threads don't share one
+            tool = _copy_for_sextract_many(self, timeout)
+            outs = [_sextract_many_run(tool, imgfn) for imgfn in imgfns]
+        else:
+            from .batch import WatchedPool
+
+            outs = [None] * len(imgfns)
+            pool = WatchedPool(max_workers, _sextract_many_init, (self, timeout))
+            try:
+                for i, imgfn in enumerate(imgfns):
+                    pool.submit(i, _sextract_many_worker, (imgfn,))
+                for _ in imgfns:
+                    i, result, error = pool.next_finished()
+                    outs[i] = result, error
+            finally:
+                pool.close()
+
+        results = [res for res, err in outs]
+        errors = [err for res, err in outs]
+        if self.verbose:
+            nfailed = len([err for err in errors if err is not None])
+            print("sextract_many ran on {0} images, {1} failed".format(len(imgfns), nfailed))
+        return results, errors
+
+    @_records_phases
+    def _sextract_isolated(self, imgfn):
+        """
+        Like `sextract_single`, but with the raw catalog, XML and check image
+        outputs written to a private directory and then moved to where
+        `renameoutputs` says they go.
+        """
+        import shutil
+
+        if not self.renameoutputs:
+            return self.sextract_single(imgfn)
+
         if not self.overwrite:
-            prevoutputfn = self._check_output_exists(analysisimgfn)
+            prevoutputfn = self._check_output_exists([imgfn], self._snapshot_cfg())
             if prevoutputfn:
                 if self.verbose:
-                    print("Output {0} already exists, not running Sextractor".format(prevoutputfn))
+                    print("Output {0} is up to date, not running Sextractor".format(prevoutputfn))
                 return prevoutputfn
 
-        masterdecompfn = self._try_decompress(masterimgfn)
-        analysisdecompfn = self._try_decompress(analysisimgfn)
+        cfg, outputmaps, privdir = self._isolate_outputs(imgfn)
+
+        alldecompfns = []
         try:
-            self._invoke_tool([masterimgfn if masterdecompfn is None else masterdecompfn,
-                               analysisimgfn if analysisdecompfn is None else analysisdecompfn],
-                              showoutput=True)
+            cachekey, cached = self._fetch_cached_result([imgfn], cfg)
+            if not cached:
+                (decompfn,), runcfg, alldecompfns = self._decompress_inputs([imgfn], cfg)
+                self._invoke_tool([imgfn if decompfn is None else decompfn], showoutput=True,
+                                  cfg=runcfg)
+                self._store_cached_result(cachekey, cfg)
+            self.lastimgfn = imgfn
 
-            self.lastimgfn = analysisimgfn
-            self.lastmasterimgfn = masterimgfn
+            result = self._reprocess_outputs(outputmaps)
+            self._record_outputs([imgfn], cfg, outputmaps)
+            return result
+        finally:
+            self._remove_decompressed(alldecompfns)
+            shutil.rmtree(privdir, ignore_errors=True)
 
+    def _isolate_outputs(self, imgfn):
+        """
+        Returns (cfg, outputmaps, privdir) for a run on `imgfn` with its raw
+        catalog, XML and check image outputs written to the new private
+        directory `privdir`: the snapshot to run with, and the mapping of the
+        private names to where `renameoutputs` says they go (as for
+        `_reprocess_outputs`).
+        """
+        # work out the final names from the configured (not private) names
+        catmap, xmlmap, cimgmap = self.get_renamed_output_fns(mkdirs=True, imgfn=imgfn)
+
+        privdir = self._get_scratch().mkdtemp(prefix='sextract_')
+        privnames = {}
+        for ofn in list(catmap) + list(xmlmap) + list(cimgmap):
+            if isinstance(ofn, basestring):
+                privnames[ofn] = os.path.join(privdir, str(len(privnames)) + '_' + os.path.basename(ofn))
+
+        overrides = {'CHECKIMAGE_NAME': ','.join([privnames[cimgfn] for cimgfn in cimgmap])}
+        for nm in ('CATALOG_NAME', 'XML_NAME'):
+            if isinstance(self.cfg[nm], basestring):
+                overrides[nm] = privnames[self.cfg[nm]]
+        cfg = self._snapshot_cfg(**overrides)
+
+        outputmaps = [dict([(privnames.get(ofn, ofn), nfn) for ofn, nfn in mp.items()])
+                      for mp in (catmap, xmlmap, cimgmap)]
+        return cfg, outputmaps, privdir
+
+    @_records_phases
+    def sextract_pipelined(self, imgfns, readahead=1, timeout=None):
+        """
+        Run sextractor in single output mode on each of `imgfns` in turn, with
+        only one sextractor running at a time, but with the work around it
+        done in background threads: while sextractor runs on one image, the
+        next `readahead` are decompressed (or their outputs fetched from the
+        `resultcache`), and the outputs of the last ones are renamed and
+        compressed.
+
+        As for `sextract_many`, this needs `renameoutputs` or a proxy catalog,
+        and the raw outputs of each run go to a private directory.
+
+        Parameters
+        ----------
+        imgfns : list of str
+            The input files
+        readahead : int, optional
+            How many images past the current one may be decompressed already.
+            Each takes up space (see `autodecompress`) until it's used.
+        timeout : float or None
+            Seconds each run may take before it is killed (and reported as an
+            `AstromaticTimeoutError` in `errors`), or None to use the `timeout`
+            attribute.
+
+        Returns
+        -------
+        results : list
+            What `sextract_single` returned for each of `imgfns` (in the same
+            order), or None if that image failed.
+        errors : list
+            The exception raised for each of `imgfns`, or None if it succeeded.
+        """
+        from multiprocessing.pool import ThreadPool
+
+        if isinstance(imgfns, basestring):
+            imgfns = [imgfns]
+
+        if not (self.renameoutputs or isinstance(self.cfg.CATALOG_NAME, ProxyOutputFile)):
+            raise ValueError('sextract_pipelined needs either `renameoutputs` or '
+                             'a proxy catalog, otherwise the outputs of a run '
+                             'would be overwritten before they are moved')
+
+        results = [None] * len(imgfns)
+        errors = [None] * len(imgfns)
+        stages = {}  # maps index -> (cfg, outputmaps, privdir, prefetch result)
+        finishing = []  # (index, finish result)
+
+        prefetcher = ThreadPool(max(readahead, 1))
+        finisher = ThreadPool(1)
+        try:
+            for i, imgfn in enumerate(imgfns):
+                for j in range(i, min(i + readahead + 1, len(imgfns))):
+                    if j not in stages:
+                        stages[j] = self._start_pipeline_stage(imgfns[j], prefetcher, results, errors, j)
+
+                stage = stages.pop(i)
+                if stage is None:
+                    continue  # up to date, or couldn't be set up
+                cfg, outputmaps, privdir, prefetch = stage
+                alldecompfns = []
+                try:
+                    with self._phase('wait'):
+                        cachekey, cached, infn, runcfg, alldecompfns = prefetch.get()
+                    if not cached:
+                        self._invoke_tool([infn], showoutput=True, timeout=timeout, cfg=runcfg)
+                except Exception as e:
+                    errors[i] = e
+                    self._remove_decompressed(alldecompfns)
+                    self._remove_private_dir(privdir)
+                    continue
+                self._remove_decompressed(alldecompfns)  # room for the next ones
+                self.lastimgfn = imgfn
+
+                finishing.append((i, finisher.apply_async(self._finish_pipeline_stage,
+                                                          (imgfn, cfg, outputmaps, privdir,
+                                                           cachekey, cached))))
+            for i, finish in finishing:
+                try:
+                    results[i] = finish.get()
+                except Exception as e:
+                    errors[i] = e
+        finally:
+            finisher.close()
+            prefetcher.close()
+            finisher.join()
+            prefetcher.join()
+            # if we're bailing out, clean up after the ones already prefetched
+            for stage in stages.values():
+                if stage is not None:
+                    cfg, outputmaps, privdir, prefetch = stage
+                    if prefetch.ready() and prefetch.successful():
+                        self._remove_decompressed(prefetch.get()[4])
+                    self._remove_private_dir(privdir)
+
+        if self.verbose:
+            nfailed = len([err for err in errors if err is not None])
+            print("sextract_pipelined ran on {0} images, {1} failed".format(len(imgfns), nfailed))
+        return results, errors
+
+    def _start_pipeline_stage(self, imgfn, prefetcher, results, errors, i):
+        """
+        Sets up the run on `imgfn` (the `i`th image) for `sextract_pipelined`,
+        and starts fetching its outputs from the `resultcache` or decompressing
+        it with `prefetcher`.  Returns (cfg, outputmaps, privdir, prefetch
+        result), or None if its outputs are up to date or it failed.
+        """
+        try:
+            if not self.overwrite:
+                prevoutputfn = self._check_output_exists([imgfn], self._snapshot_cfg())
+                if prevoutputfn:
+                    if self.verbose:
+                        print("Output {0} is up to date, not running Sextractor".format(prevoutputfn))
+                    results[i] = prevoutputfn
+                    return None
             if self.renameoutputs:
-                return self._reprocess_outputs()  # uses lastimgfn to figure out the new names
+                cfg, outputmaps, privdir = self._isolate_outputs(imgfn)
             else:
-                return self.cfg.CATALOG_NAME
+                cfg, outputmaps, privdir = self._snapshot_cfg(), None, None
+        except Exception as e:
+            errors[i] = e
+            return None
+        return cfg, outputmaps, privdir, prefetcher.apply_async(self._prefetch_input, (imgfn, cfg))
+
+    def _prefetch_input(self, imgfn, cfg):
+        """
+        Returns (cachekey, cached, infn, runcfg, alldecompfns) for a run on
+        `imgfn` with the snapshot `cfg`: the outputs are fetched from the
+        `resultcache` if it has them, otherwise `imgfn` and the inputs `cfg`
+        names are decompressed (if need be, see `_decompress_inputs`), giving
+        the image and snapshot to run with.
+        """
+        cachekey, cached = self._fetch_cached_result([imgfn], cfg)
+        if cached:
+            return cachekey, cached, imgfn, cfg, []
+        (decompfn,), runcfg, alldecompfns = self._decompress_inputs([imgfn], cfg)
+        return cachekey, cached, imgfn if decompfn is None else decompfn, runcfg, alldecompfns
+
+    def _finish_pipeline_stage(self, imgfn, cfg, outputmaps, privdir, cachekey, cached):
+        """
+        Stores, renames and records the outputs of a run on `imgfn` in
+        `sextract_pipelined`, and returns what `sextract_single` would.
+        """
+        try:
+            if not cached:
+                self._store_cached_result(cachekey, cfg)
+            if outputmaps is None:
+                result = cfg.CATALOG_NAME
+            else:
+                result = self._reprocess_outputs(outputmaps)
+            self._record_outputs([imgfn], cfg, outputmaps)
+            return result
         finally:
-            if (not self.keeptemps) and analysisdecompfn is not None:
-                if os.path.isfile(analysisdecompfn):
-                    os.remove(analysisdecompfn)
-            if (not self.keeptemps) and masterdecompfn is not None:
-                if os.path.isfile(masterdecompfn):
-                    os.remove(masterdecompfn)
+            self._remove_private_dir(privdir)
+
+    def _remove_private_dir(self, privdir):
+        import shutil
+
+        if privdir is not None:
+            shutil.rmtree(privdir, ignore_errors=True)
+
+    def _get_parallel_method(self, method):
+        if method == 'sextract_single':
+            return self._sextract_isolated
+        return super(Sextractor, self)._get_parallel_method(method)
+
+    _OUTPUT_NAME_ITEMS = ('CATALOG_NAME', 'XML_NAME', 'CHECKIMAGE_NAME')
 
-    def get_renamed_output_fns(self, mkdirs=False):
+    def _result_cache_key(self, imgfns, cfg):
+        """
+        Returns the `resultcache` key for a run on `imgfns` with the snapshot
+        `cfg`, from the sextractor version, the input images, and the settings
+        (with the contents of proxies and of any files they name, e.g. weight
+        maps, flag images or the neural network file).
+        """
+        cache = self.resultcache
+        parts, fns = self._describe_run(cfg)
+        parts.extend([cache.fingerprint(fn) for fn in list(imgfns) + fns])
+        return cache.make_key(parts)
+
+    def _get_output_fns(self, cfg):
+        """
+        Returns a dict mapping the names of outputs (as stored in the
+        `resultcache`) to the files the snapshot `cfg` has them written to
+        (leaving out a proxy catalog).
+        """
+        outputs = {}
+        if isinstance(cfg.CATALOG_NAME, basestring):
+            outputs['catalog'] = cfg.CATALOG_NAME
+        if cfg.WRITE_XML.strip().upper() == 'Y':
+            outputs['xml'] = cfg.XML_NAME
+        if cfg.CHECKIMAGE_TYPE.strip().upper() != 'NONE':
+            for i, cimgfn in enumerate(cfg.CHECKIMAGE_NAME.split(',')):
+                cimgfn = cimgfn.strip()
+                if not cimgfn.endswith('.fits'):
+                    cimgfn += '.fits'
+                outputs['checkimage{0}'.format(i)] = cimgfn
+        return outputs
+
+    def _fetch_cached_result(self, imgfns, cfg):
+        """
+        Returns (key, hit), where `key` is the `resultcache` key for a run on
+        `imgfns` with the snapshot `cfg` (or None if there's no cache).  If the
+        cache has the outputs of such a run, they are put where `cfg` says
+        (including the content of a proxy catalog) and `hit` is True.
+        """
+        import shutil
+
+        if self.resultcache is None:
+            return None, False
+
+        with self._phase('cache'):
+            key = self._result_cache_key(imgfns, cfg)
+            stored = self.resultcache.get(key)
+            if stored is None or 'catalog' not in stored:
+                return key, False
+
+            try:
+                for nm, fn in self._get_output_fns(cfg).items():
+                    if nm in stored:
+                        shutil.copyfile(stored[nm], fn)
+                if isinstance(cfg.CATALOG_NAME, ProxyOutputFile):
+                    with open(stored['catalog'], 'r') as f:
+                        cfg.CATALOG_NAME.content = f.read()
+                    if cfg.CATALOG_NAME.source is not None:
+                        cfg.CATALOG_NAME.source.content = cfg.CATALOG_NAME.content
+            except (IOError, OSError):
+                # e.g. evicted while we were copying
+                return key, False
+
+        if self.verbose:
+            print('Using the cached outputs for {0}'.format(', '.join(imgfns)))
+        return key, True
+
+    def _store_cached_result(self, key, cfg):
+        """
+        Puts the outputs of the run with the snapshot `cfg` in the
+        `resultcache` under `key` (unless `key` is None).
+        """
+        if key is None:
+            return
+
+        with self._phase('cache'):
+            files = dict([(nm, fn) for nm, fn in self._get_output_fns(cfg).items()
+                          if os.path.isfile(fn)])
+            contents = {}
+            if isinstance(cfg.CATALOG_NAME, ProxyOutputFile):
+                contents['catalog'] = cfg.CATALOG_NAME.content
+            elif 'catalog' not in files:
+                return  # nothing to reuse
+
+            try:
+                self.resultcache.put(key, files, contents)
+            except (IOError, OSError) as e:
+                if self.verbose:
+                    print('Could not store outputs in the result cache: {0}'.format(e))
+
+    def get_renamed_output_fns(self, mkdirs=False, imgfn=None, cfg=None):
         """
         Gets the names that the sextractor outputs will get mapped to if
         `renameoutputs` is True.
@@ -308,6 +753,10 @@ class Sextractor(AstromaticTool):
         ----------
         mkdirs : bool, optional
             If True, any directories necessary will be created
+        imgfn : str or None, optional
+            The input image, or None to use `lastimgfn`
+        cfg : `AstromaticConfiguration` or None, optional
+            The configuration the outputs were made with, or None to use `cfg`
 
         Returns
         -------
@@ -322,8 +771,10 @@ class Sextractor(AstromaticTool):
             names.
         """
 
-        inputfn = self.lastimgfn
+        inputfn = self.lastimgfn if imgfn is None else imgfn
         input_ = os.path.split(inputfn)[1].split('.fits')[0]
+        if cfg is None:
+            cfg = self.cfg
 
         if '{object}' in self.renameoutputs:
             from astropy.io import fits
@@ -338,7 +789,7 @@ class Sextractor(AstromaticTool):
             object_ = None
 
         #main catalog
-        oldcatfn = self.cfg.CATALOG_NAME
+        oldcatfn = cfg.CATALOG_NAME
         path, fn = os.path.split(oldcatfn)
         newcatfn = self.renameoutputs.format(
                 path=path + ('' if path.endswith(os.path.sep) or path == '' else os.path.sep),
@@ -351,7 +802,7 @@ class Sextractor(AstromaticTool):
             utils.nested_mkdir(catdir)
 
         #XML output
-        oldxmlfn = self.cfg.XML_NAME
+        oldxmlfn = cfg.XML_NAME
         path, fn = os.path.split(oldxmlfn)
         newxmlfn = self.renameoutputs.format(
                 path=path + ('' if path.endswith(os.path.sep) or path == '' else os.path.sep),
@@ -365,7 +816,7 @@ class Sextractor(AstromaticTool):
 
         #check images
         cimgmap = {}
-        for cimgfn in self.cfg.CHECKIMAGE_NAME.split(','):
+        for cimgfn in cfg.CHECKIMAGE_NAME.split(','):
             cimgfn = cimgfn.strip()  # just in case
             if not cimgfn.endswith('.fits'):
                 cimgfn += '.fits'
@@ -388,115 +839,102 @@ class Sextractor(AstromaticTool):
 
         return catmap, xmlmap, cimgmap
 
-    def _check_output_exists(self, imgfn):
+    def _check_output_exists(self, imgfns, cfg):
         """
-        Returns the name of the output catalog only if it already exists.
+        Returns the name of the output catalog of a run on `imgfns` with the
+        snapshot `cfg` only if its manifest shows it's up to date (i.e., it
+        came from a run with the same settings on the same images, and no
+        output has changed since).  A proxy catalog never counts as up to date,
+        as nothing records which run its content came from.
         """
-        if hasattr(self.cfg.CATALOG_NAME, 'content') and self.cfg.CATALOG_NAME.content != '':
-            return 'in-memory'
+        if isinstance(cfg.CATALOG_NAME, ProxyOutputFile):
+            return ''
+        if self.renameoutputs:
+            catfn = list(self.get_renamed_output_fns(imgfn=imgfns[-1], cfg=cfg)[0].values())[0]
         else:
-            if self.renameoutputs:
-                oldimgfn = self.lastimgfn
-                try:
-                    self.lastimgfn = imgfn
-                    catfn = self.get_renamed_output_fns()[0].values()[0]
-                finally:
-                    self.lastimgfn = oldimgfn
-            else:
-                catfn = self.cfg.CATALOG_NAME
-            if os.path.isfile(catfn):
-                return catfn
+            catfn = cfg.CATALOG_NAME
+        if self._manifest_is_current(catfn, imgfns, cfg):
+            return catfn
         return ''
 
-    def _reprocess_outputs(self):
+    def _record_outputs(self, imgfns, cfg, outputmaps=None):
+        """
+        Writes the manifest for a run on `imgfns` with the snapshot `cfg`,
+        whose outputs were moved as `outputmaps` says (like
+        `_reprocess_outputs`), or left where `cfg` put them if None.
+        """
+        if isinstance(cfg.CATALOG_NAME, ProxyOutputFile):
+            return
+        if outputmaps is None:
+            catfn = cfg.CATALOG_NAME
+            outputfns = list(self._get_output_fns(cfg).values())
+        else:
+            catmap, xmlmap, cimgmap = outputmaps
+            catfn = list(catmap.values())[0]
+            outputfns = [catfn]
+            if cfg.WRITE_XML.strip().upper() == 'Y':
+                outputfns.extend(xmlmap.values())
+            if cfg.CHECKIMAGE_TYPE.strip().upper() != 'NONE':
+                outputfns.extend(cimgmap.values())
+        self._write_manifest(catfn, imgfns, cfg, outputfns)
+
+    def _reprocess_outputs(self, outputmaps=None, imgfn=None, cfg=None):
+        """
+        Renames/compresses the outputs.  `outputmaps` can be a
+        (catmap, xmlmap, cimgmap) tuple like `get_renamed_output_fns` returns,
+        or None to compute it from `imgfn` and `cfg` (see
+        `get_renamed_output_fns`).
+        """
         import subprocess
         from shutil import move
         from warnings import warn
 
-        catmap, xmlmap, cimgmap = self.get_renamed_output_fns(mkdirs=True)
-
-        #rename main catalog
-        for ofn, nfn in catmap.iteritems():
-            if os.path.isfile(ofn):
-                if self.verbose:
-                    print("Moving catalog output {0} to {1}".format(ofn, nfn))
-                move(ofn, nfn)
-            catnfn = nfn
+        with self._phase('reprocess'):
+            if outputmaps is None:
+                catmap, xmlmap, cimgmap = self.get_renamed_output_fns(mkdirs=True, imgfn=imgfn, cfg=cfg)
+            else:
+                catmap, xmlmap, cimgmap = outputmaps
 
-        #rename XML output if present
-        for ofn, nfn in xmlmap.iteritems():
-            if os.path.isfile(ofn):
-                if self.verbose:
-                    print("Moving XML output {0} to {1}".format(ofn, nfn))
-                move(ofn, nfn)
-
-        #rename or compress checkimages if present
-        for ofn, nfn in cimgmap.iteritems():
-            if os.path.isfile(ofn):
-                if self.compresscheckimg is True:  # means "need to find fpack"
-                    self.compresscheckimg = utils.which_path('fpack')
-                    if self.compresscheckimg is None:
-                        warn("could not find fpack - cannot compress check images")
-
-                if self.compresscheckimg:
+            #rename main catalog
+            for ofn, nfn in catmap.items():
+                if os.path.isfile(ofn):
                     if self.verbose:
-                        print("Compressing check image {0} to {1}".format(ofn, nfn))
-                    cmdline = '{exc} -S -D -Y {ofn} > {nfn}'
-                    cmdline = cmdline.format(exc=self.compresscheckimg,
-                                             ofn=ofn, nfn=nfn)
-                    subprocess.check_call([cmdline], shell=True)
-                else:
+                        print("Moving catalog output {0} to {1}".format(ofn, nfn))
+                    with self._phase('rename'):
+                        move(ofn, nfn)
+                catnfn = nfn
+
+            #rename XML output if present
+            for ofn, nfn in xmlmap.items():
+                if os.path.isfile(ofn):
                     if self.verbose:
-                        print("Moving Check image {0} to {1}".format(ofn, nfn))
-                    move(ofn, nfn)
-
-        return catnfn
-
-    def _try_decompress(self, fn):
-        """
-        runs funpack if necessary.
-
-        Returns a file name for the decompressed file, or None if decompression
-        not needed
-        """
-        import time
-        import subprocess
-
-        if not self.autodecompress:
-            return None  # bail immediately
-
-        for ext in utils.fitsextension_to_decompresser:
-            if fn.endswith(ext):
-                decompresser = utils.which_path(utils.fitsextension_to_decompresser[ext])
-                break
-        else:
-            return None  # not a decompressible file
-
-        decompfn = os.path.split(fn[:-len(ext)])[1]  # the base file name
-        if self.autodecompress is True:
-            decompfn = os.path.join(os.path.split(fn)[0], decompfn)
-        elif self.autodecompress == 'tempfile':
-            decompfn = os.path.join(tempfile.gettempdir(), tempfile.gettempprefix() + decompfn)
-        else:
-            # use it as the path to where the decompressed file should go
-            decompfn = os.path.join(self.autodecompress, decompfn)
-
-        if os.path.exists(decompfn):
-            #assume it has already been decompressed
-            if self.verbose:
-                print("Not decompressing {0} because it already exists as {1}".format(fn, decompfn))
-        else:
-            if self.verbose:
-                print('Running {prog} to extract file {0} to {1}'.format(fn, decompfn, prog=decompresser))
-            sttime = time.time()
-            retcode = subprocess.call([decompresser, '-O', decompfn, fn])
-            etime = time.time()
-            if retcode != 0:
-                raise OSError('{prog} failed with return code '.format(prog=decompresser) + str(retcode))
-            if self.verbose:
-                print('{prog} finished in {0} secs'.format(etime - sttime, prog=decompresser))
+                        print("Moving XML output {0} to {1}".format(ofn, nfn))
+                    with self._phase('rename'):
+                        move(ofn, nfn)
+
+            #rename or compress checkimages if present
+            for ofn, nfn in cimgmap.items():
+                if os.path.isfile(ofn):
+                    if self.compresscheckimg is True:  # means "need to find fpack"
+                        self.compresscheckimg = utils.which_path('fpack')
+                        if self.compresscheckimg is None:
+                            warn("could not find fpack - cannot compress check images")
+
+                    if self.compresscheckimg:
+                        if self.verbose:
+                            print("Compressing check image {0} to {1}".format(ofn, nfn))
+                        cmdline = '{exc} -S -D -Y {ofn} > {nfn}'
+                        cmdline = cmdline.format(exc=self.compresscheckimg,
+                                                 ofn=ofn, nfn=nfn)
+                        with self._phase('compress'):
+                            subprocess.check_call([cmdline], shell=True)
+                    else:
+                        if self.verbose:
+                            print("Moving Check image {0} to {1}".format(ofn, nfn))
+                        with self._phase('rename'):
+                            move(ofn, nfn)
 
-        return decompfn
+            return catnfn
 
     def ds9_mark(self, mask=None, sizekey='FLUX_RADIUS', ds9=None, doload=True, clearmarks=True, frame=None):
         """
@@ -597,7 +1035,8 @@ class Sextractor(AstromaticTool):
         tempfileprefix : str
             the prefix for temporary files on the system used to generate this
             xml file.  The default should be right if you do this in the same
-            place you did the reductions.
+            place you did the reductions.  Files in a scratch space (see
+            `pyphotwrappers.scratch`) are recognized regardless.
 
         .. note::
             `compressedimgpaths` is only necessary because we have to decompress
@@ -608,6 +1047,8 @@ class Sextractor(AstromaticTool):
         """
         from xml.etree import cElementTree as et
 
+        from .scratch import is_scratch_path
+
         tree = et.parse(xmlfile)
 
         #make compressedimgpaths into a directory list
@@ -624,7 +1065,10 @@ class Sextractor(AstromaticTool):
         if not os.path.isfile(inputfn):
             #search for compressed versions in the compressedpathset
             newinputfn = None
-            truebaseinputfn = inputfn.replace(tempfileprefix, '')
+            if is_scratch_path(inputfn):
+                truebaseinputfn = os.path.basename(inputfn)[len(tempfile.gettempprefix()):]
+            else:
+                truebaseinputfn = inputfn.replace(tempfileprefix, '')
             for path in compressedpathset:
                 basefn = os.path.join(path, truebaseinputfn)
                 for ext in self.exttodecompresser:
@@ -660,7 +1104,7 @@ class Sextractor(AstromaticTool):
                     if 'meta.file' in p.get('ucd'):
                         # need to check for things that look like temp files, and
                         # skip them if they are supposed to be proxies
-                        if val.startswith(tempfileprefix):
+                        if val.startswith(tempfileprefix) or is_scratch_path(val):
                             #mean's it should be some sort of proxy
                             if 'Proxy' in self.cfg[cfgnm].__class__.__name__:
                                 if self.verbose:
@@ -690,14 +1134,49 @@ class Sextractor(AstromaticTool):
             self.lastimgfn = inputfn  # this might end up None, but that's fine because the previous value would be invalid anyway
         except Exception:
             #put back in the old settings
-            self.cfg._config_settings.clear()
-            self.cfg._config_settings.update(oldcfgset)
+            self.cfg._config_settings = oldcfgset
             del self.outputs[:len(self.outputs)]
             self.outputs[:] = oldoutputs
             #don't need to revert lastimgfn because it's the last thing in the try
             raise
 
 
+#state for the worker processes of `Sextractor.sextract_many`
+_sextract_many_tool = None
+
+
+def _copy_for_sextract_many(tool, timeout):
+    import copy
+
+    tool = copy.copy(tool)
+    if timeout is not None:
+        tool.timeout = timeout
+    return tool
+
+
+def _sextract_many_init(tool, timeout):
+    global _sextract_many_tool
+    _sextract_many_tool = _copy_for_sextract_many(tool, timeout)
+
+
+def _sextract_many_worker(imgfn):
+    return _sextract_many_result(_sextract_many_tool, imgfn)
+
+
+def _sextract_many_run(tool, imgfn):
+    try:
+        return _sextract_many_result(tool, imgfn), None
+    except Exception as e:
+        return None, e
+
+
+def _sextract_many_result(tool, imgfn):
+    result = tool._sextract_isolated(imgfn)
+    if isinstance(result, ProxyOutputFile):
+        result.source = None  # no need to send the tool's own proxy back too
+    return result
+
+
 def _generate_conv_filter_files_string(fns=None):
     from glob import glob
 
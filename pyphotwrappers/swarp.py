@@ -3,13 +3,20 @@ from __future__ import division, print_function
 import os
 
 from .astromatic import *
-from . import utils
+from .astromatic import _records_phases
+
+try:
+    basestring
+except NameError:  # Python 3
+    basestring = str
 
 __all__ = ['Swarp']
 
 
 class Swarp(AstromaticTool):
     defaultexecname = 'swarp'
+    acceptslistfiles = True
+    _OUTPUT_NAME_ITEMS = ('IMAGEOUT_NAME', 'WEIGHTOUT_NAME', 'XML_NAME')
 
     def __init__(self, execpath=None, autodecompress=True, keeptemps=False,
                  fluxscalebytexp=False, overwrite=True, verbose=False):
@@ -20,24 +27,94 @@ class Swarp(AstromaticTool):
         self.overwrite = overwrite
         self.fluxscalebytexp = fluxscalebytexp
 
-    def swarp_images(self, imgfns, headfns=None, weightfns=None):
+    @_records_phases
+    def swarp_images(self, imgfns, headfns=None, weightfns=None, timeout=None):
         """
         Runs swarp on the given `imgfns`, possibly with the supplied header
-        files and weight files.
+        files and weight files.  If it takes longer than `timeout` seconds
+        (None means the `timeout` attribute), it is killed, the temporary files
+        are removed, and an `AstromaticTimeoutError` is raised.
+
+        If there are many images, they are passed in a list file (see
+        `listfilethreshold`).  The header and weight files never go on the
+        command line, as they are linked in next to the images.  Compressed
+        weight files are decompressed along with the images (see
+        `autodecompress`).
+
+        If `overwrite` is False, nothing is done if the manifest next to the
+        output image shows it's up to date (see `writemanifests`).
         """
-        from astropy.io import fits
+        imgfns, headfns, weightfns = self._check_inputs(imgfns, headfns, weightfns)
+        inputfns, desccfg = self._get_run_description(imgfns, headfns, weightfns)
 
         if not self.overwrite:
-            if os.path.exists(self.cfg.IMAGEOUT_NAME):
-                print("Swarp output file {0} exists, not running Swarp.".format(self.cfg.IMAGEOUT_NAME))
-                return
-            elif os.path.exists(self.cfg.IMAGEOUT_NAME + '.fz'):
-                print("Swarp output file {0} exists, not running Swarp.".format(self.cfg.IMAGEOUT_NAME + '.fz'))
-                return
-            elif os.path.exists(self.cfg.IMAGEOUT_NAME + '.gz'):
-                print("Swarp output file {0} exists, not running Swarp.".format(self.cfg.IMAGEOUT_NAME + '.gz'))
+            if self._manifest_is_current(desccfg.IMAGEOUT_NAME, inputfns, desccfg):
+                print("Swarp output file {0} is up to date, not running Swarp.".format(desccfg.IMAGEOUT_NAME))
                 return
 
+        infns, weightfns, decompfns = self._decompress_images(imgfns, weightfns)
+        infns, links = self._determine_links(infns, headfns, weightfns)
+        listfn = None
+
+        try:
+            overrides = {'WEIGHT_IMAGE': ''}
+            if self.fluxscalebytexp:
+                with self._phase('fluxscale'):
+                    overrides['FSCALE_DEFAULT'] = self._fscales_from_texp(infns)
+
+            self._make_links(links)
+
+            arguments, listfn = self._input_arguments(infns)
+            self._invoke_tool(arguments, showoutput=True, timeout=timeout,
+                              cfg=self._snapshot_cfg(**overrides))
+        finally:
+            if listfn is not None:
+                self._remove_temp(listfn)
+            self._cleanup_temps(decompfns, links)
+        self._record_outputs(inputfns, desccfg)
+
+    def swarp_images_async(self, imgfns, headfns=None, weightfns=None, limiter=None,
+                           timeout=None):
+        """
+        An `asyncio` counterpart to `swarp_images`: returns a coroutine that
+        runs swarp on a snapshot of this object's configuration.
+
+        `limiter` is as for `invoke_async`.
+        """
+        from .asynctools import swarp_images_async
+
+        return swarp_images_async(self, imgfns, headfns, weightfns, limiter, timeout)
+
+    def _get_run_description(self, imgfns, headfns, weightfns):
+        """
+        Returns (inputfns, cfg) for the manifest of a run on the given files:
+        all the input files, and a snapshot with the settings that matter (the
+        flux scales from `fluxscalebytexp` are left out, as they follow from
+        the images).
+        """
+        inputfns = list(imgfns)
+        inputfns.extend([fn for fn in list(headfns) + list(weightfns) if fn is not None])
+        return inputfns, self._snapshot_cfg(WEIGHT_IMAGE='')
+
+    def _describe_run(self, cfg):
+        parts, fns = super(Swarp, self)._describe_run(cfg)
+        parts.append('fluxscalebytexp={0}'.format(bool(self.fluxscalebytexp)))
+        return parts, fns
+
+    def _record_outputs(self, inputfns, cfg):
+        """
+        Writes the manifest for a run on `inputfns` with the snapshot `cfg`.
+        """
+        outputfns = [cfg.IMAGEOUT_NAME, cfg.WEIGHTOUT_NAME]
+        if cfg.WRITE_XML.strip().upper() == 'Y':
+            outputfns.append(cfg.XML_NAME)
+        self._write_manifest(cfg.IMAGEOUT_NAME, inputfns, cfg, outputfns)
+
+    def _check_inputs(self, imgfns, headfns, weightfns):
+        """
+        Validates the inputs to `swarp_images`, returning (imgfns, headfns,
+        weightfns) as matching lists.
+        """
         if isinstance(imgfns, basestring):
             imgfns = [imgfns]
 
@@ -52,101 +129,78 @@ class Swarp(AstromaticTool):
                 raise ValueError('Gave a different number of weight files vs image files')
             if self.cfg.WEIGHT_TYPE == 'NONE':
                 raise ValueError("Weights were given, but WEIGHT_TYPE is 'NONE'")
+        return imgfns, headfns, weightfns
 
-        decompimgfns = [self._try_decompress(imfn) for imfn in imgfns]
-        infns = [imfn if dimfn is None else dimfn for imfn, dimfn in zip(imgfns, decompimgfns)]
-        links = self._determine_links(imgfns, headfns, weightfns)
-
-        oldwimg = self.cfg.WEIGHT_IMAGE
-        oldfxsdef = self.cfg.FSCALE_DEFAULT
-        try:
-            self.cfg.WEIGHT_IMAGE = ''
+    def _fscales_from_texp(self, infns):
+        """
+        Returns the FSCALE_DEFAULT value that scales each of `infns` by
+        1/EXPTIME.
+        """
+        from astropy.io import fits
 
-            if self.fluxscalebytexp:
-                fscales=[]
-                for fn in infns:
-                    hdr = fits.getheader(fn, 0)
-                    if self.cfg.FSCALE_KEYWORD in hdr:
-                        print('Asked to set the flux scale by t_exp, but file '
-                              '"{0}" has a keyword "{1}", so t_exp will be '
-                              'ignored.'.format(fn, self.cfg.FSCALE_KEYWORD))
-                    fscales.append('{0}'.format(1/hdr['EXPTIME']))
-                self.cfg.FSCALE_DEFAULT = ','.join(fscales)
-
-            for target, linkname in links:
-                if not os.path.exists(linkname):
-                    os.symlink(target, linkname)
-
-            self._invoke_tool(infns, showoutput=True)
+        fscales = []
+        for fn in infns:
+            hdr = fits.getheader(fn, 0)
+            if self.cfg.FSCALE_KEYWORD in hdr:
+                print('Asked to set the flux scale by t_exp, but file '
+                      '"{0}" has a keyword "{1}", so t_exp will be '
+                      'ignored.'.format(fn, self.cfg.FSCALE_KEYWORD))
+            fscales.append('{0}'.format(1/hdr['EXPTIME']))
+        return ','.join(fscales)
+
+    def _make_links(self, links):
+        for target, linkname in links:
+            if not os.path.exists(linkname):
+                os.symlink(target, linkname)
+
+    def _decompress_images(self, imgfns, weightfns):
+        """
+        Decompresses the images and weight files, all at once (see
+        `_decompress_many`).  Returns (imgfns, weightfns, decompfns): the
+        names to give swarp (the decompressed ones where there are any), and
+        the decompressed files to pass to `_cleanup_temps`.
+        """
+        allfns = list(imgfns) + list(weightfns)
+        decompfns = self._decompress_many(allfns)
+        infns = [fn if dfn is None else dfn for fn, dfn in zip(allfns, decompfns)]
+        return infns[:len(imgfns)], infns[len(imgfns):], decompfns
 
-        finally:
-            self.cfg.WEIGHT_IMAGE = oldwimg
-            self.cfg.FSCALE_DEFAULT = oldfxsdef
+    def _cleanup_temps(self, decompfns, links):
+        with self._phase('cleanup'):
             if not self.keeptemps:
-                for decompfn in decompimgfns:
-                    if decompfn is not None:
-                        if os.path.isfile(decompfn):
-                            os.remove(decompfn)
                 for target, linkname in links:
                     if os.path.islink(linkname):
-                        os.remove(linkname)
+                        self._remove_temp(linkname)
+            self._remove_decompressed(decompfns)
 
     def _determine_links(self, imgfns, headfns, weightfns):
         """
-        Returns a sequence of (target, linkname) tuples of links to create for
-        the header and weight files.
+        Returns (imgfns, links), where `links` is a sequence of
+        (target, linkname) tuples of links to create for the header and weight
+        files.  `imgfns` should be the names actually given to swarp, so that
+        links for decompressed images end up next to them (i.e., in the scratch
+        space if that's where they are).
+
+        Frames in the `framecache` are shared with other runs, so those that
+        need links are themselves linked into the scratch space, and the
+        returned `imgfns` have those names instead.
         """
+        import uuid
+
         links = []
+        linkedimgfns = []
         for imgfn, headfn, wfn in zip(imgfns, headfns, weightfns):
+            if ((headfn is not None or wfn is not None) and self.framecache is not None
+                    and self.framecache.owns(imgfn)):
+                linkname = self._get_scratch().mkpath('{0}_{1}'.format(uuid.uuid4().hex[:8],
+                                                                       os.path.basename(imgfn)))
+                links.append((imgfn, linkname))
+                imgfn = linkname
+            linkedimgfns.append(imgfn)
+
             baseimgfn = imgfn.split('.fits')[0]
             if headfn is not None:
                 links.append((headfn, baseimgfn + self.cfg.HEADER_SUFFIX))
             if wfn is not None:
                 links.append((wfn, baseimgfn + self.cfg.WEIGHT_SUFFIX))
-        return links
-
-    def _try_decompress(self, fn):
-        """
-        runs funpack if necessary.
-
-        Returns a file name for the decompressed file, or None if decompression
-        not needed
-        """
-        import time
-        import subprocess
-
-        if not self.autodecompress:
-            return None  # bail immediately
-
-        for ext in utils.fitsextension_to_decompresser:
-            if fn.endswith(ext):
-                decompresser = utils.which_path(utils.fitsextension_to_decompresser[ext])
-                break
-        else:
-            return None  # not a decompressible file
-
-        decompfn = os.path.split(fn[:-len(ext)])[1]  # the base file name
-        if self.autodecompress is True:
-            decompfn = os.path.join(os.path.split(fn)[0], decompfn)
-        elif self.autodecompress == 'tempfile':
-            decompfn = os.path.join(tempfile.gettempdir(), tempfile.gettempprefix() + decompfn)
-        else:
-            # use it as the path to where the decompressed file should go
-            decompfn = os.path.join(self.autodecompress, decompfn)
-
-        if os.path.exists(decompfn):
-            #assume it has already been decompressed
-            if self.verbose:
-                print("Not decompressing {0} because it already exists as {1}".format(fn, decompfn))
-        else:
-            if self.verbose:
-                print('Running {prog} to extract file {0} to {1}'.format(fn, decompfn, prog=decompresser))
-            sttime = time.time()
-            retcode = subprocess.call([decompresser, '-O', decompfn, fn])
-            etime = time.time()
-            if retcode != 0:
-                raise OSError('{prog} failed with return code '.format(prog=decompresser) + str(retcode))
-            if self.verbose:
-                print('{prog} finished in {0} secs'.format(etime - sttime, prog=decompresser))
-
-        return decompfn
+        return linkedimgfns, links
@@ -0,0 +1,24 @@
+"""
+Helpers for the tests that run the tools, using the stand-in executables the
+benchmarks use (in ``benchmarks/fakes`` of the source tree).
+"""
+import os
+
+import pytest
+
+FAKES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         os.pardir, os.pardir, 'benchmarks', 'fakes')
+
+
+def fake_execpath(name, monkeypatch):
+    """
+    Returns the path of the stand-in for the tool `name` (``'sex'``,
+    ``'scamp'`` or ``'swarp'``), skipping the test if it isn't there (e.g.
+    when testing an installed copy of the package).  The stand-ins are kept
+    quiet for the rest of the test with `monkeypatch` (the pytest fixture).
+    """
+    path = os.path.abspath(os.path.join(FAKES_DIR, name))
+    if not os.path.isfile(path):
+        pytest.skip('the stand-in executables are not available')
+    monkeypatch.setenv('FAKEASTROMATIC_CHATTER', '0')
+    return path
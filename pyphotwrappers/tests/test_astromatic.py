@@ -0,0 +1,98 @@
+import os
+import sys
+import gzip
+import time
+
+import pytest
+
+from ..astromatic import AstromaticTool, AstromaticTimeoutError
+from ..sextractor import Sextractor
+from .helpers import fake_execpath
+
+
+@pytest.mark.skipif(not hasattr(os, 'killpg'), reason='needs process groups')
+def test_timeout_kills_process_group(tmpdir):
+    # the tool starts a child that holds its output open, so the run only
+    # finishes quickly if the child is killed along with the tool
+    script = tmpdir.join('slowtool')
+    script.write('#!/bin/sh\nsleep 30 &\nwait\n')
+    script.chmod(0o755)
+    tool = AstromaticTool(str(script), initialconfig={})
+
+    sttime = time.time()
+    with pytest.raises(AstromaticTimeoutError):
+        tool._invoke_tool([tool.execpath], useconfig=False, timeout=0.5)
+    assert time.time() - sttime < 10
+    assert tool.lastrecord.timedout
+
+
+def test_only_own_decompressed_files_removed(tmpdir, monkeypatch):
+    monkeypatch.setattr(AstromaticTool, 'dumpcachedir', False)
+    sex = Sextractor(fake_execpath('sex', monkeypatch))
+    sex.use_proxy_catalog()
+    fns = []
+    for nm in ('a', 'b'):
+        fns.append(str(tmpdir.join(nm + '.fits.gz')))
+        with gzip.open(fns[-1], 'wb') as f:
+            f.write(b'x' * 1000)
+    # a decompressed copy the user made, which is used but left alone
+    tmpdir.join('b.fits').write('mine')
+
+    sex.sextract_double(fns[0], fns[1])
+    assert sex.lastinvocation[1:3] == [str(tmpdir.join('a.fits')), str(tmpdir.join('b.fits'))]
+    assert sorted(os.listdir(str(tmpdir))) == ['a.fits.gz', 'b.fits', 'b.fits.gz']
+
+    # likewise for cleaning up after a run that died
+    sex.keeptemps = True
+    sex.sextract_single(fns[0])
+    assert os.path.isfile(str(tmpdir.join('a.fits')))
+    sex._remove_orphaned_temps(fns)
+    assert sorted(os.listdir(str(tmpdir))) == ['a.fits.gz', 'b.fits', 'b.fits.gz']
+    assert tmpdir.join('b.fits').read() == 'mine'
+
+
+def make_chatty_tool(tmpdir):
+    # prints more than a pipe holds on both streams, so it blocks unless its
+    # output keeps being read
+    script = tmpdir.join('chattytool')
+    script.write('#!{0}\n'
+                 'import sys\n'
+                 'for i in range(2000):\n'
+                 '    sys.stdout.write("out %d\\n" % i)\n'
+                 '    sys.stderr.write("err %d\\n" % i)\n'.format(sys.executable))
+    script.chmod(0o755)
+    tool = AstromaticTool(str(script), initialconfig={})
+
+    def callback(name, line):
+        raise ValueError('bad callback')
+    tool.outputcallback = callback
+    return tool
+
+
+def check_chatty_output(stdout, stderr, warnings):
+    assert stdout.endswith('out 1999\n')
+    assert stderr.endswith('err 1999\n')
+    # once for each stream
+    assert len([w for w in warnings if 'bad callback' in str(w.message)]) == 2
+
+
+def test_output_callback_errors(tmpdir):
+    tool = make_chatty_tool(tmpdir)
+    with pytest.warns(UserWarning) as warnings:
+        stdout, stderr = tool._invoke_tool([tool.execpath], useconfig=False, timeout=60)
+    check_chatty_output(stdout, stderr, warnings)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason='needs async syntax')
+def test_output_callback_errors_async(tmpdir):
+    import asyncio
+
+    tool = make_chatty_tool(tmpdir)
+    loop = asyncio.new_event_loop()
+    try:
+        with pytest.warns(UserWarning) as warnings:
+            stdout, stderr = loop.run_until_complete(
+                tool.invoke_async([tool.execpath], useconfig=False, timeout=60))
+    finally:
+        loop.close()
+    check_chatty_output(stdout, stderr, warnings)
@@ -0,0 +1,94 @@
+import os
+import signal
+
+import pytest
+
+from ..astromatic import AstromaticTool
+from ..batch import DONE, RUNNING, JobJournal, WatchedPool, _job_id
+from ..sextractor import Sextractor
+from .helpers import fake_execpath
+
+
+def test_journal_after_torn_line(tmpdir):
+    fn = str(tmpdir.join('journal'))
+    journal = JobJournal(fn)
+    journal.open()
+    journal.record('a', DONE)
+    journal.close()
+    # a crash in the middle of writing an entry
+    with open(fn, 'a') as f:
+        f.write('{"job": "b", "sta')
+
+    journal.open()
+    journal.record(['b', 'c'], DONE, result='out.cat')
+    journal.close()
+
+    entries = JobJournal(fn).read()
+    assert sorted(entries) == ['a', 'b', 'c']
+    assert entries['c']['state'] == DONE
+    assert entries['c']['result'] == 'out.cat'
+
+
+def test_journal_is_exclusive(tmpdir):
+    fn = str(tmpdir.join('journal'))
+    journal = JobJournal(fn)
+    journal.open()
+    try:
+        with pytest.raises(RuntimeError):
+            JobJournal(fn).open()
+    finally:
+        journal.close()
+
+
+def test_resume_batch(tmpdir, monkeypatch):
+    monkeypatch.setattr(AstromaticTool, 'dumpcachedir', False)
+    sex = Sextractor(fake_execpath('sex', monkeypatch))
+    sex.cfg.CATALOG_NAME = str(tmpdir.join('out.cat'))
+    imgfns = []
+    for i in range(3):
+        imgfns.append(str(tmpdir.join('img{0}.fits'.format(i))))
+        with open(imgfns[-1], 'w') as f:
+            f.write('x')
+
+    # a batch that died while running the second job, halfway through
+    # writing that the third had started
+    journalfn = str(tmpdir.join('journal'))
+    journal = JobJournal(journalfn)
+    journal.open()
+    journal.record(_job_id([imgfns[0]]), DONE, result='first.cat')
+    journal.record(_job_id([imgfns[1]]), RUNNING)
+    journal.close()
+    with open(journalfn, 'a') as f:
+        f.write('{"job": ')
+
+    results, errors = sex.run_batch('sextract_single', imgfns, journalfn)
+    assert errors == [None] * 3
+    assert results == ['first.cat', sex.cfg.CATALOG_NAME, sex.cfg.CATALOG_NAME]
+    runs = [rec for rec in sex.records if rec.argv[1] in imgfns]
+    assert [rec.argv[1] for rec in runs] == imgfns[1:]
+
+    entries = JobJournal(journalfn).read()
+    assert [entries[_job_id([fn])]['state'] for fn in imgfns] == [DONE] * 3
+
+    # and everything is done now
+    results, errors = sex.run_batch('sextract_single', imgfns, journalfn)
+    assert len([rec for rec in sex.records if rec.argv[1] in imgfns]) == 2
+
+
+def _square_or_die(x):
+    if x < 0:
+        os.kill(os.getpid(), signal.SIGKILL)
+    return x * x
+
+
+def test_pool_survives_dead_worker():
+    pool = WatchedPool(2)
+    try:
+        for i, x in enumerate([1, -1, 3]):
+            pool.submit(i, _square_or_die, (x,))
+        finished = sorted([pool.next_finished() for i in range(3)], key=lambda res: res[0])
+    finally:
+        pool.close()
+    assert [(i, result) for i, result, error in finished] == [(0, 1), (1, None), (2, 9)]
+    assert isinstance(finished[1][2], RuntimeError)
+    assert finished[0][2] is None
@@ -0,0 +1,105 @@
+import pytest
+
+from ..astromatic import AstromaticConfiguration, ProxyInputFile
+
+CONFIG = {'DETECT_THRESH': '1.5', 'ANALYSIS_THRESH': '1.5', 'FILTER': 'Y'}
+
+
+def test_derive_shares_base_values():
+    base = AstromaticConfiguration(CONFIG)
+    derived = base.derive(DETECT_THRESH='3')
+    assert derived.DETECT_THRESH == '3'
+    assert base.DETECT_THRESH == '1.5'
+
+    base.ANALYSIS_THRESH = '2'
+    base.DETECT_THRESH = '4'
+    assert derived.ANALYSIS_THRESH == '2'
+    assert derived.DETECT_THRESH == '3'  # still overridden
+
+    derived.FILTER = 'N'
+    assert base.FILTER == 'Y'
+
+    with pytest.raises(KeyError):
+        base.derive(NOT_AN_ITEM='1')
+
+
+def test_derived_items_follow_base_changes():
+    base = AstromaticConfiguration(CONFIG)
+    derived = base.derive()
+    args = derived.get_cmdline_arguments()
+    assert args[args.index('-DETECT_THRESH') + 1] == '1.5'
+
+    # the normalized items are cached, so this checks the cache is dropped
+    base.DETECT_THRESH = '5'
+    args = derived.get_cmdline_arguments()
+    assert args[args.index('-DETECT_THRESH') + 1] == '5'
+
+    derived.DETECT_THRESH = '6'
+    assert dict(derived.get_normalized_items())['DETECT_THRESH'] == '6'
+    assert dict(base.get_normalized_items())['DETECT_THRESH'] == '5'
+
+
+def test_snapshot_is_frozen_and_independent():
+    base = AstromaticConfiguration(CONFIG)
+    base.get_normalized_items()  # fill the cache
+    snap = base.derive(ANALYSIS_THRESH='7').snapshot(DETECT_THRESH='8')
+    assert dict(snap.get_normalized_items()) == {'DETECT_THRESH': '8',
+                                                 'ANALYSIS_THRESH': '7',
+                                                 'FILTER': 'Y'}
+
+    base.FILTER = 'N'
+    assert snap.FILTER == 'Y'
+    assert dict(snap.get_normalized_items())['FILTER'] == 'Y'
+
+    with pytest.raises(TypeError):
+        snap.FILTER = 'N'
+
+
+def test_snapshot_copies_proxies():
+    base = AstromaticConfiguration(dict(CONFIG, PARAMETERS_NAME='default.param'))
+    base.PARAMETERS_NAME = ProxyInputFile('NUMBER')
+    snap = base.snapshot()
+    assert snap.PARAMETERS_NAME is not base.PARAMETERS_NAME
+    assert snap.PARAMETERS_NAME.source is base.PARAMETERS_NAME
+    assert snap.get_proxies()[0] == [snap.PARAMETERS_NAME]
+
+    # ...unless it's for a run that fills in this snapshot's outputs
+    assert snap._with_values(FILTER='N').PARAMETERS_NAME is snap.PARAMETERS_NAME
+
+
+DUMP = """# Default configuration file
+#
+CATALOG_NAME     test.cat       # name of the output catalog
+CATALOG_TYPE     ASCII_HEAD     # NONE,ASCII,ASCII_HEAD, ASCII_SKYCAT,
+                                # ASCII_VOTABLE, FITS_1.0 or FITS_LDAC
+#---------------------- Extraction ----------------------
+HEADER_SUFFIX    .head#1        # a value with a '#' in it
+PHOT_APERTURES   5              # MAG_APER aperture diameter(s) in pixels
+EMPTY_ITEM                      # an item with no value
+FLAG_IMAGE       a#b.fits,c.fits
+"""
+
+
+def test_parse_config_dump():
+    cfg = AstromaticConfiguration(DUMP)
+    assert cfg.names == ('CATALOG_NAME', 'CATALOG_TYPE', 'HEADER_SUFFIX',
+                         'PHOT_APERTURES', 'EMPTY_ITEM', 'FLAG_IMAGE')
+    assert cfg.CATALOG_NAME == 'test.cat'
+    assert cfg.HEADER_SUFFIX == '.head#1'
+    assert cfg.EMPTY_ITEM == ''
+    assert cfg.FLAG_IMAGE == 'a#b.fits,c.fits'
+
+    assert cfg.comments.CATALOG_NAME == ' name of the output catalog'
+    assert cfg.comments.HEADER_SUFFIX == " a value with a '#' in it"
+    assert cfg.comments.FLAG_IMAGE == ''
+    assert cfg.comments.CATALOG_TYPE.endswith('ASCII_SKYCAT, ASCII_VOTABLE, FITS_1.0 or FITS_LDAC')
+
+
+def test_parsed_dumps_are_not_shared_between_configurations():
+    # parses are memoized, so changing one configuration mustn't change
+    # another made from the same dump
+    cfg1 = AstromaticConfiguration(DUMP)
+    cfg2 = AstromaticConfiguration(DUMP)
+    cfg1.CATALOG_NAME = 'other.cat'
+    assert cfg2.CATALOG_NAME == 'test.cat'
+    assert AstromaticConfiguration(DUMP).CATALOG_NAME == 'test.cat'
@@ -0,0 +1,101 @@
+import os
+
+from ..framecache import FrameCache
+
+
+class Decompresser(object):
+    """
+    Stands in for decompressing a frame: writes 1000 bytes, and counts calls.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, fn, outfn):
+        self.calls.append(fn)
+        with open(outfn, 'wb') as f:
+            f.write(b'x' * 1000)
+
+
+def make_frames(tmpdir, names):
+    fns = []
+    for nm in names:
+        fn = tmpdir.join(nm + '.fits.fz')
+        fn.write('x' * 100)  # guessed to decompress to 400 bytes
+        fns.append(str(fn))
+    return fns
+
+
+def set_last_used(framefn, when):
+    os.utime(os.path.dirname(framefn), (when, when))
+
+
+def test_frames_are_refcounted(tmpdir):
+    cache = FrameCache(str(tmpdir.join('cache')))
+    decompress = Decompresser()
+    fn, = make_frames(tmpdir, ['a'])
+
+    framefn = cache.acquire(fn, decompress, 'a.fits')
+    assert cache.acquire(fn, decompress, 'a.fits') == framefn
+    assert decompress.calls == [fn]
+    assert cache.owns(framefn)
+    assert not cache.owns(fn)
+    assert cache.size() == 1000
+
+    cache.release(framefn)
+    cache.clear()
+    assert os.path.isfile(framefn)  # still held once
+    cache.release(framefn)
+    cache.clear()
+    assert not os.path.exists(framefn)
+    assert cache.size() == 0
+
+    # and it's made again when needed
+    assert cache.acquire(fn, decompress, 'a.fits') == framefn
+    assert decompress.calls == [fn, fn]
+    cache.release(framefn)
+
+
+def test_frames_shared_between_caches(tmpdir):
+    # e.g. in different processes
+    cache1 = FrameCache(str(tmpdir.join('cache')))
+    cache2 = FrameCache(str(tmpdir.join('cache')))
+    decompress = Decompresser()
+    fn, = make_frames(tmpdir, ['a'])
+
+    framefn = cache1.acquire(fn, decompress, 'a.fits')
+    assert cache2.acquire(fn, decompress, 'a.fits') == framefn
+    assert len(decompress.calls) == 1
+    cache1.release(framefn)
+    cache1.clear()
+    assert os.path.isfile(framefn)  # cache2 still holds it
+    cache2.release(framefn)
+
+
+def test_least_recently_used_evicted(tmpdir):
+    cache = FrameCache(str(tmpdir.join('cache')), maxbytes=2200)
+    decompress = Decompresser()
+    afn, bfn, cfn, dfn = make_frames(tmpdir, ['a', 'b', 'c', 'd'])
+
+    aframe = cache.acquire(afn, decompress, 'a.fits')
+    bframe = cache.acquire(bfn, decompress, 'b.fits')
+    cache.release(aframe)
+    cache.release(bframe)
+    set_last_used(aframe, 1000)
+    set_last_used(bframe, 2000)
+
+    # room is made for the new frame first, so the oldest goes
+    cframe = cache.acquire(cfn, decompress, 'c.fits')
+    assert not os.path.exists(aframe)
+    assert os.path.isfile(bframe) and os.path.isfile(cframe)
+    cache.release(cframe)
+
+    # frames in use are never evicted, even if they're the oldest
+    assert cache.acquire(bfn, decompress, 'b.fits') == bframe
+    set_last_used(bframe, 1000)
+    set_last_used(cframe, 2000)
+    dframe = cache.acquire(dfn, decompress, 'd.fits')
+    assert os.path.isfile(bframe) and os.path.isfile(dframe)
+    assert not os.path.exists(cframe)
+    assert cache.size() == 2000
+    cache.release(bframe)
+    cache.release(dframe)
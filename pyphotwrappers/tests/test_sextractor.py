@@ -0,0 +1,70 @@
+import os
+
+from ..astromatic import AstromaticTool
+from ..manifest import manifest_fn
+from ..sextractor import Sextractor
+from .helpers import fake_execpath
+
+
+def count_runs(tool, imgfn):
+    # the tool is also run for its dumps, so only count the runs on `imgfn`
+    return len([rec for rec in tool.records if imgfn in rec.argv])
+
+
+def test_manifest_skips_up_to_date_runs(tmpdir, monkeypatch):
+    monkeypatch.setattr(AstromaticTool, 'dumpcachedir', False)
+    sex = Sextractor(fake_execpath('sex', monkeypatch), overwrite=False)
+    catfn = str(tmpdir.join('out.cat'))
+    sex.cfg.CATALOG_NAME = catfn
+    imgfn = str(tmpdir.join('img.fits'))
+    with open(imgfn, 'w') as f:
+        f.write('x')
+
+    def runs():
+        sex.sextract_single(imgfn)
+        return count_runs(sex, imgfn)
+
+    n = runs()
+    assert os.path.isfile(manifest_fn(catfn))
+    assert runs() == n  # skipped
+
+    sex.cfg.DETECT_THRESH = '4'
+    n += 1
+    assert runs() == n  # the settings changed
+    assert runs() == n
+
+    with open(imgfn, 'w') as f:
+        f.write('xx')
+    n += 1
+    assert runs() == n  # the input changed
+
+    with open(catfn, 'a') as f:
+        f.write('x')
+    n += 1
+    assert runs() == n  # the output changed
+
+    os.remove(catfn)
+    n += 1
+    assert runs() == n  # the output is gone
+
+
+def test_no_skipping_without_manifest(tmpdir, monkeypatch):
+    monkeypatch.setattr(AstromaticTool, 'dumpcachedir', False)
+    sex = Sextractor(fake_execpath('sex', monkeypatch), overwrite=False)
+    catfn = str(tmpdir.join('out.cat'))
+    sex.cfg.CATALOG_NAME = catfn
+    imgfn = str(tmpdir.join('img.fits'))
+    with open(imgfn, 'w') as f:
+        f.write('x')
+
+    # an existing output with no manifest may not be up to date
+    with open(catfn, 'w') as f:
+        f.write('old')
+    sex.sextract_single(imgfn)
+    assert count_runs(sex, imgfn) == 1
+
+    # and a proxy catalog has nowhere to keep one, so always runs
+    sex.use_proxy_catalog()
+    for i in range(2):
+        assert sex.sextract_single(imgfn).content
+    assert count_runs(sex, imgfn) == 3
@@ -0,0 +1,42 @@
+import os
+
+from ..astromatic import AstromaticTool
+from ..swarp import Swarp
+from .helpers import fake_execpath
+
+
+def make_images(tmpdir, n):
+    fns = []
+    for i in range(n):
+        fn = tmpdir.join('img{0}.fits'.format(i))
+        fn.write('x')
+        fns.append(str(fn))
+    return fns
+
+
+def test_list_file_for_many_inputs(tmpdir, monkeypatch):
+    monkeypatch.setattr(AstromaticTool, 'dumpcachedir', False)
+    swarp = Swarp(fake_execpath('swarp', monkeypatch))
+    swarp.cfg.IMAGEOUT_NAME = str(tmpdir.join('coadd.fits'))
+    swarp.cfg.WEIGHTOUT_NAME = str(tmpdir.join('coadd.weight.fits'))
+    swarp.cfg.XML_NAME = str(tmpdir.join('swarp.xml'))
+    imgfns = make_images(tmpdir, 3)
+
+    # short enough to go on the command line
+    swarp.swarp_images(imgfns)
+    assert swarp.lastinvocation[1:4] == imgfns
+
+    # too long, so they go in a list file, which is removed afterwards
+    swarp.listfilethreshold = sum([len(fn) + 1 for fn in imgfns]) - 1
+    swarp.swarp_images(imgfns)
+    listarg = swarp.lastinvocation[1]
+    assert listarg.startswith('@')
+    assert imgfns[0] not in swarp.lastinvocation
+    assert not os.path.exists(listarg[1:])
+    assert os.path.isfile(swarp.cfg.IMAGEOUT_NAME)
+
+    # names with spaces can't go in a list file
+    spacefn = str(tmpdir.join('an image.fits'))
+    assert swarp._input_arguments(imgfns + [spacefn]) == (imgfns + [spacefn], None)
+    swarp.listfilethreshold = None
+    assert swarp._input_arguments(imgfns) == (imgfns, None)
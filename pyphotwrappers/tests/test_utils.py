@@ -0,0 +1,102 @@
+import os
+import time
+import threading
+import multiprocessing
+
+import pytest
+
+from ..utils import exclusive_lock, open_with_shared_lock, remove_if_unused
+
+
+def test_exclusive_lock_threads(tmpdir):
+    lockfn = str(tmpdir.join('x.lock'))
+    inside = []
+    overlaps = []
+
+    def locker():
+        for i in range(5):
+            with exclusive_lock(lockfn):
+                inside.append(1)
+                if len(inside) > 1:
+                    overlaps.append(1)
+                time.sleep(0.001)
+                inside.pop()
+
+    threads = [threading.Thread(target=locker) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not overlaps
+    assert not os.path.exists(lockfn)
+
+
+def _hold_lock(lockfn, lockedfn, seconds):
+    with exclusive_lock(lockfn):
+        open(lockedfn, 'w').close()
+        time.sleep(seconds)
+        os.remove(lockedfn)
+
+
+def test_exclusive_lock_processes(tmpdir):
+    lockfn = str(tmpdir.join('x.lock'))
+    lockedfn = str(tmpdir.join('locked'))
+    p = multiprocessing.Process(target=_hold_lock, args=(lockfn, lockedfn, 0.5))
+    p.start()
+    try:
+        while not os.path.exists(lockedfn) and p.is_alive():
+            time.sleep(0.01)
+        with exclusive_lock(lockfn):
+            assert not os.path.exists(lockedfn)  # the other process is done
+    finally:
+        p.join()
+    assert p.exitcode == 0
+
+
+def test_remove_if_unused(tmpdir):
+    fn = str(tmpdir.join('frame.fits'))
+    open(fn, 'w').close()
+
+    f = open_with_shared_lock(fn)
+    try:
+        assert not remove_if_unused(fn)
+        assert os.path.isfile(fn)
+    finally:
+        f.close()
+    assert remove_if_unused(fn)
+    assert not os.path.exists(fn)
+    assert open_with_shared_lock(fn) is None
+    assert not remove_if_unused(fn)
+
+
+def test_funpack_inprocess_matches_funpack(tmpdir):
+    import subprocess
+
+    from ..utils import decompress_inprocess, find_decompresser
+
+    fits = pytest.importorskip('astropy.io.fits')
+    np = pytest.importorskip('numpy')
+    funpack = find_decompresser('.fz')
+    if funpack is None:
+        pytest.skip('funpack is not installed')
+
+    # a primary image and an image extension, as fpack would write them
+    data = np.arange(400, dtype='i2').reshape(20, 20)
+    header = fits.PrimaryHDU(data).header
+    header['OBJECT'] = 'test'
+    fn = str(tmpdir.join('img.fits.fz'))
+    fits.HDUList([fits.PrimaryHDU(), fits.CompImageHDU(data, header),
+                  fits.CompImageHDU(data * 2, name='SCI')]).writeto(fn)
+
+    funpackedfn = str(tmpdir.join('funpacked.fits'))
+    subprocess.check_call([funpack, '-O', funpackedfn, fn])
+    outfn = str(tmpdir.join('img.fits'))
+    decompress_inprocess(fn, outfn)
+
+    with fits.open(funpackedfn) as expected:
+        with fits.open(outfn) as got:
+            assert ([(type(hdu), hdu.shape) for hdu in got] ==
+                    [(type(hdu), hdu.shape) for hdu in expected])
+            assert got[0].header['OBJECT'] == 'test'
+            for gothdu, expectedhdu in zip(got, expected):
+                assert (gothdu.data == expectedhdu.data).all()
@@ -2,3 +2,468 @@
 
 # This sub-module is destined for common non-package specific utility
 # functions that will ultimately be merged into `astropy.utils`
+
+
+def which_path(execname):
+    """
+    Returns either the path to `execname` or None if it can't be found
+
+    Searches the ``PATH`` directly (like the ``which`` command) rather than
+    spawning ``which``.
+    """
+    import os
+    from warnings import warn
+
+    for dirnm in os.environ.get('PATH', os.defpath).split(os.pathsep):
+        path = os.path.join(dirnm, execname)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+
+    warn('Failed to find the executable {0} on the PATH, is it '
+         'installed?'.format(execname))
+    return None
+
+
+class exclusive_lock(object):
+    """
+    A context manager holding an exclusive `fcntl.flock` lock on the file
+    `lockfn`, which is created if need be and removed again when the lock is
+    let go of.  Threads in one process exclude each other too, as each
+    opens the file separately.
+    """
+    def __init__(self, lockfn):
+        self.lockfn = lockfn
+        self._f = None
+
+    def __enter__(self):
+        import os
+        import fcntl
+
+        while True:
+            f = open(self.lockfn, 'a')
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                # the last holder may have removed it while we were waiting
+                if os.path.samestat(os.fstat(f.fileno()), os.stat(self.lockfn)):
+                    self._f = f
+                    return f
+            except OSError:
+                pass
+            f.close()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        import os
+
+        try:
+            os.remove(self.lockfn)
+        except OSError:
+            pass
+        self._f.close()
+        self._f = None
+
+
+def open_with_shared_lock(fn):
+    """
+    Opens `fn` for reading and takes a shared `fcntl.flock` lock on it, to
+    say it's in use until the returned file is closed.  Returns None if `fn`
+    doesn't exist (or was removed while we were waiting for the lock).
+    """
+    import os
+    import fcntl
+
+    try:
+        f = open(fn, 'rb')
+    except (IOError, OSError):
+        return None
+    fcntl.flock(f.fileno(), fcntl.LOCK_SH)
+    try:
+        if os.path.samestat(os.fstat(f.fileno()), os.stat(fn)):
+            return f
+    except OSError:
+        pass
+    f.close()
+    return None
+
+
+def remove_if_unused(fn, remove=None):
+    """
+    Removes `fn` unless someone holds a lock on it (see
+    `open_with_shared_lock`), calling ``remove(fn)`` to do it if given.
+    Returns True if it was removed.
+    """
+    import os
+    import fcntl
+
+    try:
+        f = open(fn, 'rb')
+    except (IOError, OSError):
+        return False
+    try:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            return False  # in use
+        (os.remove if remove is None else remove)(fn)
+        return True
+    finally:
+        f.close()
+
+
+def nested_mkdir(dirnm):
+    """
+    makes a directory and all those leading up to it if they don't exist
+    """
+    import os
+
+    dirsmade = []
+    segments = dirnm.split(os.sep)
+    for i in range(len(segments)):
+        dirnm = os.sep.join(segments[:(i + 1)])
+        if dirnm and not os.path.isdir(dirnm):
+            os.mkdir(dirnm)
+            dirsmade.append(dirnm)
+    return dirsmade
+
+
+def hash_strings(strs):
+    """
+    Returns the hex SHA-1 digest of a sequence of strings (or bytes), each
+    followed by a NUL so that different splits of the same text differ.
+    """
+    import hashlib
+
+    sha = hashlib.sha1()
+    for s in strs:
+        if not isinstance(s, bytes):
+            s = s.encode('utf-8')
+        sha.update(s)
+        sha.update(b'\0')
+    return sha.hexdigest()
+
+
+def file_sha1(fn, chunksize=1024 * 1024):
+    """
+    Returns the hex SHA-1 digest of the contents of the file `fn`.
+    """
+    import hashlib
+
+    sha = hashlib.sha1()
+    with open(fn, 'rb') as f:
+        while True:
+            chunk = f.read(chunksize)
+            if not chunk:
+                break
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class LRUDirectoryCache(object):
+    """
+    The on-disk layout shared by `pyphotwrappers.resultcache.ResultCache`
+    and `pyphotwrappers.framecache.FrameCache`: a directory `path` with a
+    subdirectory per entry, whose modification time says when it was last
+    used, and from which the least recently used entries are evicted once
+    they add up to more than `maxbytes`.
+
+    Entries are made in a temporary directory (`_make_temp_dir`) and renamed
+    into place, and moved out of the way before they're deleted, so nobody
+    ever sees a partial entry.  Subclasses can override `_remove_entry` to
+    keep entries that are in use.
+    """
+    TEMP_PREFIX = 'tmp-'
+    TRASH_PREFIX = 'trash-'
+    LOCK_SUFFIX = '.lock'  # names ending in this are never entries
+
+    def __init__(self, path, maxbytes):
+        self.path = path
+        self.maxbytes = maxbytes
+
+    def size(self):
+        """
+        Returns the number of bytes in all the entries.
+        """
+        return sum([nbytes for mtime, nbytes, entrydir in self._scan()])
+
+    def evict(self, maxbytes=None):
+        """
+        Removes the least recently used entries until the rest add up to no
+        more than `maxbytes` (None means the `maxbytes` attribute).  Returns
+        the number of bytes left.
+        """
+        if maxbytes is None:
+            maxbytes = self.maxbytes
+
+        entries = sorted(self._scan())
+        total = sum([nbytes for mtime, nbytes, entrydir in entries])
+        for mtime, nbytes, entrydir in entries:
+            if total <= maxbytes:
+                break
+            if self._remove_entry(entrydir):
+                total -= nbytes
+        return total
+
+    def clear(self):
+        """
+        Removes all the entries (that can be removed).
+        """
+        self.evict(0)
+
+    def _make_dir(self):
+        import os
+
+        if not os.path.isdir(self.path):
+            try:
+                os.makedirs(self.path)
+            except OSError:
+                if not os.path.isdir(self.path):  # i.e., not just a race
+                    raise
+
+    def _make_temp_dir(self):
+        import tempfile
+
+        self._make_dir()
+        return tempfile.mkdtemp(prefix=self.TEMP_PREFIX, dir=self.path)
+
+    def _scan(self):
+        """
+        Returns a list of (last used time, size, directory) for the entries.
+        """
+        import os
+
+        entries = []
+        if not os.path.isdir(self.path):
+            return entries
+        for nm in os.listdir(self.path):
+            entrydir = os.path.join(self.path, nm)
+            if nm.endswith(self.LOCK_SUFFIX):
+                continue
+            if nm.startswith(self.TEMP_PREFIX) or nm.startswith(self.TRASH_PREFIX):
+                # left behind by a process that died - or still in use
+                _remove_if_stale(entrydir)
+                continue
+            try:
+                entries.append((os.path.getmtime(entrydir), _dir_size(entrydir), entrydir))
+            except OSError:
+                pass  # evicted by someone else in the meantime
+        return entries
+
+    def _remove_entry(self, entrydir):
+        """
+        Removes an entry, first moving it out of the way so that nobody finds
+        a partly deleted one.  Returns True if it was removed.
+        """
+        import os
+        import shutil
+        import tempfile
+
+        trashdir = tempfile.mkdtemp(prefix=self.TRASH_PREFIX, dir=self.path)
+        try:
+            os.rename(entrydir, os.path.join(trashdir, 'entry'))
+        except OSError:
+            pass  # already gone
+        shutil.rmtree(trashdir, ignore_errors=True)
+        return True
+
+
+def _remove_if_stale(dirnm, maxage=24 * 3600):
+    import os
+    import time
+    import shutil
+
+    try:
+        if os.path.getmtime(dirnm) < time.time() - maxage:
+            shutil.rmtree(dirnm, ignore_errors=True)
+    except OSError:
+        pass
+
+
+def _dir_size(dirnm):
+    import os
+
+    return sum([os.path.getsize(os.path.join(dirnm, fn)) for fn in os.listdir(dirnm)])
+
+
+# used by _try_decompress in Sextractor and Swarp
+fitsextension_to_decompresser = {'.fz': 'funpack', '.gz': 'gunzip'}
+
+_decompresser_paths = {}  # maps executable name -> path, from which_path
+
+
+def find_decompresser(ext):
+    """
+    Returns the path to the executable that decompresses files with extension
+    `ext` (see `fitsextension_to_decompresser`), or None if it can't be found.
+    The search is only done once per executable.
+    """
+    execname = fitsextension_to_decompresser[ext]
+    if execname not in _decompresser_paths:
+        _decompresser_paths[execname] = which_path(execname)
+    return _decompresser_paths[execname]
+
+
+def can_decompress_inprocess(fn):
+    """
+    Determines if `decompress_inprocess` can handle `fn` here: gzip files
+    always, tile-compressed (``.fz``) files only if astropy is available.
+    """
+    if fn.endswith('.gz'):
+        return True
+    elif fn.endswith('.fz'):
+        try:
+            from astropy.io import fits
+        except ImportError:
+            return False
+        return hasattr(fits, 'CompImageHDU')
+    return False
+
+
+def decompress_inprocess(fn, outfn, chunksize=4 * 1024 * 1024):
+    """
+    Decompresses the ``.gz`` or ``.fz`` file `fn` to `outfn` without running
+    an external program: gzip files with `zlib` (which lets other threads run
+    while it works), and tile-compressed FITS files with astropy's
+    `~astropy.io.fits.CompImageHDU`.  The output is what ``gunzip`` or
+    ``funpack`` would write.
+    """
+    if fn.endswith('.gz'):
+        _gunzip(fn, outfn, chunksize)
+    elif fn.endswith('.fz'):
+        _funpack(fn, outfn)
+    else:
+        raise ValueError("Don't know how to decompress " + fn)
+
+
+def _gunzip(fn, outfn, chunksize):
+    import zlib
+
+    with open(fn, 'rb') as fin:
+        with open(outfn, 'wb') as fout:
+            decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)  # gzip header
+            while True:
+                chunk = fin.read(chunksize)
+                if not chunk:
+                    break
+                while chunk:
+                    fout.write(decomp.decompress(chunk))
+                    # the data after the end of a member is the next member
+                    chunk = decomp.unused_data
+                    if chunk:
+                        fout.write(decomp.flush())
+                        decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            fout.write(decomp.flush())
+
+
+def _funpack(fn, outfn):
+    from astropy.io import fits
+
+    # keep the raw (unscaled) pixels, with the BSCALE/BZERO of the original
+    with fits.open(fn, do_not_scale_image_data=True) as hdul:
+        outhdus = []
+        for i, hdu in enumerate(hdul):
+            if not isinstance(hdu, fits.CompImageHDU):
+                outhdus.append(hdu)
+            elif i == 1 and hdul[0].data is None and _is_compressed_primary(hdu):
+                # like funpack, put the image back in the primary HDU in place
+                # of the empty one fpack leaves
+                outhdus[0] = fits.PrimaryHDU(hdu.data, hdu.header)
+            else:
+                outhdus.append(fits.ImageHDU(hdu.data, hdu.header))
+        fits.HDUList(outhdus).writeto(outfn)
+
+
+def _is_compressed_primary(hdu):
+    """
+    Determines if the `~astropy.io.fits.CompImageHDU` `hdu` holds what was the
+    primary array of the original file (i.e. it has ``ZSIMPLE``).
+    """
+    if 'SIMPLE' in hdu.header:
+        return True  # newer astropy versions turn ZSIMPLE into SIMPLE
+    # older ones keep the binary table header (with the Z* keywords) in _header
+    bintable = getattr(hdu, '_bintable', None)
+    header = hdu._header if bintable is None else bintable.header
+    return 'ZSIMPLE' in header
+
+
+def estimate_decompressed_size(fn):
+    """
+    Estimates the size in bytes of compressed file `fn` once decompressed.
+
+    For gzip files this is the size recorded at the end of the file.  For
+    tile-compressed (``.fz``) FITS files it is computed from the ``Z*``
+    header keywords.  Otherwise (or if the file can't be understood) it is a
+    guess of a few times the compressed size.
+    """
+    import os
+    import struct
+
+    size = os.path.getsize(fn)
+    guess = 4 * size
+
+    try:
+        if fn.endswith('.gz'):
+            with open(fn, 'rb') as f:
+                f.seek(-4, os.SEEK_END)
+                # size mod 2**32, so only trust it if it isn't too small
+                isize = struct.unpack('<I', f.read(4))[0]
+            return isize if isize >= size else guess
+        elif fn.endswith('.fz'):
+            return _fits_decompressed_size(fn, size)
+    except (IOError, OSError, ValueError, struct.error):
+        pass
+    return guess
+
+
+def _fits_decompressed_size(fn, size):
+    """
+    Walks the headers of the tile-compressed FITS file `fn`, adding up the
+    size each HDU will have once decompressed.
+    """
+    blksz = 2880
+    total = 0
+    offset = 0
+    with open(fn, 'rb') as f:
+        while offset < size:
+            f.seek(offset)
+            cards = {}
+            nhdrblks = 0
+            done = False
+            while not done:
+                blk = f.read(blksz)
+                if len(blk) < blksz:
+                    raise ValueError('truncated FITS header in ' + fn)
+                nhdrblks += 1
+                for i in range(0, blksz, 80):
+                    card = blk[i:i + 80].decode('ascii', 'replace')
+                    key = card[:8].strip()
+                    if key == 'END':
+                        done = True
+                        break
+                    elif card[8:10] == '= ':
+                        cards[key] = card[10:].split('/')[0].strip()
+
+            datasz = _fits_data_size(cards, '')
+            hdrsz = nhdrblks * blksz
+            if cards.get('ZIMAGE', 'F') == 'T':
+                # uncompressed header is about the same size
+                total += hdrsz + _padded(_fits_data_size(cards, 'Z'), blksz)
+            else:
+                total += hdrsz + _padded(datasz, blksz)
+            offset += hdrsz + _padded(datasz, blksz)
+    return total
+
+
+def _fits_data_size(cards, prefix):
+    naxis = int(cards.get(prefix + 'NAXIS', 0))
+    if naxis == 0:
+        return 0
+    npix = 1
+    for i in range(1, naxis + 1):
+        npix *= int(cards[prefix + 'NAXIS' + str(i)])
+    if prefix:
+        return abs(int(cards['ZBITPIX'])) // 8 * npix
+    bytepix = abs(int(cards['BITPIX'])) // 8
+    return bytepix * int(cards.get('GCOUNT', 1)) * (int(cards.get('PCOUNT', 0)) + npix)
+
+
+def _padded(nbytes, blksz):
+    return -(-nbytes // blksz) * blksz